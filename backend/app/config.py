@@ -7,7 +7,7 @@ class Settings(BaseSettings):
     MONGO_DB: str = "vehicular_tfm"
     API_TITLE: str = "TFM Inspector API"
     API_ORIGINS: str = "http://localhost:5173"
-    RATE_LIMIT: str = "30/minute"
+    RATE_LIMIT: str = "90/minute"  # token bucket: capacidad / periodo de relleno
     LOG_LEVEL: str = "INFO"
 
     # --- Modelos daños / partes ---
@@ -30,12 +30,26 @@ class Settings(BaseSettings):
     # --- Flags PDF / debug ---
     ENABLE_DEBUG_IMAGES: bool = False
     ENABLE_PDF_EXPORT: bool = True
+    PDF_CACHE_BACKEND: str = "disk"  # disk | gridfs | none
+    PDF_CACHE_DIR: str = "cache/pdf"
+    PDF_CACHE_BUCKET: str = "pdf_cache"
+    PDF_CACHE_MAX_MB: int = 512
+    PDF_THUMB_DPI: int = 150  # miniaturas al tamaño impreso
+    PDF_THUMB_QUALITY: int = 80
 
     # --- Preprocesamiento ---
     ENABLE_IMAGE_ENHANCEMENT: bool = True
     ENABLE_DUAL_PASS_DAMAGE: bool = True
+    ENHANCEMENT_BILATERAL_D: int = 7
+    ENHANCEMENT_BILATERAL_SIGMA: int = 50
+    ENHANCEMENT_UNSHARP_RADIUS: int = 2
+    ENHANCEMENT_UNSHARP_AMOUNT: float = 1.5
+    ENHANCEMENT_CLAHE_CLIP: float = 2.0
 
     ENABLE_CLASSICAL_SCRATCH: bool = False
+    CLASSICAL_SCRATCH_MIN_LEN: int = 25
+    CLASSICAL_SCRATCH_MAX_WIDTH: int = 6
+    CLASSICAL_SCRATCH_MAX: int = 40
     MERGE_IOU_THRESHOLD: float = 0.55
 
     # --- Segmentación carrocería ---
@@ -86,6 +100,13 @@ class Settings(BaseSettings):
     COLOR_FRAUD_RATIO: float = 0.65
     COLOR_REGISTERED_FIELD: str = "color"
     COLOR_FRAUD_POLICY: str = "FLAG"
+    COLOR_MISMATCH_POLICY: str = "REVIEW"
+
+    # --- Geolocalización ---
+    ENABLE_EXIF_GPS: bool = True
+    GEO_WARN_DISTANCE: float = 300
+    GEO_HARD_DISTANCE: float = 1000
+    GEO_ABORT_AFTER_WARN: int = 2
 
     # --- Part completeness ---
     ENABLE_PART_COMPLETENESS_SCORE: bool = True
@@ -100,6 +121,129 @@ class Settings(BaseSettings):
     TAMPER_EXIF_SOFTWARE_SUSPECT: str = "photoshop,gimp,lightroom"
     TAMPER_EXIF_MISSING_KEYS: str = "Make,Model,DateTimeOriginal"
 
+    # --- Observabilidad / tracing ---
+    ENABLE_TRACING: bool = False
+    TRACING_EXPORTER: str = "otlp"  # otlp | file
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4317"
+    TRACING_FILE_PATH: str = "traces.jsonl"
+    TRACING_SERVICE_NAME: str = "inspection-api"
+
+    # --- Finalize asíncrono (cola de jobs) ---
+    FINALIZE_WORKERS: int = 2
+    FINALIZE_QUEUE_MAX: int = 200
+    REPORT_PRERENDER: bool = True  # finalize encola markdown + PDF
+    REPORT_WORKERS: int = 2  # renders concurrentes (CPU-bound, threadpool)
+    REPORT_QUEUE_MAX: int = 500
+    REPORT_EXPORT_MAX: int = 5000  # inspecciones por ZIP
+    REPORT_EXPORT_MAX_WORKERS: int = 4  # procesos de render por export
+    JOB_LEASE_S: float = 30.0  # sin renovar (proceso caído) otro worker retoma el job
+    JOB_POLL_S: float = 2.0  # sondeo de jobs encolados por otros procesos
+    JOB_MAX_ATTEMPTS: int = 3
+
+    # --- Pool de conexiones Mongo (pymongo y Motor) ---
+    MONGO_ASYNC_DRIVER: str = "auto"  # auto | motor | thread
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 5
+    MONGO_MAX_IDLE_TIME_MS: int = 60000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 5000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    MONGO_CONNECT_TIMEOUT_MS: int = 5000
+
+    # --- Escrituras de sesión ---
+    SESSION_WRITE_BEHIND_MS: int = 0  # >0: batching entre requests (ver WriteBehind: durabilidad)
+    SESSION_WRITE_BEHIND_MAX_OPS: int = 500
+
+    # --- Caché de datos de referencia (conductores / vehículos) ---
+    DRIVER_POOL_SIZE: int = 2000
+    DRIVER_POOL_REFRESH_S: int = 300
+    VEHICLE_CACHE_TTL_S: int = 120
+    VEHICLE_CACHE_MAX: int = 10000
+    REFERENCE_CHANGE_STREAMS: bool = False  # requiere replica set
+
+    # --- Motor de reglas ---
+    RULES_WATCH_INTERVAL_S: float = 2.0  # 0 = sin watcher (solo /admin/reload-rules)
+    BACKTEST_MAX_WORKERS: int = 8
+
+    # --- Seeding masivo ---
+    SEED_MAX_WORKERS: int = 8
+    SEED_MAX_PER_REQUEST: int = 50_000  # /admin/seed; volúmenes mayores con scripts/seed_all.py
+
+    # --- Índices Mongo ---
+    DB_ENSURE_INDEXES: bool = True
+    DB_VERIFY_INDEXES: bool = False  # explain() de consultas calientes al arrancar; falla si hay COLLSCAN
+    SESSION_TTL_HOURS: int = 48  # sesiones abandonadas
+    JOB_TTL_HOURS: int = 72
+
+    # --- WebSocket (fan-out entre workers) ---
+    WS_PUBSUB_BACKEND: str = "memory"  # memory (un worker) | redis | mongo (change stream, replica set)
+    WS_REDIS_URL: str = "redis://localhost:6379/0"
+    WS_CHANNEL_PREFIX: str = "ws:inspection:"
+    WS_MONGO_COLLECTION: str = "ws_events"
+    WS_EVENTS_TTL_S: int = 600
+    WS_SEND_TIMEOUT_S: float = 5.0
+    WS_SEND_QUEUE_MAX: int = 100  # por socket; llena → se descarta el más viejo
+    ANALYZE_PROGRESS_EVENTS: bool = True  # analyze:progress por etapa (la cancelación funciona igual)
+
+    # --- Rate limiting distribuido (token bucket) ---
+    RATE_LIMIT_BACKEND: str = "memory"  # memory (un worker / tests) | redis (compartido)
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/1"
+    RATE_LIMIT_PREFIX: str = "rl:"
+    RATE_LIMIT_KEYS: str = "api_key,session,plate,ip"  # primera identidad presente
+    RATE_LIMIT_IP: str = "1200/minute"  # techo por IP cuando la clave es session/plate (NAT/proxy compartido)
+    RATE_LIMIT_API_KEY_HEADER: str = "X-API-Key"
+    RATE_LIMIT_COSTS: str = "analyze=3,report=2,finalize=2,export=20,default=1"
+    RATE_LIMIT_TENANTS: str = ""  # cuotas por API key: "key1=600/minute;key2=60/minute"
+    RATE_LIMIT_TRUST_PROXY: bool = False  # usar X-Forwarded-For para la clave ip
+    RATE_LIMIT_FAIL_OPEN: bool = True  # store caído: dejar pasar (False -> 503)
+
+    # --- Admission control (analyze) ---
+    ENABLE_ADMISSION_CONTROL: bool = True
+    ADMISSION_DEADLINE_MS: int = 20000  # timeout del cliente; X-Deadline-Ms solo puede bajarlo
+    ADMISSION_PARALLELISM: int = 1  # analyze corre en el event loop: uno a la vez por worker
+    ADMISSION_MAX_INFLIGHT: int = 32
+    ADMISSION_BASE_MS: float = 150.0
+    ADMISSION_STAGE_MS_PER_MP: str = "base=330,dual_pass=300,ocr=600,tamper_cnn=60,scratch_severity=40,background=30"
+    ADMISSION_DOWNGRADE_ORDER: str = "dual_pass,tamper_cnn,ocr"
+    ADMISSION_EWMA_ALPHA: float = 0.2  # calibración costo real / estimado
+
+    # --- Perfiles de pipeline (degradación ante sobrecarga) ---
+    PIPELINE_PROFILE: str = "auto"  # auto | full | balanced | fast
+    PROFILE_WINDOW_S: int = 60  # ventana del p95 de analyze
+    PROFILE_MIN_SAMPLES: int = 10
+    PROFILE_BALANCED_P95_MS: float = 8000
+    PROFILE_FAST_P95_MS: float = 15000
+    PROFILE_BALANCED_QUEUE: int = 4  # análisis en curso (admission)
+    PROFILE_FAST_QUEUE: int = 8
+    PROFILE_COOLDOWN_S: int = 30  # mínimo antes de volver a subir de fidelidad
+
+    # --- Deduplicación de imágenes por sesión (pHash/dHash) ---
+    DEDUP_POLICY: str = "reuse"  # reuse | flag | off
+    DEDUP_PHASH_MAX_DIST: int = 6  # Hamming sobre 64 bits
+    DEDUP_DHASH_MAX_DIST: int = 10
+    DEDUP_INDEX_MAX_SESSIONS: int = 2000  # sesiones con índice en memoria (LRU)
+
+    # --- Índice global de imágenes (fraude por reutilización entre sesiones) ---
+    ENABLE_IMAGE_INDEX: bool = True
+    IMAGE_INDEX_PHASH_MAX_DIST: int = 6  # con 4 bandas de 16 bits: hasta 7 sin perder matches
+    IMAGE_INDEX_DHASH_MAX_DIST: int = 10
+    IMAGE_INDEX_SYNC_S: int = 5  # trae al índice en memoria lo insertado por otros workers
+    IMAGE_INDEX_SYNC_OVERLAP_S: int = 120  # relee esa ventana de _id (relojes de otros hosts atrasados)
+    IMAGE_INDEX_RECONCILE_S: int = 600  # recarga completa periódica (0 = nunca)
+    IMAGE_INDEX_MAX_MATCHES: int = 5
+
+    # --- Línea de tiempo de daños por placa ---
+    ENABLE_DAMAGE_TIMELINE: bool = True
+    DAMAGE_TIMELINE_MAX_ENTRIES: int = 50  # inspecciones conservadas por placa
+
+    # --- Admin (/admin/*) ---
+    ADMIN_TOKEN: str = ""  # header X-Admin-Token; vacío = endpoints de admin deshabilitados (404)
+
+    # --- Profiler (muestreo, solo admin) ---
+    ENABLE_PROFILER: bool = False
+    PROFILER_INTERVAL_MS: int = 10
+    PROFILER_MAX_SECONDS: int = 120
+    PROFILER_MAX_REQUESTS: int = 200
+
     class Config:
         env_file = ".env"
         case_sensitive = True
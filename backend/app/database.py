@@ -1,10 +1,23 @@
 from pymongo import MongoClient
 from .config import settings
 
-client = MongoClient(settings.MONGO_URI)
+def pool_options() -> dict:
+    return {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS
+    }
+
+client = MongoClient(settings.MONGO_URI, **pool_options())
 db = client[settings.MONGO_DB]
 
 vehicles_col = db["vehicles"]
 drivers_col = db["drivers"]
 inspections_col = db["inspections"]
-sessions_col = db["sessions"]  # Persistencia de sesiones
\ No newline at end of file
+sessions_col = db["sessions"]  # Persistencia de sesiones
+jobs_col = db["jobs"]  # Estado de jobs asíncronos (finalize, reportes)
+image_hashes_col = db["image_hashes"]  # Índice global pHash/dHash (fraude por reutilización)
+damage_timeline_col = db["damage_timeline"]  # Un documento por placa: daños por parte/tipo en el tiempo
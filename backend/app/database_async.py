@@ -0,0 +1,100 @@
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from pymongo.mongo_client import MongoClient as _PyMongoClient
+from .config import settings
+from .database import client, db, pool_options
+from .logging_utils import log_event
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # motor opcional
+    AsyncIOMotorClient = None
+
+class _ThreadedCursor:
+    """Cursor diferido con la interfaz de Motor (sort/limit/skip encadenables + to_list)."""
+    def __init__(self, factory):
+        self._factory = factory
+        self._chain: List[tuple] = []
+
+    def sort(self, *a, **k):
+        self._chain.append(("sort", a, k))
+        return self
+
+    def limit(self, n: int):
+        self._chain.append(("limit", (n,), {}))
+        return self
+
+    def skip(self, n: int):
+        self._chain.append(("skip", (n,), {}))
+        return self
+
+    def _materialize(self, length: Optional[int]):
+        cur = self._factory()
+        for name, a, k in self._chain:
+            cur = getattr(cur, name)(*a, **k)
+        out = []
+        for doc in cur:
+            out.append(doc)
+            if length is not None and len(out) >= length:
+                break
+        return out
+
+    async def to_list(self, length: Optional[int] = None):
+        return await run_in_threadpool(self._materialize, length)
+
+class ThreadedCollection:
+    """
+    Misma interfaz awaitable que una colección Motor, ejecutando la
+    colección pymongo síncrona en el threadpool. Se usa sin Motor instalado
+    o cuando el cliente síncrono no es pymongo real (mongomock en benchmarks).
+    """
+    def __init__(self, col):
+        self._col = col
+        self.name = col.name
+
+    def __getattr__(self, op):
+        fn = getattr(self._col, op)
+        async def call(*a, **k):
+            return await run_in_threadpool(fn, *a, **k)
+        return call
+
+    def find(self, *a, **k) -> _ThreadedCursor:
+        return _ThreadedCursor(lambda: self._col.find(*a, **k))
+
+    def aggregate(self, pipeline, **k) -> _ThreadedCursor:
+        return _ThreadedCursor(lambda: self._col.aggregate(pipeline, **k))
+
+class _ThreadedDatabase:
+    def __init__(self, sync_db):
+        self._db = sync_db
+
+    def __getitem__(self, name: str) -> ThreadedCollection:
+        return ThreadedCollection(self._db[name])
+
+def _use_motor() -> bool:
+    mode = settings.MONGO_ASYNC_DRIVER
+    if mode == "thread":
+        return False
+    if AsyncIOMotorClient is None:
+        if mode == "motor":
+            raise RuntimeError("MONGO_ASYNC_DRIVER=motor requiere el paquete motor")
+        return False
+    return mode == "motor" or isinstance(client, _PyMongoClient)
+
+if _use_motor():
+    async_client = AsyncIOMotorClient(settings.MONGO_URI, **pool_options())
+    async_db = async_client[settings.MONGO_DB]
+    ASYNC_DRIVER = "motor"
+else:
+    async_client = None
+    async_db = _ThreadedDatabase(db)
+    ASYNC_DRIVER = "thread"
+log_event("mongo_async_driver", driver=ASYNC_DRIVER)
+
+vehicles_acol = async_db["vehicles"]
+drivers_acol = async_db["drivers"]
+inspections_acol = async_db["inspections"]
+sessions_acol = async_db["sessions"]
+jobs_acol = async_db["jobs"]
+image_hashes_acol = async_db["image_hashes"]
+damage_timeline_acol = async_db["damage_timeline"]
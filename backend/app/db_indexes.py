@@ -0,0 +1,148 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+from .config import settings
+from .database import db, vehicles_col, drivers_col, inspections_col, sessions_col, jobs_col, image_hashes_col, damage_timeline_col
+from .logging_utils import log_event
+
+# Etapas de plan que indican uso de índice (incluye planes SBE y fast-paths por _id/igualdad)
+_INDEX_STAGES = {"IXSCAN", "EXPRESS_IXSCAN", "IDHACK", "COUNT_SCAN", "DISTINCT_SCAN"}
+
+class IndexCheckError(RuntimeError):
+    """Alguna consulta caliente dejó de usar índice (COLLSCAN o SORT en memoria)."""
+    def __init__(self, failures: List[Dict[str, Any]]):
+        self.failures = failures
+        names = ", ".join(f"{f['query']} ({f['reason']})" for f in failures)
+        super().__init__(f"Consultas sin índice: {names}")
+
+def index_specs() -> List[Tuple[Collection, List[IndexModel]]]:
+    """Índices por colección; los nombres son estables para poder verificarlos."""
+    specs = [
+        (vehicles_col, [
+            IndexModel([("plate", ASCENDING)], name="plate_unique", unique=True),
+        ]),
+        (drivers_col, [
+            # document/driver_id son opcionales en datos simulados -> sparse
+            IndexModel([("document", ASCENDING)], name="document_unique", unique=True, sparse=True),
+            IndexModel([("driver_id", ASCENDING)], name="driver_id_unique", unique=True, sparse=True),
+        ]),
+        (sessions_col, [
+            IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+            # Sesiones abandonadas (nunca finalizadas) se eliminan solas
+            IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                       expireAfterSeconds=settings.SESSION_TTL_HOURS * 3600),
+        ]),
+        (inspections_col, [
+            IndexModel([("inspection_id", ASCENDING)], name="inspection_id_unique", unique=True),
+            # Historial por placa y listados por estado, más recientes primero
+            IndexModel([("plate", ASCENDING), ("created_at", DESCENDING)], name="plate_created_at"),
+            IndexModel([("status", ASCENDING), ("created_at", DESCENDING)], name="status_created_at"),
+        ]),
+        (jobs_col, [
+            IndexModel([("job_id", ASCENDING)], name="job_id_unique", unique=True),
+            IndexModel([("kind", ASCENDING), ("session_id", ASCENDING), ("status", ASCENDING)],
+                       name="kind_session_status"),
+            # Un solo job activo (queued/running) por sesión y tipo: dedup atómico del enqueue
+            IndexModel([("active_key", ASCENDING)], name="active_key_unique", unique=True, sparse=True),
+            IndexModel([("kind", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)],
+                       name="kind_status_created"),
+            IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                       expireAfterSeconds=settings.JOB_TTL_HOURS * 3600),
+        ]),
+        (image_hashes_col, [
+            IndexModel([("analysis_id", ASCENDING)], name="analysis_id_unique", unique=True),
+            # Multi-index hashing: una clave por banda de 16 bits del pHash
+            IndexModel([("bands", ASCENDING)], name="bands"),
+        ]),
+        (damage_timeline_col, [
+            IndexModel([("plate", ASCENDING)], name="plate_unique", unique=True),
+        ]),
+    ]
+    if settings.WS_PUBSUB_BACKEND == "mongo":
+        # Eventos WS ya entregados por change stream: solo se conservan unos minutos
+        specs.append((db[settings.WS_MONGO_COLLECTION], [
+            IndexModel([("created_at", ASCENDING)], name="created_at_ttl",
+                       expireAfterSeconds=settings.WS_EVENTS_TTL_S),
+        ]))
+    return specs
+
+def ensure_indexes() -> Dict[str, List[str]]:
+    """
+    Crea los índices (idempotente). Un índice que no se puede crear
+    (duplicados previos, opciones distintas) se registra y no detiene el
+    arranque; verify_index_usage() lo detectará después.
+    """
+    created: Dict[str, List[str]] = {}
+    for col, models in index_specs():
+        for model in models:
+            name = model.document["name"]
+            try:
+                col.create_indexes([model])
+                created.setdefault(col.name, []).append(name)
+            except OperationFailure as e:
+                log_event("index_create_failed", collection=col.name, index=name, error=str(e))
+    log_event("indexes_ready", collections=created)
+    return created
+
+def hot_queries() -> List[Dict[str, Any]]:
+    """Consultas del camino de request que deben resolverse por índice."""
+    return [
+        {"name": "vehicles.by_plate", "col": vehicles_col, "filter": {"plate": "ABC123"}},
+        {"name": "drivers.by_document", "col": drivers_col, "filter": {"document": "0"}},
+        {"name": "drivers.by_driver_id", "col": drivers_col, "filter": {"driver_id": "0"}},
+        {"name": "sessions.by_session_id", "col": sessions_col, "filter": {"session_id": "s"}},
+        {"name": "inspections.by_inspection_id", "col": inspections_col, "filter": {"inspection_id": "s"}},
+        {"name": "inspections.history_by_plate", "col": inspections_col,
+         "filter": {"plate": "ABC123"}, "sort": [("created_at", DESCENDING)]},
+        {"name": "jobs.by_job_id", "col": jobs_col, "filter": {"job_id": "j"}},
+        {"name": "damage_timeline.by_plate", "col": damage_timeline_col, "filter": {"plate": "ABC123"}},
+        {"name": "image_hashes.by_band", "col": image_hashes_col, "filter": {"bands": {"$in": [0, 65536]}}},
+        {"name": "jobs.active_for_session", "col": jobs_col,
+         "filter": {"kind": "finalize", "session_id": "s", "status": {"$in": ["queued", "running"]}}},
+        {"name": "jobs.claim", "col": jobs_col, "filter": {"kind": "finalize", "status": "queued"},
+         "sort": [("created_at", 1)]},
+    ]
+
+def _plan_stages(plan: Any, out: Optional[Set[str]] = None) -> Set[str]:
+    out = set() if out is None else out
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            out.add(plan["stage"])
+        for k in ("inputStage", "queryPlan", "innerStage", "outerStage"):
+            if k in plan:
+                _plan_stages(plan[k], out)
+        for child in plan.get("inputStages", []):
+            _plan_stages(child, out)
+    return out
+
+def explain_query(q: Dict[str, Any]) -> Dict[str, Any]:
+    cur = q["col"].find(q["filter"])
+    if q.get("sort"):
+        cur = cur.sort(q["sort"])
+    plan = cur.explain()["queryPlanner"]["winningPlan"]
+    stages = _plan_stages(plan)
+    reason = None
+    if "COLLSCAN" in stages or not stages & _INDEX_STAGES:
+        reason = "COLLSCAN"
+    elif q.get("sort") and "SORT" in stages:
+        reason = "SORT_IN_MEMORY"
+    return {"query": q["name"], "stages": sorted(stages), "ok": reason is None, "reason": reason}
+
+def verify_index_usage(raise_on_failure: bool = True) -> List[Dict[str, Any]]:
+    """
+    Ejecuta explain() sobre cada consulta caliente y falla (IndexCheckError)
+    si alguna hace COLLSCAN u ordena en memoria. Requiere un Mongo real:
+    con backends sin explain (mongomock) se reporta 'unsupported'.
+    """
+    results = []
+    for q in hot_queries():
+        try:
+            results.append(explain_query(q))
+        except (NotImplementedError, AttributeError, OperationFailure) as e:
+            results.append({"query": q["name"], "stages": [], "ok": None, "reason": f"unsupported: {e}"})
+    failures = [r for r in results if r["ok"] is False]
+    log_event("index_check", checked=len(results), failures=[f["query"] for f in failures])
+    if failures and raise_on_failure:
+        raise IndexCheckError(failures)
+    return results
@@ -1,17 +1,137 @@
-from fastapi import APIRouter
+import hmac
+from datetime import datetime
+from typing import Any, Dict
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from .config import settings
+from .profiler import profiler
+from .schemas import RuleBacktestRequest
 from .services.rules_engine import reload_rules
-from .services.vehicle_service import seed_vehicles
-from .services.driver_service import seed_drivers
+from .services.rule_backtest import run_backtest, build_match
+from .services.seeding import seed_stream
+from .services.reference_cache import driver_pool
+from .services import image_index
+from .services.job_queue import QueueFullError
 
-router = APIRouter(prefix="/admin", tags=["admin"])
+def _admin_guard(x_admin_token: str | None = Header(None)):
+    # Sin ADMIN_TOKEN configurado el router no existe para el cliente
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(_admin_guard)])
+
+def _profiler_guard():
+    if not settings.ENABLE_PROFILER:
+        raise HTTPException(status_code=404, detail="Profiler deshabilitado")
 
 @router.post("/reload-rules")
 def admin_reload_rules():
     reload_rules()
     return {"status": "ok"}
 
+@router.post("/rules/backtest")
+def admin_rules_backtest(req: RuleBacktestRequest):
+    """
+    Re-evalúa inspecciones históricas con el conjunto vigente (o baseline_yaml)
+    y con rules_yaml; devuelve deltas por regla y cambios de fraude/revisión.
+    """
+    if req.workers < 1 or req.batch_size < 1:
+        raise HTTPException(status_code=400, detail="Parámetros inválidos")
+    try:
+        return run_backtest(
+            req.rules_yaml,
+            old_yaml=req.baseline_yaml,
+            workers=min(req.workers, settings.BACKTEST_MAX_WORKERS),
+            batch_size=req.batch_size,
+            limit=req.limit,
+            match=build_match(req.plates, req.since, req.until, req.status)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/seed")
-def admin_seed(vehicles: int = 50, drivers: int = 50):
-    seed_vehicles(vehicles)
-    seed_drivers(drivers)
-    return {"status": "ok", "vehicles": vehicles, "drivers": drivers}
\ No newline at end of file
+def admin_seed(vehicles: int = 50, drivers: int = 50, workers: int = 1,
+               chunk_size: int = 5000, seed: int | None = None):
+    if min(vehicles, drivers) < 0 or workers < 1 or chunk_size < 1:
+        raise HTTPException(status_code=400, detail="Parámetros inválidos")
+    if max(vehicles, drivers) > settings.SEED_MAX_PER_REQUEST:
+        raise HTTPException(status_code=400,
+                            detail=f"Máximo {settings.SEED_MAX_PER_REQUEST} por colección; usar scripts/seed_all.py")
+    workers = min(workers, settings.SEED_MAX_WORKERS)
+    out = {"status": "ok"}
+    # Offset por colección: misma seed no repite la secuencia entre vehículos y conductores
+    for kind, count, offset in (("vehicles", vehicles, 0), ("drivers", drivers, 10_000)):
+        if count:
+            out[kind] = seed_stream(kind, count, chunk_size, workers, None if seed is None else seed + offset)
+    driver_pool.refresh()
+    return out
+
+def _rebuild_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **{k: job.get(k) for k in ("job_id", "status", "step", "progress", "result", "error")},
+        "poll_url": f"/admin/image-index/rebuild/{job['job_id']}"
+    }
+
+@router.post("/image-index/rebuild", status_code=202)
+async def admin_image_index_rebuild(batch_size: int = 500, since: datetime | None = None):
+    """
+    Encola la reconstrucción de image_hashes (idempotente) desde inspecciones
+    y sesiones abiertas. Si ya hay una en curso devuelve ese job.
+    """
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="Parámetros inválidos")
+    queue = image_index.rebuild_queue
+    job = await queue.find_active(image_index.REBUILD_JOB_KEY)
+    if job is None:
+        try:
+            job = await queue.enqueue(image_index.REBUILD_JOB_KEY, {
+                "batch_size": batch_size, "since": since.isoformat() if since else None
+            })
+        except QueueFullError:
+            raise HTTPException(status_code=503, detail="Reconstrucción ya encolada, reintente")
+    return _rebuild_view(job)
+
+@router.get("/image-index/rebuild/{job_id}")
+async def admin_image_index_rebuild_status(job_id: str):
+    job = await image_index.rebuild_queue.get(job_id)
+    if not job or job["kind"] != image_index.rebuild_queue.kind:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return _rebuild_view(job)
+
+@router.post("/profile", dependencies=[Depends(_profiler_guard)])
+def admin_profile_start(seconds: float = 30, requests: int | None = None,
+                        interval_ms: int | None = None, idle: bool = False):
+    """
+    Inicia una captura: ventana de `seconds` o hasta completar `requests`
+    (acotado por PROFILER_MAX_SECONDS en ambos casos).
+    """
+    if requests is not None and not 0 < requests <= settings.PROFILER_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail="requests fuera de rango")
+    secs = settings.PROFILER_MAX_SECONDS if requests is not None else min(max(seconds, 0.1), settings.PROFILER_MAX_SECONDS)
+    interval = max(1, interval_ms or settings.PROFILER_INTERVAL_MS)
+    try:
+        profiler.start(secs, requests, interval, include_idle=idle)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="Ya hay una captura en curso")
+    return {"status": "started", **profiler.status()}
+
+@router.post("/profile/stop", dependencies=[Depends(_profiler_guard)])
+def admin_profile_stop():
+    profiler.stop()
+    return {"status": "stopping"}
+
+@router.get("/profile/status", dependencies=[Depends(_profiler_guard)])
+def admin_profile_status():
+    return profiler.status()
+
+@router.get("/profile", dependencies=[Depends(_profiler_guard)])
+def admin_profile_result():
+    """Pilas en formato collapsed (flamegraph.pl / speedscope) de la última captura."""
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Captura en curso")
+    text = profiler.collapsed()
+    if text is None:
+        raise HTTPException(status_code=404, detail="Sin capturas")
+    return PlainTextResponse(text, headers={"Content-Disposition": 'attachment; filename="profile.folded"'})
@@ -1,50 +1,60 @@
-import imghdr
+import imghdr, time
+from datetime import datetime
+import json
 import magic
 from typing import Optional, List, Dict, Any
 from fastapi import (
     FastAPI, UploadFile, File, Form, HTTPException,
-    WebSocket, WebSocketDisconnect
+    WebSocket, WebSocketDisconnect, Request, Depends
 )
+from anyio import from_thread
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from prometheus_client import Counter, Histogram
-from anyio import from_thread
 
 from .config import settings
 from .logging_utils import setup_logging, log_event
+from .telemetry import setup_tracing, shutdown_tracing, start_breakdown, stage, span
 from .schemas import (
     AnalyzeResponse, FinalizeResponse, ReportResponse,
-    IdentityVerifyRequest, IdentityVerifyResponse, VehicleHistoryResponse
+    IdentityVerifyRequest, IdentityVerifyResponse, VehicleHistoryResponse, ReportExportRequest
 )
 from .services.label_provider import get_label_sets
 from .services.pipeline import run_full_pipeline
-from .services.color_exif import majority_color_fraud
-from .services.pdf_export import build_full_pdf
-from .services.markdown_builder import build_markdown_report
-from .services.verdict import compute_verdict as _compute_verdict
-from .services.geo import evaluate_geolocation
-from .services.vehicle_service import get_or_create_vehicle, get_vehicle
-from .services.driver_service import get_random_driver
+from .services.analysis_progress import AnalysisCancelled, track_analysis, request_cancel
+from .services.admission import controller as admission
+from .services.pipeline_profiles import selector as profiles, PROFILE_USED
+from .services.dedup import index as dedup_index
+from .services.image_index import index as image_index, rebuild_queue as image_rebuild_queue
+from .services.rules_engine import evaluate_rules
+from .services.pdf_cache import get_or_render, lookup as lookup_pdf, parse_range
+from .services.report_service import prerender_report, render_report_pdf
+from .services.report_export import export_reports_zip
+from .services.rule_backtest import build_match
+from .services.vehicle_service import get_vehicle_async
+from .services.damage_timeline import get_timeline
+from .services.driver_service import find_driver_by_document_async
+from .services.finalize_service import finalize_session
+from .services.job_queue import JobQueue, QueueFullError
+from .services.reference_cache import refresher as reference_refresher
 from .yolo_model import _ensure as warmup_models
-from .repositories.session_repository import SessionRepository
-from .database import (
-    vehicles_col, inspections_col, sessions_col,
-    drivers_col
-)
+from .repositories.session_repository import AsyncSessionRepository
+from .database_async import vehicles_acol, inspections_acol
+from .db_indexes import ensure_indexes, verify_index_usage
 from .websocket_manager import manager
+from .endpoints_admin import router as admin_router
+from .profiler import profiler
+from .rate_limit import limiter, rate_limit
 
 setup_logging(settings.LOG_LEVEL)
 
-limiter = Limiter(key_func=get_remote_address)
 app = FastAPI(title=settings.API_TITLE)
 
 REQUESTS = Counter("api_requests_total", "Total API requests", ["endpoint", "method", "status"])
 ANALYZE_LAT = Histogram("inspection_analyze_seconds", "Analyze endpoint latency")
-FINALIZE_LAT = Histogram("inspection_finalize_seconds", "Finalize endpoint latency")
 
-session_repo = SessionRepository()
+session_repo = AsyncSessionRepository()
 
 app.add_middleware(
     CORSMiddleware,
@@ -53,6 +63,15 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type"]
 )
+app.include_router(admin_router)
+
+if settings.ENABLE_PROFILER:
+    @app.middleware("http")
+    async def _profiler_requests(request: Request, call_next):
+        response = await call_next(request)
+        if profiler.counting_requests and not request.url.path.startswith("/admin/"):
+            profiler.request_done()
+        return response
 
 # ---------------- Helpers ----------------
 def _metrics(ep: str, method: str, status: int):
@@ -74,9 +93,32 @@ def _validate_upload(file: UploadFile) -> bytes:
 # --------------- Startup -----------------
 @app.on_event("startup")
 async def startup():
+    if settings.DB_ENSURE_INDEXES:
+        ensure_indexes()
+    if settings.DB_VERIFY_INDEXES:
+        verify_index_usage()
     warmup_models()
+    setup_tracing()
+    await reference_refresher.start()
+    await image_index.start()
+    await manager.start()
+    await finalize_queue.start()
+    await report_queue.start()
+    await image_rebuild_queue.start()
     log_event("startup_complete")
 
+@app.on_event("shutdown")
+async def shutdown():
+    await finalize_queue.stop()
+    await report_queue.stop()
+    await image_rebuild_queue.stop()
+    await manager.stop()
+    await reference_refresher.stop()
+    await image_index.stop()
+    await limiter.close()
+    await session_repo.flush_pending()
+    shutdown_tracing()
+
 # --------------- Health ------------------
 @app.get("/health")
 def health():
@@ -106,13 +148,16 @@ def health():
             "tamper": settings.ENABLE_TAMPER_DETECTION,
             "part_completeness": settings.ENABLE_PART_COMPLETENESS_SCORE
         },
-        "pdf_enabled": settings.ENABLE_PDF_EXPORT
+        "pdf_enabled": settings.ENABLE_PDF_EXPORT,
+        "admission": admission.snapshot() if settings.ENABLE_ADMISSION_CONTROL else None,
+        "pipeline_profile": profiles.snapshot(),
+        "image_index": {"entries": len(image_index), "loaded": image_index.loaded} if settings.ENABLE_IMAGE_INDEX else None
     }
 
 # --------------- Identity ----------------
 @app.post("/identity/verify", response_model=IdentityVerifyResponse)
-def identity_verify(payload: IdentityVerifyRequest):
-    doc = drivers_col.find_one({"document": payload.document})
+async def identity_verify(payload: IdentityVerifyRequest):
+    doc = await find_driver_by_document_async(payload.document)
     if not doc:
         return IdentityVerifyResponse(valid=False, matched_driver=None)
     name_ok = payload.name.strip().lower() in (
@@ -123,31 +168,36 @@ def identity_verify(payload: IdentityVerifyRequest):
 
 # --------------- Vehicle history ---------
 @app.get("/vehicle/history", response_model=VehicleHistoryResponse)
-def vehicle_history(plate: str):
-    v = vehicles_col.find_one({"plate": plate})
+async def vehicle_history(plate: str, timeline_limit: int = 10):
+    plate = plate.strip().upper()  # vehículos y timeline se guardan en mayúsculas
+    v = await vehicles_acol.find_one({"plate": plate}, {"_id": 0})
     if not v:
         raise HTTPException(status_code=404, detail="Vehículo no encontrado")
     hist = v.get("history", {})
+    timeline = None
+    if settings.ENABLE_DAMAGE_TIMELINE:
+        timeline = await get_timeline(plate, max(1, min(timeline_limit, settings.DAMAGE_TIMELINE_MAX_ENTRIES)))
     return VehicleHistoryResponse(
         plate=plate,
         infractions=hist.get("infractions", 0),
         previous_owners=hist.get("previous_owners", 1),
         tech_ok=hist.get("tech_ok", True),
-        notes=hist.get("notes", [])
+        notes=hist.get("notes", []),
+        damage_timeline=timeline
     )
 
 # --------------- Vehicle verify ----------
 @app.get("/inspection/verify")
-def inspection_verify(plate: str):
-    v = get_vehicle(plate)
+async def inspection_verify(plate: str):
+    v = await get_vehicle_async(plate)
     if not v:
         return {"found": False, "msg": "Vehículo no encontrado"}
     return {"found": True, "data": v}
 
 # --------------- Analyze ------------------
-@app.post("/inspection/analyze", response_model=AnalyzeResponse)
-@limiter.limit(settings.RATE_LIMIT)
+@app.post("/inspection/analyze", response_model=AnalyzeResponse, dependencies=[Depends(rate_limit("analyze"))])
 async def inspection_analyze(
+    request: Request,
     file: UploadFile = File(...),
     session_id: str = Form(...),
     plate: str = Form(...),
@@ -157,34 +207,89 @@ async def inspection_analyze(
     note: str = Form(None),
     browser_lat: float = Form(None),
     browser_lon: float = Form(None),
-    debug: int = Form(0)
+    debug: int = Form(0),
+    analysis_id: str = Form(None)
 ):
     log_event("analyze_in", session_id=session_id, plate=plate, photo_key=photo_key)
     raw = _validate_upload(file)
     want_debug = bool(debug)
-
-    # Calidad
-    from .quality import assess_extended
-    quality = assess_extended(raw, want_debug=want_debug)
-
-    review_flags: List[str] = []
-    if quality["quality_status"] in ("blur", "very_blur"):
-        review_flags.append("LOW_SHARPNESS")
-    if quality["scratches"]["count"] > 0:
-        review_flags.append("SCRATCH_CANDIDATES")
-
-    with ANALYZE_LAT.time():
-        pipeline = await run_full_pipeline(
-            session_id=session_id,
-            plate=plate,
-            photo_key=photo_key,
-            img_bytes=raw,
-            conf_damage=conf_damage,
-            conf_parts=conf_parts,
-            note=note,
-            browser_lat=browser_lat,
-            browser_lon=browser_lon
-        )
+    stage_timings = start_breakdown() if want_debug else None
+
+    # Perfil de fidelidad (fijo o automático por p95 / cola)
+    profile = profiles.select(admission.inflight)
+    plan = profiles.plan(profile)
+    # Admisión por costo estimado vs. cola viva: rechaza o degrada antes de esperar
+    ticket = None
+    if settings.ENABLE_ADMISSION_CONTROL:
+        deadline = request.headers.get("X-Deadline-Ms")
+        ticket = admission.decide(raw, photo_key, float(deadline) if deadline and deadline.isdigit() else None,
+                                  base_plan=plan)
+        if ticket["decision"] == "reject":
+            _metrics("/inspection/analyze", "POST", 503)
+            raise HTTPException(
+                status_code=503,
+                detail="Servidor saturado: el análisis no terminaría antes del plazo",
+                headers={"Retry-After": str(ticket["retry_after_s"])}
+            )
+
+    t0 = time.perf_counter()
+    try:
+        async with admission.admitted(ticket), track_analysis(session_id, photo_key, analysis_id) as progress:
+            with ANALYZE_LAT.time(), span("inspection.analyze", session_id=session_id, photo_key=photo_key):
+                # Calidad
+                from .quality import assess_extended
+                with stage("quality"):
+                    quality = assess_extended(raw, want_debug=want_debug)
+
+                review_flags: List[str] = []
+                if quality["quality_status"] in ("blur", "very_blur"):
+                    review_flags.append("LOW_SHARPNESS")
+                if quality["scratches"]["count"] > 0:
+                    review_flags.append("SCRATCH_CANDIDATES")
+                # Primer evento: el cliente puede cancelar ya (p.ej. very_blur)
+                await progress.emit("quality", {
+                    "quality_status": quality["quality_status"],
+                    "review_flags": review_flags,
+                    "scratch": {"count": quality["scratches"]["count"]},
+                    "lap_var": quality.get("blur_var")
+                })
+
+                # Casi duplicado de una imagen ya analizada en la sesión (pHash/dHash)
+                with stage("dedup"):
+                    duplicate = await dedup_index.find(session_id, quality.get("phash"), quality.get("dhash"))
+                    pipeline = await dedup_index.reusable(session_id, duplicate, photo_key, quality["quality_status"])
+                if duplicate:
+                    dedup_index.record(session_id, duplicate, photo_key, reused=pipeline is not None)
+                    review_flags.append("DUPLICATE_IMAGE")
+                # Misma foto en otras sesiones (índice global, en memoria)
+                with stage("image_index"):
+                    reuse_matches = await image_index.query(quality.get("phash"), quality.get("dhash"), session_id)
+                if reuse_matches:
+                    image_index.record(session_id, plate, reuse_matches)
+
+                if pipeline is None:
+                    pipeline = await run_full_pipeline(
+                        session_id=session_id,
+                        plate=plate,
+                        photo_key=photo_key,
+                        img_bytes=raw,
+                        conf_damage=conf_damage,
+                        conf_parts=conf_parts,
+                        note=note,
+                        browser_lat=browser_lat,
+                        browser_lon=browser_lon,
+                        progress=progress,
+                        plan=ticket["plan"] if ticket else plan
+                    )
+                    reused = False
+                else:
+                    reused = True
+    except AnalysisCancelled as e:
+        _metrics("/inspection/analyze", "POST", 409)
+        raise HTTPException(status_code=409, detail=f"Análisis cancelado ({e.step})")
+    if not reused:
+        profiles.observe(time.perf_counter() - t0)
+        PROFILE_USED.labels(profile).inc()
 
     # Política de fondo
     bg_policy = (pipeline.get("background") or {}).get("policy")
@@ -193,6 +298,7 @@ async def inspection_analyze(
 
     result = {
         "session_id": session_id,
+        "analysis_id": progress.analysis_id,
         "photo_key": photo_key,
         "damage": pipeline["damage"],
         "parts_presence": pipeline["parts_presence"],
@@ -209,7 +315,7 @@ async def inspection_analyze(
         "review_flags": review_flags,
         "aborted": False,
         "abort_reason": None,
-        "images_in_session": session_repo.count_images(session_id) + 1,
+        "images_in_session": await session_repo.count_images(session_id) + 1,
         "preproc_metrics": {
             "lap_var": quality.get("blur_var"),
             "edge_density": quality.get("edge_density"),
@@ -218,7 +324,18 @@ async def inspection_analyze(
         },
         "scratch": quality["scratches"],
         "quality_status": quality["quality_status"],
-        "debug_images": quality.get("debug_images") if want_debug else None
+        "debug_images": quality.get("debug_images") if want_debug else None,
+        "stage_timings": stage_timings,
+        "profile": None if reused else profile,
+        "phash": quality.get("phash"),
+        "dhash": quality.get("dhash"),
+        "duplicate_of": {
+            "analysis_id": duplicate.get("analysis_id"),
+            "photo_key": duplicate.get("photo_key"),
+            "distance": duplicate["distance"],
+            "reused": reused
+        } if duplicate else None,
+        "admission": {k: ticket[k] for k in ("decision", "skipped", "megapixels", "cost_ms", "predicted_wait_ms")} if ticket else None
     }
 
     # Tamper sospechoso
@@ -226,9 +343,40 @@ async def inspection_analyze(
     if tamper_block and tamper_block.get("suspect"):
         result["fraud_flags"].append("TAMPER_SUSPECT")
 
-    session_repo.store_image_analysis(session_id, plate, result, raw)
+    # Reglas por imagen (REUSED_IMAGE / REUSED_IMAGE_SAME_PLATE en fraud_rules.yaml); las de sesión quedan para finalize
+    other_plates = {m["plate"] for m in reuse_matches if m["plate"] != plate.upper()}
+    image_ctx = {"image": {
+        "reused_sessions": len({m["session_id"] for m in reuse_matches}),
+        "reused_plates": len(other_plates),
+        # Re-inspección o reintento de la misma placa: revisión, no fraude
+        "same_plate_sessions": len({m["session_id"] for m in reuse_matches if m["plate"] == plate.upper()}),
+        "reuse_distance": reuse_matches[0]["distance"] if reuse_matches else None
+    }}
+    rule_fraud, rule_review = evaluate_rules(image_ctx, skip_missing=True)
+    result["fraud_flags"] += rule_fraud
+    result["review_flags"] += [f for f in rule_review if f not in result["review_flags"]]
+    result["image_reuse"] = {
+        "sessions": image_ctx["image"]["reused_sessions"],
+        "other_plates": len(other_plates),
+        "min_distance": image_ctx["image"]["reuse_distance"]
+    } if reuse_matches else None
+
+    buf = session_repo.write_buffer(session_id)
+    buf.store_image_analysis(plate, result, raw)
+    if duplicate:
+        buf.add_review_flag("DUPLICATE_IMAGE")
+    for f in rule_fraud:
+        buf.add_flag(f)
+    for f in rule_review:
+        buf.add_review_flag(f)
     if note:
-        session_repo.add_note(session_id, note)
+        buf.add_note(note)
+    with stage("mongo_write"):
+        await session_repo.commit(buf)
+    if not reused:  # una re-toma analizada de nuevo también es candidata a reutilizarse
+        dedup_index.add(session_id, result)
+        with stage("image_index_write"):
+            await image_index.add(result, session_id, plate)
 
     log_event("analyze_out",
               session_id=session_id,
@@ -238,10 +386,50 @@ async def inspection_analyze(
     _metrics("/inspection/analyze", "POST", 200)
     return result
 
+@app.post("/inspection/cancel", status_code=202)
+async def inspection_cancel(
+    session_id: str = Form(...),
+    analysis_id: str = Form(None),
+    reason: str = Form("client")
+):
+    """Alternativa HTTP al mensaje {"action": "cancel"} del WebSocket."""
+    await request_cancel(session_id, analysis_id, reason)
+    return {"session_id": session_id, "analysis_id": analysis_id, "status": "cancel_requested"}
+
 # --------------- Finalize -----------------
-@app.post("/inspection/finalize", response_model=FinalizeResponse)
-@limiter.limit(settings.RATE_LIMIT)
-def inspection_finalize(
+def _finalize_job(job: Dict[str, Any], progress) -> Dict[str, Any]:
+    p = job["params"]
+    doc = finalize_session(job["session_id"], p["plate"], clear=p.get("clear", True), progress=progress)
+    log_event("finalize_out", session_id=job["session_id"], status=doc["status"])
+    # Pre-render en segundo plano; si la cola está llena la descarga renderiza on-demand
+    if settings.REPORT_PRERENDER:
+        try:
+            from_thread.run(report_queue.enqueue, job["session_id"], {"inspection_id": doc["inspection_id"]})
+        except QueueFullError:
+            log_event("report_prerender_skipped", session_id=job["session_id"], reason="queue_full")
+    return {"inspection_id": doc["inspection_id"], "status": doc["status"], "aborted": doc["aborted"]}
+
+def _report_job(job: Dict[str, Any], progress) -> Dict[str, Any]:
+    return prerender_report(job["params"]["inspection_id"], progress)
+
+finalize_queue = JobQueue("finalize", _finalize_job, settings.FINALIZE_WORKERS, settings.FINALIZE_QUEUE_MAX)
+report_queue = JobQueue("report", _report_job, settings.REPORT_WORKERS, settings.REPORT_QUEUE_MAX)
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "session_id": job["session_id"],
+        "status": job["status"],
+        "step": job.get("step"),
+        "progress": job.get("progress", 0.0),
+        "error": job.get("error"),
+        "poll_url": f"/inspection/jobs/{job['job_id']}"
+    }
+
+@app.post("/inspection/finalize", status_code=202, dependencies=[Depends(rate_limit("finalize"))])
+async def inspection_finalize(
+    request: Request,
     session_id: str = Form(...),
     plate: str = Form(...),
     conf_damage: float = Form(None),
@@ -249,170 +437,86 @@ def inspection_finalize(
     clear: bool = Form(True)
 ):
     log_event("finalize_in", session_id=session_id, plate=plate)
-    with FINALIZE_LAT.time():
-        images = session_repo.list_images(session_id)
-        if not images:
-            raise HTTPException(status_code=400, detail="Sesión vacía")
-
-        aborted, abort_reason = session_repo.is_aborted(session_id)
-        vehicle = get_or_create_vehicle(plate)
-        driver = get_random_driver()
-
-        all_damage: List[Dict[str,Any]] = []
-        all_colors: List[Dict[str,Any]] = []
-        parts_union: Dict[str, Dict[str,Any]] = {}
-        exif_points = []
-        illum_list = []
-        bg_list = []
-        ocr_plate_matches = []
-        ocr_vin_candidates = []
-        tamper_suspects = 0
-
-        for im in images:
-            an = im.get("analysis", {})
-            all_damage.extend(an.get("damage", []))
-
-            for p, info in (an.get("parts_presence") or {}).items():
-                cur = parts_union.get(p, {"present": False, "confidence": 0.0, "box": None})
-                if info["confidence"] > cur["confidence"]:
-                    parts_union[p] = info
-
-            if an.get("color_detected"):
-                all_colors.append(an["color_detected"])
-            if an.get("exif_geo"):
-                exif_points.append(an["exif_geo"])
-            if an.get("illumination"):
-                illum_list.append(an["illumination"])
-            if an.get("background"):
-                bg_list.append(an["background"])
-
-            ocr_block = (an.get("ocr") or {})
-            ocr_plate_matches.extend(ocr_block.get("plate_candidates") or [])
-            ocr_vin_candidates.extend(ocr_block.get("vin_candidates") or [])
-
-            tamper_block = an.get("tamper")
-            if tamper_block and tamper_block.get("suspect"):
-                tamper_suspects += 1
-
-        missing = [p for p, i in parts_union.items() if not i["present"]]
-
-        registered_color = (vehicle.get("color") or "").lower()
-        color_eval = majority_color_fraud(registered_color, all_colors) if registered_color else {
-            "fraud": False, "reason": "no_registered", "mismatch_ratio": 0.0
-        }
-
-        geo_block = evaluate_geolocation(exif_points)
-        fraud_flags = list(set(session_repo.list_flags(session_id) + geo_block.get("flags", [])))
-        review_flags = session_repo.list_review_flags(session_id)
-
-        if color_eval.get("fraud"):
-            fraud_flags.append("COLOR_FRAUD")
-            if settings.COLOR_FRAUD_POLICY == "ABORT":
-                aborted = True
-                abort_reason = "COLOR_FRAUD"
-            elif settings.COLOR_FRAUD_POLICY == "REVIEW":
-                review_flags.append("COLOR_REVIEW")
-
-        vin_detected = ocr_vin_candidates[0]["text"] if ocr_vin_candidates else None
-        if ocr_plate_matches:
-            best_plate = ocr_plate_matches[0].get("text")
-            if best_plate and best_plate != plate:
-                fraud_flags.append("PLATE_OCR_MISMATCH")
-
-        if tamper_suspects > 0:
-            fraud_flags.append("TAMPER_SUSPECT")
-
-        status = "COMPLETED"
-        verdict_block = None
-        if aborted:
-            status = f"ABORTED_{abort_reason}"
-            fraud_flags.append(abort_reason)
-        elif geo_block["status"] == "FAIL":
-            status = "FAILED_GEO_MISMATCH"
-            fraud_flags.append("INSPECTION_ABORTED_GEO")
-        else:
-            verdict_block = _compute_verdict(len(all_damage), len(missing), not color_eval.get("fraud"))
-
-        notes = session_repo.list_notes(session_id)
-        identity_payload = session_repo.get_identity(session_id)
-        vehicle_history = session_repo.get_vehicle_history(session_id)
-        identity_validated = bool(identity_payload and identity_payload.get("valid"))
-
-        completeness_score = None
-        if settings.ENABLE_PART_COMPLETENESS_SCORE and parts_union:
-            present = sum(1 for v in parts_union.values() if v["present"])
-            completeness_score = round(present / max(1, len(parts_union)), 3)
-
-        doc = {
-            "inspection_id": session_id,
-            "session_id": session_id,
-            "plate": plate,
-            "damage_detections": all_damage,
-            "parts_presence": parts_union,
-            "missing_parts": missing,
-            "color_evaluation": color_eval,
-            "vehicle_color_db": vehicle.get("color"),
-            "fraud_flags": list(set(fraud_flags)),
-            "review_flags": list(set(review_flags)),
-            "status": status,
-            "aborted": aborted,
-            "abort_reason": abort_reason,
-            "verdict": verdict_block,
-            "vehicle": vehicle,
-            "driver": driver,
-            "notes": notes,
-            "identity_validated": identity_validated,
-            "identity_payload": identity_payload,
-            "vehicle_history": vehicle_history,
-            "geo_summary": geo_block,
-            "part_completeness_score": completeness_score,
-            "illumination_frames": illum_list,
-            "background_frames": bg_list,
-            "tamper_suspects": tamper_suspects,
-            "ocr_summary": {
-                "plate_candidates": ocr_plate_matches[:5],
-                "vin_candidates": ocr_vin_candidates[:5],
-                "vin_detected": vin_detected
-            }
-        }
-
-        doc["report_markdown"] = build_markdown_report(doc)
-        inspections_col.replace_one({"inspection_id": session_id}, doc, upsert=True)
-
-        if clear:
-            session_repo.clear_session(session_id)
-
-        async def _notify():
-            await manager.broadcast(session_id, {
-                "event": "finalize:done",
-                "session_id": session_id,
-                "status": status,
-                "aborted": aborted
-            })
-
-        from_thread.run(_notify)
-        log_event("finalize_out", session_id=session_id, status=status)
-        _metrics("/inspection/finalize", "POST", 200)
-        return doc
+    await session_repo.flush_pending()
+    if await session_repo.count_images(session_id) == 0:
+        raise HTTPException(status_code=400, detail="Sesión vacía")
+    job = await finalize_queue.find_active(session_id)
+    if job is None:
+        try:
+            job = await finalize_queue.enqueue(session_id, {"plate": plate, "clear": clear})
+        except QueueFullError:
+            raise HTTPException(status_code=503, detail="Cola de finalize llena, reintente")
+    _metrics("/inspection/finalize", "POST", 202)
+    return _job_view(job)
+
+@app.get("/inspection/jobs/{job_id}")
+async def inspection_job(job_id: str):
+    job = await finalize_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    out = _job_view(job)
+    if job["status"] == "done" and job.get("result"):
+        doc = await inspections_acol.find_one({"inspection_id": job["result"]["inspection_id"]}, {"_id": 0})
+        out["result"] = FinalizeResponse(**doc).dict() if doc else job["result"]
+    return out
 
 # --------------- Report PDF ---------------
-@app.get("/inspection/report/{inspection_id}", response_model=ReportResponse)
-def get_report_pdf(inspection_id: str):
+@app.get("/inspection/report/{inspection_id}", response_model=ReportResponse, dependencies=[Depends(rate_limit("report"))])
+async def get_report_pdf(inspection_id: str, request: Request):
     if not settings.ENABLE_PDF_EXPORT:
         raise HTTPException(status_code=403, detail="PDF export deshabilitado")
 
-    doc = inspections_col.find_one({"inspection_id": inspection_id})
+    doc = await inspections_acol.find_one({"inspection_id": inspection_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Inspección no encontrada")
 
-    if not doc.get("report_markdown"):
-        doc["report_markdown"] = build_markdown_report(doc)
-
-    pdf_bytes = build_full_pdf(doc)
-    filename = f"reporte_{inspection_id}.pdf"
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
+    # Pre-renderizado por el job 'report'; si aún corre, 202 con el job para polling/WS
+    pdf = await run_in_threadpool(lookup_pdf, doc)
+    if pdf is None:
+        job = await report_queue.find_active(doc.get("session_id") or inspection_id)
+        if job is not None:
+            return JSONResponse(status_code=202, content=_job_view(job), headers={"Retry-After": "2"})
+        # Caché por hash de contenido; el render (CPU-bound) corre fuera del event loop
+        pdf = await run_in_threadpool(get_or_render, doc, render_report_pdf)
+    headers = {
+        "Content-Disposition": f'attachment; filename="reporte_{inspection_id}.pdf"',
+        "ETag": pdf.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate"
+    }
+    if pdf.etag in (request.headers.get("if-none-match") or ""):
+        return Response(status_code=304, headers=headers)
+
+    rng = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range == pdf.etag:
+        try:
+            rng = parse_range(request.headers.get("range"), pdf.size)
+        except ValueError:
+            raise HTTPException(status_code=416, detail="Rango inválido",
+                                headers={"Content-Range": f"bytes */{pdf.size}"})
+    if rng is None:
+        headers["Content-Length"] = str(pdf.size)
+        return StreamingResponse(pdf.iter_range(), media_type="application/pdf", headers=headers)
+    start, end = rng
+    headers["Content-Range"] = f"bytes {start}-{end}/{pdf.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(pdf.iter_range(start, end), status_code=206,
+                             media_type="application/pdf", headers=headers)
+
+@app.post("/inspection/reports/export", dependencies=[Depends(rate_limit("export"))])
+async def export_reports(req: ReportExportRequest):
+    """ZIP en streaming con los PDF de las inspecciones que cumplen el filtro (+ manifest.csv)."""
+    if not settings.ENABLE_PDF_EXPORT:
+        raise HTTPException(status_code=403, detail="PDF export deshabilitado")
+    if req.workers < 1 or (req.limit is not None and req.limit < 1):
+        raise HTTPException(status_code=400, detail="Parámetros inválidos")
+    limit = min(req.limit or settings.REPORT_EXPORT_MAX, settings.REPORT_EXPORT_MAX)
+    match = build_match(req.plates, req.since, req.until, req.status)
+    filename = f"reportes_{datetime.utcnow():%Y%m%d_%H%M%S}.zip"
+    return StreamingResponse(
+        export_reports_zip(match, limit, min(req.workers, settings.REPORT_EXPORT_MAX_WORKERS)),
+        media_type="application/zip",
         headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
@@ -428,6 +532,16 @@ async def ws_inspection(session_id: str, websocket: WebSocket):
     try:
         await manager.broadcast(session_id, {"event": "ws:connected", "session_id": session_id})
         while True:
-            _ = await websocket.receive_text()
-    except WebSocketDisconnect:
+            msg = await websocket.receive_text()
+            try:
+                data = json.loads(msg)
+            except ValueError:
+                continue
+            # {"action": "cancel", "analysis_id"?: "..."} detiene el análisis en curso
+            if isinstance(data, dict) and data.get("action") == "cancel":
+                await request_cancel(session_id, data.get("analysis_id"), data.get("reason") or "client")
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: el manager ya cerró el socket (cliente lento)
+        pass
+    finally:
         await manager.disconnect(session_id, websocket)
\ No newline at end of file
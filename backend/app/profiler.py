@@ -0,0 +1,128 @@
+import os, sys, threading, time
+from collections import Counter
+from typing import Any, Dict, Optional
+from .logging_utils import log_event
+
+# Hojas que indican un hilo ocioso (esperando IO / cola / lock)
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_LEAVES
+
+def _collapse(thread_name: str, frame) -> str:
+    parts = []
+    while frame is not None:
+        parts.append(_label(frame))
+        frame = frame.f_back
+    parts.append(thread_name)
+    return ";".join(reversed(parts))
+
+class SamplingProfiler:
+    """
+    Profiler por muestreo en proceso (estilo py-spy): un hilo daemon lee
+    sys._current_frames() cada intervalo y acumula pilas en formato
+    'collapsed' (compatible con flamegraph.pl / speedscope).
+    Captura por ventana de tiempo o hasta completar los próximos N requests.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stacks: Counter = Counter()
+        self._requests_left: Optional[int] = None
+        self._meta: Dict[str, Any] = {}
+        self._result: Optional[Dict[str, Any]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def counting_requests(self) -> bool:
+        return self._requests_left is not None and self.running
+
+    def start(self, seconds: float, requests: Optional[int], interval_ms: int, include_idle: bool = False):
+        with self._lock:
+            if self.running:
+                raise RuntimeError("profile_running")
+            self._stop.clear()
+            self._stacks = Counter()
+            self._requests_left = requests
+            self._meta = {
+                "started_at": time.time(),
+                "max_seconds": seconds,
+                "requests": requests,
+                "interval_ms": interval_ms,
+                "include_idle": include_idle
+            }
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(time.monotonic() + seconds, interval_ms / 1000.0, include_idle),
+                name="sampling-profiler",
+                daemon=True
+            )
+            self._thread.start()
+        log_event("profiler_start", seconds=seconds, requests=requests, interval_ms=interval_ms)
+
+    def stop(self):
+        self._stop.set()
+
+    def request_done(self):
+        with self._lock:
+            if self._requests_left is None:
+                return
+            self._requests_left -= 1
+            if self._requests_left <= 0:
+                self._stop.set()
+
+    def _run(self, deadline: float, interval: float, include_idle: bool):
+        me = threading.get_ident()
+        samples = 0
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                if not include_idle and _is_idle(frame):
+                    continue
+                self._stacks[_collapse(names.get(tid, f"thread-{tid}"), frame)] += 1
+            samples += 1
+            self._stop.wait(interval)
+        elapsed = time.time() - self._meta["started_at"]
+        with self._lock:
+            self._result = {
+                **self._meta,
+                "finished_at": time.time(),
+                "elapsed_s": round(elapsed, 3),
+                "ticks": samples,
+                "stacks": dict(self._stacks)
+            }
+            self._requests_left = None
+        log_event("profiler_done", ticks=samples, stacks=len(self._stacks), elapsed_s=round(elapsed, 3))
+
+    def status(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"running": self.running}
+        if self.running:
+            out.update(self._meta)
+            out["requests_left"] = self._requests_left
+        elif self._result:
+            out["last"] = {k: v for k, v in self._result.items() if k != "stacks"}
+        return out
+
+    def collapsed(self) -> Optional[str]:
+        if not self._result:
+            return None
+        stacks = self._result["stacks"]
+        return "\n".join(f"{s} {n}" for s, n in sorted(stacks.items(), key=lambda kv: -kv[1]))
+
+profiler = SamplingProfiler()
@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
 from typing import Dict, Any, Tuple
+from .utils.image_hash import image_hashes
 
 MIN_WIDTH = 450
 MIN_HEIGHT = 300
@@ -65,6 +66,13 @@ def build_overlay(img: np.ndarray, scratches: Dict[str, Any]) -> np.ndarray:
         cv2.rectangle(overlay, (x1, y1), (x2, y2), (255, 50, 50), 2)
     return overlay
 
+def perceptual_hashes(image_bytes: bytes) -> Dict[str, str] | None:
+    """pHash/dHash con el mismo preprocesado que assess_extended (reindexado de históricos)."""
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR) if image_bytes else None
+    if img is None:
+        return None
+    return image_hashes(cv2.cvtColor(enhance_and_denoise(img), cv2.COLOR_BGR2GRAY))
+
 def assess_extended(image_bytes: bytes, want_debug=False) -> Dict[str, Any]:
     arr = np.frombuffer(image_bytes, np.uint8)
     img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
@@ -82,6 +90,7 @@ def assess_extended(image_bytes: bytes, want_debug=False) -> Dict[str, Any]:
     edge_d = compute_edge_density(gray)
     mean_int = float(gray.mean())
     std_int = float(gray.std())
+    hashes = image_hashes(gray)
 
     status = "ok"
     if blur_var < VERY_LOW_BLUR_VAR:
@@ -110,7 +119,8 @@ def assess_extended(image_bytes: bytes, want_debug=False) -> Dict[str, Any]:
         "mean": round(mean_int, 1),
         "contrast": round(std_int, 1),
         "scratches": scratches,
-        "debug_images": debug_images
+        "debug_images": debug_images,
+        **hashes
     }
 
 def _to_b64(img: np.ndarray) -> str:
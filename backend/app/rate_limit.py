@@ -0,0 +1,268 @@
+import hashlib, math, re, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from prometheus_client import Counter
+from .config import settings
+from .logging_utils import log_event
+
+try:  # opcional: solo con RATE_LIMIT_BACKEND=redis
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover
+    aioredis = None
+
+RATE_LIMITED = Counter("rate_limited_total", "Requests rechazados por rate limit", ["action", "key_type"])
+RATE_LIMIT_ERRORS = Counter("rate_limit_errors_total", "Fallas del store de rate limit", ["backend"])
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+def parse_rate(spec: str) -> Tuple[float, float]:
+    """'90/minute' -> (capacidad, tokens por segundo)."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*/\s*(second|minute|hour|day)s?\s*", spec or "")
+    if not m:
+        raise ValueError(f"Rate inválido: {spec!r}")
+    capacity = float(m.group(1))
+    return capacity, capacity / _PERIODS[m.group(2)]
+
+def _parse_pairs(spec: str, sep: str = ",") -> Dict[str, str]:
+    out = {}
+    for part in (spec or "").split(sep):
+        k, _, v = part.partition("=")
+        if k.strip() and v.strip():
+            out[k.strip()] = v.strip()
+    return out
+
+# (clave, costo, capacidad, tokens por segundo)
+Bucket = Tuple[str, float, float, float]
+
+class MemoryBucketStore:
+    """
+    Token bucket en memoria del proceso: un solo worker o tests. Con varios
+    workers cada uno tiene su propio balde (límite efectivo N veces mayor).
+    """
+    name = "memory"
+
+    def __init__(self, max_keys: int = 100_000):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+
+    async def take(self, key: str, cost: float, capacity: float, refill: float) -> Tuple[bool, float, float]:
+        allowed, remaining, retry, _ = await self.take_many([(key, cost, capacity, refill)])
+        return allowed, remaining[0], retry
+
+    async def take_many(self, buckets: List[Bucket]) -> Tuple[bool, List[float], float, int]:
+        """
+        Todo o nada: se debita de todos los baldes solo si alcanzan todos.
+        (permitido, tokens por balde, retry, índice del balde que rechazó o -1).
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens = []
+            for key, cost, capacity, refill in buckets:
+                t, ts = self._buckets.get(key, (capacity, now))
+                tokens.append(min(capacity, t + (now - ts) * refill))
+            denied, retry = -1, 0.0
+            for i, (t, (_, cost, _, refill)) in enumerate(zip(tokens, buckets)):
+                if t < cost and (cost - t) / refill >= retry:
+                    denied, retry = i, (cost - t) / refill
+            allowed = denied < 0
+            for i, (key, cost, _, _) in enumerate(buckets):
+                if allowed:
+                    tokens[i] -= cost
+                self._buckets[key] = (tokens[i], now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, max(b[2] / b[3] for b in buckets if b[3] > 0) if buckets else 0)
+        return allowed, tokens, retry, denied
+
+    def _prune(self, now: float, full_after: float):
+        # Baldes que ya se habrían rellenado: equivalen a no tener entrada
+        for k in [k for k, (_, ts) in self._buckets.items() if now - ts >= full_after]:
+            del self._buckets[k]
+
+    async def close(self):
+        pass
+
+# Atómico en Redis: relleno + chequeo de todos los baldes y débito (todo o
+# nada) en un solo paso, con el reloj del servidor (todos los workers ven el
+# mismo tiempo). ARGV: capacidad, relleno, costo por cada KEY.
+_TOKEN_BUCKET_LUA = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local n = #KEYS
+local tokens = {}
+local denied = 0
+local retry = 0
+for i = 1, n do
+  local capacity = tonumber(ARGV[3 * i - 2])
+  local refill = tonumber(ARGV[3 * i - 1])
+  local cost = tonumber(ARGV[3 * i])
+  local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local tk = tonumber(b[1]) or capacity
+  local ts = tonumber(b[2]) or now
+  tk = math.min(capacity, tk + math.max(0, now - ts) * refill)
+  tokens[i] = tk
+  if tk < cost and (cost - tk) / refill >= retry then
+    denied = i
+    retry = (cost - tk) / refill
+  end
+end
+local out = {denied == 0 and 1 or 0, tostring(retry), denied - 1}
+for i = 1, n do
+  local capacity = tonumber(ARGV[3 * i - 2])
+  local refill = tonumber(ARGV[3 * i - 1])
+  if denied == 0 then
+    tokens[i] = tokens[i] - tonumber(ARGV[3 * i])
+  end
+  redis.call('HSET', KEYS[i], 'tokens', tokens[i], 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / refill * 1000) + 1000)
+  out[#out + 1] = tostring(tokens[i])
+end
+return out
+"""
+
+class RedisBucketStore:
+    """Token bucket compartido entre workers/instancias (un hash por clave, TTL = tiempo de relleno)."""
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str):
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(_TOKEN_BUCKET_LUA)
+        self._prefix = prefix
+
+    async def take(self, key: str, cost: float, capacity: float, refill: float) -> Tuple[bool, float, float]:
+        allowed, remaining, retry, _ = await self.take_many([(key, cost, capacity, refill)])
+        return allowed, remaining[0], retry
+
+    async def take_many(self, buckets: List[Bucket]) -> Tuple[bool, List[float], float, int]:
+        args: List[float] = []
+        for _, cost, capacity, refill in buckets:
+            args += [capacity, refill, cost]
+        res = await self._script(keys=[self._prefix + b[0] for b in buckets], args=args)
+        allowed, retry, denied = res[:3]
+        return bool(int(allowed)), [float(x) for x in res[3:]], float(retry), int(denied)
+
+    async def close(self):
+        await self._redis.close()
+
+def build_store(kind: Optional[str] = None):
+    kind = (kind or settings.RATE_LIMIT_BACKEND).lower()
+    if kind == "redis":
+        if aioredis is None:
+            log_event("rate_limit_unavailable", backend=kind, error="redis no instalado; se usa memory")
+            return MemoryBucketStore()
+        return RedisBucketStore(settings.RATE_LIMIT_REDIS_URL, settings.RATE_LIMIT_PREFIX)
+    return MemoryBucketStore()
+
+def _hash(value: str) -> str:
+    # Las API keys no se guardan en claro en el store
+    return hashlib.sha256(value.encode()).hexdigest()[:16]
+
+def client_ip(request: Request) -> str:
+    if settings.RATE_LIMIT_TRUST_PROXY:
+        fwd = request.headers.get("x-forwarded-for")
+        if fwd:
+            return fwd.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+class RateLimiter:
+    """
+    Token bucket por identidad del cliente, en el orden de RATE_LIMIT_KEYS
+    (api_key, session, plate, ip): la primera disponible en el request es la
+    clave. Solo cuentan las API keys de RATE_LIMIT_TENANTS (con su propio
+    rate). session y plate los elige el cliente: además se cobra un balde
+    por IP con techo propio (RATE_LIMIT_IP, holgado para clientes detrás de
+    un mismo NAT/proxy), chequeado y debitado junto al principal (todo o
+    nada). Cada acción consume su costo (RATE_LIMIT_COSTS).
+    """
+    def __init__(self, store=None):
+        self._store = store
+        self.reload()
+
+    def reload(self):
+        self.capacity, self.refill = parse_rate(settings.RATE_LIMIT)
+        self.ip_capacity, self.ip_refill = parse_rate(settings.RATE_LIMIT_IP)
+        self.costs = {k: float(v) for k, v in _parse_pairs(settings.RATE_LIMIT_COSTS).items()}
+        self.tenants = {k: parse_rate(v) for k, v in _parse_pairs(settings.RATE_LIMIT_TENANTS, ";").items()}
+        self.order = [k.strip() for k in settings.RATE_LIMIT_KEYS.split(",") if k.strip()]
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = build_store()
+        return self._store
+
+    def use_store(self, store):
+        self._store = store
+
+    async def close(self):
+        if self._store is not None:
+            await self._store.close()
+
+    async def identity(self, request: Request) -> Tuple[str, str, Optional[str]]:
+        """(tipo, clave, api_key del tenant) del primer identificador presente."""
+        api_key = request.headers.get(settings.RATE_LIMIT_API_KEY_HEADER)
+        if api_key not in self.tenants:
+            api_key = None  # una key desconocida (rotable) no da balde propio
+        form: Dict[str, Any] = {}
+        if request.method == "POST" and "form" in request.headers.get("content-type", ""):
+            form = await request.form()  # ya parseado por FastAPI: queda cacheado en el request
+        for kind in self.order:
+            if kind == "api_key" and api_key:
+                return kind, _hash(api_key), api_key
+            if kind in ("session", "plate"):
+                field = "session_id" if kind == "session" else "plate"
+                value = form.get(field) or request.query_params.get(field)
+                if value:
+                    return kind, str(value).upper() if kind == "plate" else str(value), api_key
+            if kind == "ip":
+                return kind, client_ip(request), api_key
+        return "ip", client_ip(request), api_key
+
+    async def hit(self, request: Request, action: str) -> float:
+        """Consume el costo de la acción; 429 con Retry-After si no alcanza. Devuelve tokens restantes."""
+        key_type, key, tenant = await self.identity(request)
+        capacity, refill = self.tenants.get(tenant, (self.capacity, self.refill))
+        cost = self.costs.get(action, self.costs.get("default", 1.0))
+        # (tipo, clave, capacidad, relleno); el principal va último
+        buckets = [(key_type, key, capacity, refill)]
+        if key_type != "ip" and tenant is None:
+            # session/plate salen del request: rotarlos no esquiva el balde por IP
+            # (clave propia: no comparte balde con la identidad 'ip', que usa RATE_LIMIT)
+            buckets.insert(0, ("ip_guard", client_ip(request), self.ip_capacity, self.ip_refill))
+        try:
+            allowed, remaining, retry, denied = await self.store.take_many(
+                [(f"{t}:{k}", min(cost, c), c, r) for t, k, c, r in buckets]
+            )
+        except Exception as e:
+            # Store caído: no bloquear inferencia (RATE_LIMIT_FAIL_OPEN) o rechazar todo
+            RATE_LIMIT_ERRORS.labels(self.store.name).inc()
+            log_event("rate_limit_store_error", backend=self.store.name, error=str(e))
+            if settings.RATE_LIMIT_FAIL_OPEN:
+                return capacity
+            raise HTTPException(status_code=503, detail="Rate limit no disponible")
+        if not allowed:
+            d_type, _, d_capacity, _ = buckets[denied]
+            d_cost = min(cost, d_capacity)
+            RATE_LIMITED.labels(action, d_type).inc()
+            log_event("rate_limited", action=action, key_type=d_type, cost=d_cost, retry_after=round(retry, 2))
+            wait = max(1, math.ceil(retry))
+            raise HTTPException(
+                status_code=429,
+                detail=f"Límite de solicitudes excedido ({action}); reintente en {wait}s",
+                headers={
+                    "Retry-After": str(wait),
+                    "X-RateLimit-Limit": f"{d_capacity:g}",
+                    "X-RateLimit-Remaining": f"{max(0.0, remaining[denied]):.0f}",
+                    "X-RateLimit-Cost": f"{d_cost:g}",
+                },
+            )
+        return remaining[-1]
+
+limiter = RateLimiter()
+
+def rate_limit(action: str):
+    """Dependencia FastAPI: dependencies=[Depends(rate_limit("analyze"))]."""
+    async def _dep(request: Request):
+        await limiter.hit(request, action)
+    return _dep
@@ -1,44 +1,209 @@
+from collections import Counter
 from typing import Dict, Any, Optional, List
 from datetime import datetime
+from urllib.parse import unquote
 from ..database import sessions_col
 
+OCR_TOP_K = 5
+# Subdocumentos de agg indexados por etiqueta (parte, color, tipo de daño, perfil)
+AGG_KEYED = ("parts", "colors", "damage_by_label", "profiles")
+
 def _now():
     return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
 
+def new_session_doc(session_id: str) -> Dict[str, Any]:
+    return {
+        "session_id": session_id,
+        "created_at": datetime.utcnow(),  # fecha BSON: índice TTL
+        "images": [],
+        "flags": [],
+        "review_flags": [],
+        "notes": [],
+        "aborted": False,
+        "abort_reason": None,
+        "geo_mismatch_count": 0
+    }
+
 def ensure_session(session_id: str):
     sessions_col.update_one(
         {"session_id": session_id},
-        {"$setOnInsert": {
-            "session_id": session_id,
-            "created_at": _now(),
-            "images": [],
-            "flags": [],
-            "review_flags": [],
-            "notes": [],
-            "aborted": False,
-            "abort_reason": None,
-            "geo_mismatch_count": 0
-        }},
+        {"$setOnInsert": new_session_doc(session_id)},
         upsert=True
     )
 def count_images(session_id: str) -> int:
-    s = get_session(session_id)
+    s = sessions_col.find_one({"session_id": session_id}, {"agg.image_count": 1})
     if not s: return 0
+    if "image_count" in (s.get("agg") or {}):
+        return s["agg"]["image_count"]
+    s = get_session(session_id)
     return len(s.get("images", []))
 
 def store_image_analysis(session_id: str, plate: str, analysis: Dict[str, Any], raw_bytes: bytes):
     """
     Envuelve append_image almacenando análisis, bytes crudos y metadatos mínimos.
     """
-    ensure_session(session_id)
-    image_doc = {
+    append_image(session_id, image_record(plate, analysis, raw_bytes))
+    merge_image_aggregates(session_id, analysis)
+
+def image_record(plate: str, analysis: Dict[str, Any], raw_bytes: bytes) -> Dict[str, Any]:
+    return {
         "ts": _now(),
         "plate": plate,
         "analysis": analysis,
         "raw": raw_bytes,
         "photo_key": analysis.get("photo_key") or analysis.get("step")
     }
-    append_image(session_id, image_doc)
+
+def _geo_point(exif_geo) -> Optional[List[float]]:
+    if not exif_geo:
+        return None
+    if isinstance(exif_geo, dict):
+        return [exif_geo["lat"], exif_geo["lon"]]
+    return [exif_geo[0], exif_geo[1]]
+
+def agg_key(label: Any) -> str:
+    """Etiqueta como segmento de ruta en agg: sin '.' ni '$' (escape %XX reversible)."""
+    return str(label).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+def decode_agg(session: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Restaura las etiquetas originales en los subdocumentos de AGG_KEYED."""
+    agg = (session or {}).get("agg")
+    if agg:
+        for field in AGG_KEYED:
+            if isinstance(agg.get(field), dict):
+                agg[field] = {unquote(k): v for k, v in agg[field].items()}
+        if isinstance(agg.get("damage_max"), dict):
+            agg["damage_max"] = {unquote(p): {unquote(l): n for l, n in labels.items()}
+                                 for p, labels in agg["damage_max"].items()}
+    return session
+
+def image_hash_entry(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "phash": analysis.get("phash"),
+        "dhash": analysis.get("dhash"),
+        "photo_key": analysis.get("photo_key"),
+        "analysis_id": analysis.get("analysis_id"),
+        "quality_status": analysis.get("quality_status"),
+    }
+
+def image_aggregate_update(analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Pipeline de update que incorpora un análisis a session.agg sin leer la
+    sesión: conteos, máximo por foto de cada daño (parte/tipo), unión de partes (máx. confianza), histograma de color,
+    puntos/bbox geo, OCR top-k (orden de llegada), tamper y hashes
+    perceptuales. Los casi duplicados que reutilizaron un análisis solo suman
+    al conteo.
+    """
+    def cur(field):
+        return f"$agg.{field}"
+    def inc(field, n):
+        return {"$add": [{"$ifNull": [cur(field), 0]}, n]}
+    def concat(field, items):
+        return {"$concatArrays": [{"$ifNull": [cur(field), []]}, {"$literal": items}]}
+
+    duplicate = analysis.get("duplicate_of")
+    if duplicate and duplicate.get("reused"):
+        # Casi duplicado que reutilizó el análisis de otra imagen de la sesión:
+        # cuenta como imagen pero no vuelve a sumar daños, partes, colores ni geo
+        return [{"$set": {
+            "agg.image_count": inc("image_count", 1),
+            "agg.duplicate_images": inc("duplicate_images", 1),
+        }}]
+
+    damage = analysis.get("damage") or []
+    upd: Dict[str, Any] = {
+        "agg.image_count": inc("image_count", 1),
+        "agg.damage": concat("damage", damage),
+        "agg.damage_total": inc("damage_total", len(damage)),
+    }
+    if duplicate:
+        # Re-toma con el pipeline completo (otra foto o mejor calidad): se agrega normal
+        upd["agg.duplicate_images"] = inc("duplicate_images", 1)
+    # Las etiquetas vienen del modelo/análisis: escapadas para usarlas como rutas
+    for label, n in Counter(d.get("label") for d in damage).items():
+        key = agg_key(label)
+        upd[f"agg.damage_by_label.{key}"] = inc(f"damage_by_label.{key}", n)
+    # Máximo por foto de cada (parte, tipo): varias tomas del mismo golpe no lo multiplican
+    for (part, label), n in Counter((d.get("part") or "unknown", d.get("label") or "damage") for d in damage).items():
+        field = f"damage_max.{agg_key(part)}.{agg_key(label)}"
+        upd[f"agg.{field}"] = {"$max": [{"$ifNull": [cur(field), 0]}, n]}
+
+    for part, info in (analysis.get("parts_presence") or {}).items():
+        key = agg_key(part)
+        prev = cur(f"parts.{key}")
+        upd[f"agg.parts.{key}"] = {"$cond": [
+            {"$gt": [info["confidence"], {"$ifNull": [f"{prev}.confidence", 0.0]}]},
+            {"$literal": info},
+            prev
+        ]}
+
+    color_name = (analysis.get("color_detected") or {}).get("name")
+    if color_name:
+        key = agg_key(color_name)
+        upd[f"agg.colors.{key}"] = inc(f"colors.{key}", 1)
+
+    pt = _geo_point(analysis.get("exif_geo"))
+    if pt:
+        upd["agg.geo_points"] = concat("geo_points", [pt])
+        for key, op, val in (("min_lat", "$min", pt[0]), ("max_lat", "$max", pt[0]),
+                             ("min_lon", "$min", pt[1]), ("max_lon", "$max", pt[1])):
+            upd[f"agg.geo_bbox.{key}"] = {op: [{"$ifNull": [cur(f"geo_bbox.{key}"), val]}, val]}
+
+    if analysis.get("illumination"):
+        upd["agg.illumination"] = concat("illumination", [analysis["illumination"]])
+    if analysis.get("background"):
+        upd["agg.background"] = concat("background", [analysis["background"]])
+
+    ocr = analysis.get("ocr") or {}
+    if ocr.get("plate_candidates"):
+        upd["agg.ocr_plates"] = {"$slice": [concat("ocr_plates", ocr["plate_candidates"]), OCR_TOP_K]}
+    if ocr.get("vin_candidates"):
+        upd["agg.ocr_vins"] = {"$slice": [concat("ocr_vins", ocr["vin_candidates"]), OCR_TOP_K]}
+
+    if (analysis.get("tamper") or {}).get("suspect"):
+        upd["agg.tamper_suspects"] = inc("tamper_suspects", 1)
+    # Fidelidad: perfil de pipeline y etapas omitidas por admission
+    if analysis.get("profile"):
+        key = agg_key(analysis["profile"])
+        upd[f"agg.profiles.{key}"] = inc(f"profiles.{key}", 1)
+    if (analysis.get("admission") or {}).get("skipped"):
+        upd["agg.degraded_images"] = inc("degraded_images", 1)
+    # Índice de deduplicación por sesión (ver services/dedup)
+    if analysis.get("phash"):
+        upd["agg.hashes"] = concat("hashes", [image_hash_entry(analysis)])
+    return [{"$set": upd}]
+
+def merge_image_aggregates(session_id: str, analysis: Dict[str, Any]):
+    sessions_col.update_one({"session_id": session_id}, image_aggregate_update(analysis))
+
+def stored_image_count(session_id: str) -> int:
+    """Largo de session.images calculado en el servidor (sin traer imágenes)."""
+    res = list(sessions_col.aggregate([
+        {"$match": {"session_id": session_id}},
+        {"$project": {"_id": 0, "n": {"$size": {"$ifNull": ["$images", []]}}}}
+    ]))
+    return res[0]["n"] if res else 0
+
+def rebuild_aggregate(session_id: str) -> bool:
+    """
+    Sesiones previas a agg (o con imágenes agregadas antes del despliegue):
+    recalcula agg desde session.images en un solo update atómico, una etapa
+    de image_aggregate_update por imagen. No aplica si entre medio llegó
+    otra imagen (el filtro exige el mismo largo).
+    """
+    s = sessions_col.find_one({"session_id": session_id}, {"images.analysis": 1})
+    analyses = [img.get("analysis") or {} for img in (s or {}).get("images") or []]
+    if not analyses:
+        return False
+    pipeline: List[Dict[str, Any]] = [{"$set": {"agg": {"$literal": {}}}}]
+    for analysis in analyses:
+        pipeline += image_aggregate_update(analysis)
+    res = sessions_col.update_one({"session_id": session_id, "images": {"$size": len(analyses)}}, pipeline)
+    return res.modified_count > 0
+
+def get_session_summary(session_id: str) -> Optional[Dict[str, Any]]:
+    """Sesión sin el arreglo de imágenes (ni sus bytes crudos), con agg decodificado."""
+    return decode_agg(sessions_col.find_one({"session_id": session_id}, {"images": 0, "_id": 0}))
 
 def set_identity(session_id: str, payload: Dict[str, Any]):
     ensure_session(session_id)
@@ -0,0 +1,110 @@
+from typing import Dict, Any, Optional, List
+from ..config import settings
+from ..database_async import sessions_acol
+from .session_repo import new_session_doc, image_record, image_aggregate_update, decode_agg
+from .session_write_buffer import SessionWriteBuffer, WriteBehind
+
+# Versión awaitable de session_repo para los handlers async (Motor o threadpool).
+# Mismo esquema de documento; session_repo sigue sirviendo a código síncrono
+# (jobs de finalize en el threadpool, scripts).
+
+write_behind = WriteBehind(settings.SESSION_WRITE_BEHIND_MS, settings.SESSION_WRITE_BEHIND_MAX_OPS)
+
+def write_buffer(session_id: str) -> SessionWriteBuffer:
+    return SessionWriteBuffer(session_id)
+
+async def commit(buf: SessionWriteBuffer):
+    """Un bulk_write por request, o diferido si SESSION_WRITE_BEHIND_MS > 0."""
+    if write_behind.enabled:
+        await write_behind.submit(buf)
+    else:
+        await buf.flush()
+
+async def flush_pending():
+    await write_behind.flush()
+
+async def ensure_session(session_id: str):
+    await sessions_acol.update_one(
+        {"session_id": session_id},
+        {"$setOnInsert": new_session_doc(session_id)},
+        upsert=True
+    )
+
+async def get_session(session_id: str) -> Optional[Dict[str, Any]]:
+    return await sessions_acol.find_one({"session_id": session_id})
+
+async def get_session_summary(session_id: str) -> Optional[Dict[str, Any]]:
+    return decode_agg(await sessions_acol.find_one({"session_id": session_id}, {"images": 0, "_id": 0}))
+
+async def count_images(session_id: str) -> int:
+    return await _stored_image_count(session_id) + write_behind.pending_images(session_id)
+
+async def _stored_image_count(session_id: str) -> int:
+    s = await sessions_acol.find_one({"session_id": session_id}, {"agg.image_count": 1})
+    if not s: return 0
+    if "image_count" in (s.get("agg") or {}):
+        return s["agg"]["image_count"]
+    s = await sessions_acol.find_one({"session_id": session_id}, {"images.ts": 1})
+    return len(s.get("images", [])) if s else 0
+
+async def append_image(session_id: str, image_doc: Dict[str, Any]):
+    await ensure_session(session_id)
+    await sessions_acol.update_one({"session_id": session_id}, {"$push": {"images": image_doc}})
+
+async def merge_image_aggregates(session_id: str, analysis: Dict[str, Any]):
+    await sessions_acol.update_one({"session_id": session_id}, image_aggregate_update(analysis))
+
+async def store_image_analysis(session_id: str, plate: str, analysis: Dict[str, Any], raw_bytes: bytes):
+    await append_image(session_id, image_record(plate, analysis, raw_bytes))
+    await merge_image_aggregates(session_id, analysis)
+
+async def list_image_hashes(session_id: str) -> List[Dict[str, Any]]:
+    s = await sessions_acol.find_one({"session_id": session_id}, {"agg.hashes": 1})
+    return ((s or {}).get("agg") or {}).get("hashes", [])
+
+async def get_image_analysis(session_id: str, analysis_id: str) -> Optional[Dict[str, Any]]:
+    s = await sessions_acol.find_one(
+        {"session_id": session_id},
+        {"images": {"$elemMatch": {"analysis.analysis_id": analysis_id}}}
+    )
+    images = (s or {}).get("images") or []
+    return images[0].get("analysis") if images else None
+
+async def add_flag(session_id: str, flag: str):
+    await sessions_acol.update_one({"session_id": session_id}, {"$addToSet": {"flags": flag}})
+
+async def add_review_flag(session_id: str, flag: str):
+    await sessions_acol.update_one({"session_id": session_id}, {"$addToSet": {"review_flags": flag}})
+
+async def add_note(session_id: str, note: str):
+    await sessions_acol.update_one({"session_id": session_id}, {"$push": {"notes": note}})
+
+async def set_identity(session_id: str, payload: Dict[str, Any]):
+    await ensure_session(session_id)
+    await sessions_acol.update_one({"session_id": session_id}, {"$set": {"identity": payload}})
+
+async def set_vehicle_history(session_id: str, payload: Dict[str, Any]):
+    await ensure_session(session_id)
+    await sessions_acol.update_one({"session_id": session_id}, {"$set": {"vehicle_history": payload}})
+
+async def set_abort(session_id: str, reason: str):
+    await sessions_acol.update_one({"session_id": session_id}, {"$set": {"aborted": True, "abort_reason": reason}})
+
+async def increment_geo_mismatch(session_id: str):
+    await sessions_acol.update_one({"session_id": session_id}, {"$inc": {"geo_mismatch_count": 1}})
+
+async def is_aborted(session_id: str):
+    s = await sessions_acol.find_one({"session_id": session_id}, {"aborted": 1, "abort_reason": 1})
+    if not s: return False, None
+    return s.get("aborted", False), s.get("abort_reason")
+
+async def list_flags(session_id: str) -> List[str]:
+    s = await sessions_acol.find_one({"session_id": session_id}, {"flags": 1})
+    return s.get("flags", []) if s else []
+
+async def list_notes(session_id: str) -> List[str]:
+    s = await sessions_acol.find_one({"session_id": session_id}, {"notes": 1})
+    return s.get("notes", []) if s else []
+
+async def clear_session(session_id: str):
+    await sessions_acol.delete_one({"session_id": session_id})
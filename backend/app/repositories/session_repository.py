@@ -0,0 +1,60 @@
+from . import session_repo as repo
+from . import session_repo_async as arepo
+
+class SessionRepository:
+    """
+    Fachada sobre las funciones de session_repo (la usa main.py).
+    """
+    ensure_session = staticmethod(repo.ensure_session)
+    get_session = staticmethod(repo.get_session)
+    count_images = staticmethod(repo.count_images)
+    get_session_summary = staticmethod(repo.get_session_summary)
+    stored_image_count = staticmethod(repo.stored_image_count)
+    rebuild_aggregate = staticmethod(repo.rebuild_aggregate)
+    merge_image_aggregates = staticmethod(repo.merge_image_aggregates)
+    store_image_analysis = staticmethod(repo.store_image_analysis)
+    append_image = staticmethod(repo.append_image)
+    list_images = staticmethod(repo.list_images)
+    add_flag = staticmethod(repo.add_flag)
+    add_review_flag = staticmethod(repo.add_review_flag)
+    list_flags = staticmethod(repo.list_flags)
+    list_review_flags = staticmethod(repo.list_review_flags)
+    add_note = staticmethod(repo.add_note)
+    list_notes = staticmethod(repo.list_notes)
+    set_identity = staticmethod(repo.set_identity)
+    get_identity = staticmethod(repo.get_identity)
+    set_vehicle_history = staticmethod(repo.set_vehicle_history)
+    get_vehicle_history = staticmethod(repo.get_vehicle_history)
+    set_abort = staticmethod(repo.set_abort)
+    is_aborted = staticmethod(repo.is_aborted)
+    increment_geo_mismatch = staticmethod(repo.increment_geo_mismatch)
+    get_geo_mismatch_count = staticmethod(repo.get_geo_mismatch_count)
+    clear_session = staticmethod(repo.clear_session)
+
+class AsyncSessionRepository:
+    """
+    Fachada awaitable (session_repo_async) para los handlers async.
+    """
+    ensure_session = staticmethod(arepo.ensure_session)
+    get_session = staticmethod(arepo.get_session)
+    get_session_summary = staticmethod(arepo.get_session_summary)
+    count_images = staticmethod(arepo.count_images)
+    append_image = staticmethod(arepo.append_image)
+    merge_image_aggregates = staticmethod(arepo.merge_image_aggregates)
+    store_image_analysis = staticmethod(arepo.store_image_analysis)
+    list_image_hashes = staticmethod(arepo.list_image_hashes)
+    get_image_analysis = staticmethod(arepo.get_image_analysis)
+    add_flag = staticmethod(arepo.add_flag)
+    add_review_flag = staticmethod(arepo.add_review_flag)
+    add_note = staticmethod(arepo.add_note)
+    set_identity = staticmethod(arepo.set_identity)
+    set_vehicle_history = staticmethod(arepo.set_vehicle_history)
+    set_abort = staticmethod(arepo.set_abort)
+    increment_geo_mismatch = staticmethod(arepo.increment_geo_mismatch)
+    is_aborted = staticmethod(arepo.is_aborted)
+    list_flags = staticmethod(arepo.list_flags)
+    list_notes = staticmethod(arepo.list_notes)
+    clear_session = staticmethod(arepo.clear_session)
+    write_buffer = staticmethod(arepo.write_buffer)
+    commit = staticmethod(arepo.commit)
+    flush_pending = staticmethod(arepo.flush_pending)
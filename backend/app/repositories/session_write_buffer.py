@@ -0,0 +1,200 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+from prometheus_client import Counter
+from pymongo import UpdateOne
+from ..database import sessions_col
+from ..database_async import sessions_acol
+from ..logging_utils import log_event
+from .session_repo import new_session_doc, image_record, image_aggregate_update
+
+SESSION_BULK_WRITES = Counter("session_bulk_writes_total", "bulk_write emitidos sobre sessions", ["mode"])
+SESSION_BUFFERED_OPS = Counter("session_buffered_ops_total", "Mutaciones de sesión coalescidas")
+
+class SessionWriteBuffer:
+    """
+    Acumula las mutaciones de una sesión durante un request y las emite como
+    un único bulk_write ordenado:
+      1) upsert con $setOnInsert (campos no tocados) + $push/$addToSet/$set/$inc
+      2..n) pipelines de agregados (no se pueden mezclar con operadores clásicos)
+    Sustituye ensure_session + append_image + add_note + add_flag... (una
+    ida y vuelta cada uno) por una sola.
+    """
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self._ensure = False
+        self._push: Dict[str, List[Any]] = {}
+        self._add_to_set: Dict[str, List[Any]] = {}
+        self._set: Dict[str, Any] = {}
+        self._inc: Dict[str, int] = {}
+        self._pipelines: List[List[Dict[str, Any]]] = []
+        self.mutations = 0
+
+    def ensure_session(self):
+        self._ensure = True
+
+    def append_image(self, image_doc: Dict[str, Any]):
+        self.ensure_session()
+        self._push.setdefault("images", []).append(image_doc)
+        self.mutations += 1
+
+    def merge_image_aggregates(self, analysis: Dict[str, Any]):
+        self._pipelines.append(image_aggregate_update(analysis))
+        self.mutations += 1
+
+    def store_image_analysis(self, plate: str, analysis: Dict[str, Any], raw_bytes: bytes):
+        self.append_image(image_record(plate, analysis, raw_bytes))
+        self.merge_image_aggregates(analysis)
+
+    def add_note(self, note: str):
+        self._push.setdefault("notes", []).append(note)
+        self.mutations += 1
+
+    def add_flag(self, flag: str):
+        self._add_unique("flags", flag)
+
+    def add_review_flag(self, flag: str):
+        self._add_unique("review_flags", flag)
+
+    def _add_unique(self, field: str, value: str):
+        vals = self._add_to_set.setdefault(field, [])
+        if value not in vals:
+            vals.append(value)
+        self.mutations += 1
+
+    def set_identity(self, payload: Dict[str, Any]):
+        self.ensure_session()
+        self._set["identity"] = payload
+        self.mutations += 1
+
+    def set_vehicle_history(self, payload: Dict[str, Any]):
+        self.ensure_session()
+        self._set["vehicle_history"] = payload
+        self.mutations += 1
+
+    def set_abort(self, reason: str):
+        self._set.update({"aborted": True, "abort_reason": reason})
+        self.mutations += 1
+
+    def increment_geo_mismatch(self):
+        self._inc["geo_mismatch_count"] = self._inc.get("geo_mismatch_count", 0) + 1
+        self.mutations += 1
+
+    @property
+    def image_count(self) -> int:
+        return len(self._push.get("images", []))
+
+    def ops(self) -> List[UpdateOne]:
+        flt = {"session_id": self.session_id}
+        upd: Dict[str, Any] = {}
+        if self._push:
+            upd["$push"] = {k: {"$each": v} for k, v in self._push.items()}
+        if self._add_to_set:
+            upd["$addToSet"] = {k: {"$each": v} for k, v in self._add_to_set.items()}
+        if self._set:
+            upd["$set"] = dict(self._set)
+        if self._inc:
+            upd["$inc"] = dict(self._inc)
+        if self._ensure:
+            # $setOnInsert no puede repetir rutas de los otros operadores
+            touched = set(self._push) | set(self._add_to_set) | set(self._set) | set(self._inc)
+            upd["$setOnInsert"] = {
+                k: v for k, v in new_session_doc(self.session_id).items() if k not in touched
+            }
+        ops = [UpdateOne(flt, upd, upsert=self._ensure)] if upd else []
+        ops += [UpdateOne(flt, p) for p in self._pipelines]
+        return ops
+
+    def clear(self):
+        self.__init__(self.session_id)
+
+    async def flush(self) -> int:
+        ops = self.ops()
+        if ops:
+            await sessions_acol.bulk_write(ops, ordered=True)
+            SESSION_BULK_WRITES.labels("request").inc()
+            SESSION_BUFFERED_OPS.inc(self.mutations)
+        self.clear()
+        return len(ops)
+
+    def flush_sync(self) -> int:
+        ops = self.ops()
+        if ops:
+            sessions_col.bulk_write(ops, ordered=True)
+            SESSION_BULK_WRITES.labels("request").inc()
+            SESSION_BUFFERED_OPS.inc(self.mutations)
+        self.clear()
+        return len(ops)
+
+class WriteBehind:
+    """
+    Batching opcional entre requests: los buffers de varias sesiones se
+    acumulan y se escriben en un solo bulk_write ordenado cada interval_ms
+    (o al llegar a max_ops). El orden por sesión se conserva.
+
+    Durabilidad: el request responde ANTES de que Mongo confirme. Una caída
+    del proceso pierde como máximo interval_ms de mutaciones; un fallo del
+    bulk se registra (session_write_behind_failed) y esas mutaciones no se
+    reintentan. Las lecturas del mismo proceso deben llamar flush() antes
+    (finalize lo hace); con varios workers de uvicorn las sesiones deben ser
+    sticky o el batching debe quedar deshabilitado (interval_ms=0).
+    """
+    def __init__(self, interval_ms: int, max_ops: int):
+        self.interval = interval_ms / 1000.0
+        self.max_ops = max(1, max_ops)
+        self._pending: List[UpdateOne] = []
+        self._mutations = 0
+        self._pending_images: Dict[str, int] = {}
+        self._inflight_images: Dict[str, int] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def pending_images(self, session_id: str) -> int:
+        # Incluye lo que se está escribiendo: aún no visible en Mongo
+        return self._pending_images.get(session_id, 0) + self._inflight_images.get(session_id, 0)
+
+    async def submit(self, buf: SessionWriteBuffer):
+        self._pending.extend(buf.ops())
+        self._mutations += buf.mutations
+        if buf.image_count:
+            self._pending_images[buf.session_id] = self._pending_images.get(buf.session_id, 0) + buf.image_count
+        buf.clear()
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+        if len(self._pending) >= self.max_ops:
+            await self.flush()
+
+    async def flush(self) -> int:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            ops, mutations = self._pending, self._mutations
+            self._inflight_images = self._pending_images
+            self._pending, self._mutations, self._pending_images = [], 0, {}
+            if not ops:
+                return 0
+            try:
+                await sessions_acol.bulk_write(ops, ordered=True)
+            except Exception as e:
+                log_event("session_write_behind_failed", ops=len(ops), error=str(e))
+                return 0
+            finally:
+                self._inflight_images = {}
+            SESSION_BULK_WRITES.labels("write_behind").inc()
+            SESSION_BUFFERED_OPS.inc(mutations)
+            return len(ops)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
 
@@ -5,6 +6,7 @@ class DamageBox(BaseModel):
     label: str
     confidence: float
     box: List[float]
+    part: Optional[str] = None
 
 class PartPresence(BaseModel):
     present: bool
@@ -21,6 +23,7 @@ class ScratchInfo(BaseModel):
 
 class AnalyzeResponse(BaseModel):
     session_id: str
+    analysis_id: Optional[str] = None
     damage: List[DamageBox]
     parts_presence: Dict[str, PartPresence]
     missing_parts: List[str]
@@ -36,6 +39,13 @@ class AnalyzeResponse(BaseModel):
     scratch: ScratchInfo
     quality_status: str
     debug_images: Dict[str, str] | None = None
+    stage_timings: List[Dict[str, Any]] | None = None
+    profile: Optional[str] = None
+    admission: Dict[str, Any] | None = None
+    phash: Optional[str] = None
+    dhash: Optional[str] = None
+    duplicate_of: Dict[str, Any] | None = None
+    image_reuse: Dict[str, Any] | None = None
 
 class FinalizeResponse(BaseModel):
     inspection_id: Optional[str]
@@ -60,6 +70,11 @@ class FinalizeResponse(BaseModel):
     identity_validated: bool | None = None
     identity_payload: Dict[str, Any] | None = None
     vehicle_history: Dict[str, Any] | None = None
+    analysis_fidelity: Optional[str] = None
+    pipeline_profiles: Dict[str, int] = {}
+    degraded_images: int = 0
+    duplicate_images: int = 0
+    damage_changes: Dict[str, Any] | None = None
 
 class ReportResponse(BaseModel):
     inspection_id: str
@@ -78,4 +93,24 @@ class VehicleHistoryResponse(BaseModel):
     infractions: int
     previous_owners: int
     tech_ok: bool
-    notes: List[str] = []
\ No newline at end of file
+    notes: List[str] = []
+    damage_timeline: Dict[str, Any] | None = None
+
+class RuleBacktestRequest(BaseModel):
+    rules_yaml: str
+    baseline_yaml: Optional[str] = None  # por defecto fraud_rules.yaml vigente
+    plates: List[str] | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+    status: str | None = None
+    limit: int | None = None
+    workers: int = 1
+    batch_size: int = 2000
+
+class ReportExportRequest(BaseModel):
+    plates: List[str] | None = None
+    since: datetime | None = None
+    until: datetime | None = None
+    status: str | None = None
+    limit: int | None = None
+    workers: int = 1
@@ -0,0 +1,145 @@
+import io, math, os, time, uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+from PIL import Image
+from prometheus_client import Counter, Gauge, Histogram
+from ..config import settings
+from ..logging_utils import log_event
+from .pipeline import OCR_ALLOWED_PHOTOS
+
+# Etapas opcionales que admission (o el perfil) puede apagar; el resto del pipeline es "base"
+OPTIONAL_STAGES = ("dual_pass", "ocr", "tamper_cnn", "scratch_severity", "background")
+
+ADMISSION_DECISIONS = Counter("admission_decisions_total", "Decisiones de admisión en analyze", ["decision", "photo_key"])
+ADMISSION_DROPPED = Counter("admission_dropped_stages_total", "Etapas omitidas por degradación", ["stage"])
+ADMISSION_INFLIGHT = Gauge("admission_inflight", "Análisis admitidos en curso en este worker")
+ADMISSION_WAIT = Histogram(
+    "admission_predicted_wait_seconds", "Espera estimada al admitir",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0)
+)
+ADMISSION_SCALE = Gauge("admission_cost_scale", "Factor de calibración costo real / estimado")
+
+def _stage_costs() -> Dict[str, float]:
+    out = {}
+    for part in settings.ADMISSION_STAGE_MS_PER_MP.split(","):
+        k, _, v = part.partition("=")
+        if k.strip() and v.strip():
+            out[k.strip()] = float(v)
+    return out
+
+def image_megapixels(raw: bytes) -> float:
+    # Solo lee el header: no decodifica la imagen
+    try:
+        w, h = Image.open(io.BytesIO(raw)).size
+    except Exception:
+        return 0.0
+    return w * h / 1e6
+
+def default_plan(photo_key: str, base: Optional[Dict[str, bool]] = None) -> Dict[str, bool]:
+    """Etapas opcionales que correrían con la configuración actual (y el perfil base, si hay)."""
+    plan = {
+        "dual_pass": settings.ENABLE_IMAGE_ENHANCEMENT and settings.ENABLE_DUAL_PASS_DAMAGE,
+        "ocr": settings.ENABLE_OCR and photo_key in OCR_ALLOWED_PHOTOS,
+        "tamper_cnn": settings.ENABLE_TAMPER_DETECTION and os.path.exists(settings.TAMPER_CNN_MODEL_PATH),
+        "scratch_severity": settings.ENABLE_SCRATCH_SEVERITY,
+        "background": settings.ENABLE_BG_CLASSIFIER,
+    }
+    return {k: v and (base or {}).get(k, True) for k, v in plan.items()}
+
+def estimate_cost_ms(mp: float, plan: Dict[str, bool]) -> float:
+    """Costo sin calibrar: fijo + ms/MP de la base y de cada etapa opcional activa."""
+    per_mp = _stage_costs()
+    total = per_mp.get("base", 0.0) + sum(per_mp.get(k, 0.0) for k in OPTIONAL_STAGES if plan.get(k))
+    return settings.ADMISSION_BASE_MS + total * mp
+
+class AdmissionController:
+    """
+    Cola viva de analyze en este worker: cada admitido aporta su costo
+    estimado (escalado por la calibración) menos lo que ya lleva corriendo.
+    La espera prevista es esa suma / ADMISSION_PARALLELISM. Si espera + costo
+    supera el deadline se apagan etapas en ADMISSION_DOWNGRADE_ORDER; si ni
+    así entra, se rechaza antes de encolar.
+    """
+    def __init__(self):
+        self._inflight: Dict[str, Dict[str, Any]] = {}
+        self.scale = 1.0
+        ADMISSION_SCALE.set(self.scale)
+
+    def predicted_wait_ms(self, now: Optional[float] = None) -> float:
+        now = now or time.perf_counter()
+        remaining = sum(max(0.0, t["cost_ms"] * self.scale - (now - t["t0"]) * 1000) for t in self._inflight.values())
+        return remaining / max(1, settings.ADMISSION_PARALLELISM)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def decide(self, raw: bytes, photo_key: str, deadline_ms: Optional[float] = None,
+               base_plan: Optional[Dict[str, bool]] = None) -> Dict[str, Any]:
+        deadline = min(deadline_ms or settings.ADMISSION_DEADLINE_MS, settings.ADMISSION_DEADLINE_MS)
+        mp = image_megapixels(raw)
+        plan = default_plan(photo_key, base_plan)
+        wait = self.predicted_wait_ms()
+        cost = estimate_cost_ms(mp, plan)
+        dropped: List[str] = []
+        order = [s.strip() for s in settings.ADMISSION_DOWNGRADE_ORDER.split(",") if s.strip()]
+        if len(self._inflight) >= settings.ADMISSION_MAX_INFLIGHT:
+            decision = "reject"
+        else:
+            while wait + cost * self.scale > deadline:
+                nxt = next((s for s in order if plan.get(s)), None)
+                if nxt is None:
+                    break
+                plan[nxt] = False
+                dropped.append(nxt)
+                cost = estimate_cost_ms(mp, plan)
+            if wait + cost * self.scale > deadline:
+                decision = "reject"
+            else:
+                decision = "downgrade" if dropped else "admit"
+        ticket = {
+            "id": uuid.uuid4().hex, "decision": decision, "photo_key": photo_key, "plan": plan,
+            "skipped": dropped, "megapixels": round(mp, 2), "cost_ms": round(cost * self.scale, 1),
+            "predicted_wait_ms": round(wait, 1), "deadline_ms": deadline,
+            "retry_after_s": max(1, math.ceil((wait + cost * self.scale - deadline) / 1000)) if decision == "reject" else 0,
+        }
+        ADMISSION_DECISIONS.labels(decision, photo_key).inc()
+        for s in dropped:
+            ADMISSION_DROPPED.labels(s).inc()
+        ADMISSION_WAIT.observe(wait / 1000)
+        if decision != "admit":
+            log_event("admission_" + decision, photo_key=photo_key, megapixels=ticket["megapixels"],
+                      cost_ms=ticket["cost_ms"], wait_ms=ticket["predicted_wait_ms"], skipped=dropped,
+                      inflight=len(self._inflight))
+        return ticket
+
+    @asynccontextmanager
+    async def admitted(self, ticket: Optional[Dict[str, Any]]) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        if ticket is None:  # ENABLE_ADMISSION_CONTROL=false
+            yield None
+            return
+        entry = {"cost_ms": ticket["cost_ms"] / self.scale, "t0": time.perf_counter(), "solo": not self._inflight}
+        for other in self._inflight.values():
+            other["solo"] = False
+        self._inflight[ticket["id"]] = entry
+        ADMISSION_INFLIGHT.set(len(self._inflight))
+        ok = False
+        try:
+            yield ticket
+            ok = True
+        finally:
+            self._inflight.pop(ticket["id"], None)
+            ADMISSION_INFLIGHT.set(len(self._inflight))
+            # Solo calibra con requests que corrieron sin competencia: con
+            # otros en vuelo el tiempo de pared incluye su CPU
+            if ok and entry["solo"] and entry["cost_ms"] > 0:
+                ratio = (time.perf_counter() - entry["t0"]) * 1000 / entry["cost_ms"]
+                a = settings.ADMISSION_EWMA_ALPHA
+                self.scale = min(10.0, max(0.1, (1 - a) * self.scale + a * ratio))
+                ADMISSION_SCALE.set(self.scale)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"inflight": len(self._inflight), "predicted_wait_ms": round(self.predicted_wait_ms(), 1),
+                "cost_scale": round(self.scale, 3)}
+
+controller = AdmissionController()
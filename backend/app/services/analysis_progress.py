@@ -0,0 +1,104 @@
+import asyncio, time, uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Set
+from prometheus_client import Counter
+from ..config import settings
+from ..logging_utils import log_event
+from ..websocket_manager import manager
+
+# Orden en que el cliente recibe resultados parciales
+STEPS = ("quality", "damage", "parts", "color", "ocr", "tamper")
+
+ANALYZE_CANCELLED = Counter("analyze_cancelled_total", "Análisis cancelados", ["step"])
+
+class AnalysisCancelled(Exception):
+    def __init__(self, step: str):
+        self.step = step
+        super().__init__(f"Análisis cancelado en {step}")
+
+class AnalysisProgress:
+    """
+    Emite analyze:progress por etapa y es el punto de corte de la
+    cancelación: check() entre etapas lanza AnalysisCancelled si el cliente
+    (o cualquier worker, vía pub/sub) pidió cancelar.
+    """
+    def __init__(self, session_id: str, photo_key: str, analysis_id: Optional[str] = None):
+        self.session_id = session_id
+        self.photo_key = photo_key
+        self.analysis_id = analysis_id or uuid.uuid4().hex
+        self.cancelled_reason: Optional[str] = None
+        self.step: Optional[str] = None
+        self._t0 = time.perf_counter()
+
+    def cancel(self, reason: str = "client"):
+        self.cancelled_reason = reason
+
+    def check(self, step: Optional[str] = None):
+        if self.cancelled_reason is not None:
+            raise AnalysisCancelled(step or self.step or "start")
+
+    async def _send(self, event: str, **fields):
+        if settings.ANALYZE_PROGRESS_EVENTS:
+            await manager.broadcast(self.session_id, {
+                "event": event, "session_id": self.session_id,
+                "analysis_id": self.analysis_id, "photo_key": self.photo_key, **fields
+            })
+
+    async def started(self):
+        await self._send("analyze:started", steps=list(STEPS))
+
+    async def emit(self, step: str, data: Dict[str, Any]):
+        self.check(step)
+        self.step = step
+        idx = STEPS.index(step) + 1 if step in STEPS else 0
+        await self._send("analyze:progress", step=step, progress=round(idx / len(STEPS), 3),
+                         elapsed_ms=round((time.perf_counter() - self._t0) * 1000, 1), data=data)
+        # El pipeline es CPU-bound dentro del loop: cede un turno para que
+        # salgan los envíos y entren mensajes de cancelación
+        await asyncio.sleep(0)
+        self.check(step)
+
+_active: Dict[str, Set[AnalysisProgress]] = {}
+
+@asynccontextmanager
+async def track_analysis(session_id: str, photo_key: str, analysis_id: Optional[str] = None) -> AsyncIterator[AnalysisProgress]:
+    progress = AnalysisProgress(session_id, photo_key, analysis_id)
+    _active.setdefault(session_id, set()).add(progress)
+    await manager.watch(session_id)
+    try:
+        await progress.started()
+        yield progress
+    except AnalysisCancelled as e:
+        ANALYZE_CANCELLED.labels(e.step).inc()
+        log_event("analyze_cancelled", session_id=session_id, analysis_id=progress.analysis_id,
+                  step=e.step, reason=progress.cancelled_reason)
+        await progress._send("analyze:cancelled", step=e.step, reason=progress.cancelled_reason)
+        raise
+    finally:
+        group = _active.get(session_id)
+        if group is not None:
+            group.discard(progress)
+            if not group:
+                _active.pop(session_id, None)
+        await manager.unwatch(session_id)
+
+def cancel_local(session_id: str, analysis_id: Optional[str] = None, reason: str = "client") -> int:
+    """Marca los análisis en curso de este worker (todos los de la sesión si no hay analysis_id)."""
+    hits = 0
+    for p in list(_active.get(session_id, ())):
+        if analysis_id in (None, p.analysis_id):
+            p.cancel(reason)
+            hits += 1
+    return hits
+
+async def request_cancel(session_id: str, analysis_id: Optional[str] = None, reason: str = "client"):
+    """Publica la cancelación: llega al worker que esté corriendo el análisis."""
+    await manager.broadcast(session_id, {
+        "event": "analyze:cancel", "session_id": session_id, "analysis_id": analysis_id, "reason": reason
+    })
+
+async def _on_event(session_id: str, payload: Dict[str, Any]):
+    if payload.get("event") == "analyze:cancel":
+        cancel_local(session_id, payload.get("analysis_id"), payload.get("reason") or "client")
+
+manager.add_listener(_on_event)
@@ -135,20 +135,34 @@ def majority_color_fraud(registered_color: str, detected: List[Dict[str,Any]]) -
     """
     if not detected:
         return {"fraud": False, "reason": "no_colors", "mismatch_ratio": 0.0}
+    counts: Dict[str, int] = {}
+    for c in detected:
+        n = (c.get("name") or "").lower()
+        if n:
+            counts[n] = counts.get(n, 0) + 1
+    return majority_color_fraud_counts(registered_color, counts)
+
+def majority_color_fraud_counts(registered_color: str, counts: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Igual que majority_color_fraud pero sobre el histograma {nombre: n}
+    acumulado en la sesión.
+    """
+    if not counts:
+        return {"fraud": False, "reason": "no_colors", "mismatch_ratio": 0.0}
     reg = (registered_color or "").strip().lower()
     if not reg:
         return {"fraud": False, "reason": "no_registered", "mismatch_ratio": 0.0}
 
-    mismatches = 0
     total = 0
-    for c in detected:
-        n = (c.get("name") or "").lower()
-        if not n:
+    mismatches = 0
+    for name, n in counts.items():
+        name = (name or "").lower()
+        if not name:
             continue
-        total += 1
-        # Simple equivalencia: si deltaE > threshold o nombre distinto => mismatch
-        if n != reg:
-            mismatches += 1
+        total += n
+        # Simple equivalencia: nombre distinto => mismatch
+        if name != reg:
+            mismatches += n
     if total == 0:
         return {"fraud": False, "reason": "no_valid_colors", "mismatch_ratio": 0.0}
 
@@ -160,4 +174,4 @@ def majority_color_fraud(registered_color: str, detected: List[Dict[str,Any]]) -
         "mismatch_ratio": ratio,
         "registered": reg,
         "total": total
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,114 @@
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo.errors import DuplicateKeyError
+from ..config import settings
+from ..database import damage_timeline_col
+from ..database_async import damage_timeline_acol
+from ..logging_utils import log_event
+
+Key = Tuple[str, str]  # (parte, tipo de daño)
+
+_MAX_RETRIES = 3
+
+def damage_counts(damage: List[Dict[str, Any]]) -> Dict[Key, int]:
+    """Conteo por (parte, tipo) de las detecciones de una foto."""
+    return dict(Counter((d.get("part") or "unknown", d.get("label") or "damage") for d in damage))
+
+def inspection_counts(agg: Dict[str, Any]) -> Dict[Key, int]:
+    """
+    Conteo de la inspección: el máximo por foto de cada (parte, tipo), que
+    session.agg mantiene en damage_max. Sumar sobre fotos contaría varias
+    veces el mismo daño fotografiado desde distintos ángulos.
+    """
+    if "damage_max" not in agg:
+        # Sesión agregada antes de damage_max: todas las detecciones como una sola foto
+        return damage_counts(agg.get("damage") or [])
+    return {(p, l): n for p, labels in agg["damage_max"].items() for l, n in labels.items()}
+
+def _as_list(counts: Dict[Key, int]) -> List[Dict[str, Any]]:
+    return [{"part": p, "label": l, "count": n} for (p, l), n in sorted(counts.items())]
+
+def _as_counts(items: List[Dict[str, Any]]) -> Dict[Key, int]:
+    return {(i["part"], i["label"]): i["count"] for i in items or []}
+
+def diff_counts(prev: Dict[Key, int], cur: Dict[Key, int]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(nuevos, faltantes) por parte/tipo; count es la diferencia y previous lo reportado antes."""
+    new, missing = [], []
+    for key in sorted(set(prev) | set(cur)):
+        p, c = prev.get(key, 0), cur.get(key, 0)
+        item = {"part": key[0], "label": key[1], "previous": p}
+        if c > p:
+            new.append({**item, "count": c - p})
+        elif p > c:
+            missing.append({**item, "count": p - c})
+    return new, missing
+
+def _first_seen(entries: List[Dict[str, Any]], key: Key, at: datetime) -> datetime:
+    # Inicio de la racha continua (inspecciones consecutivas) en que aparece el daño
+    first = at
+    for e in reversed(entries):
+        if key not in _as_counts(e["damage"]):
+            break
+        first = e["at"]
+    return first
+
+def update_timeline(plate: str, inspection_id: str, counts: Dict[Key, int],
+                    at: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Incorpora una inspección finalizada a la línea de tiempo de la placa (un
+    documento por placa, últimas DAMAGE_TIMELINE_MAX_ENTRIES) a partir de sus
+    conteos por (parte, tipo) (ver inspection_counts) y devuelve los
+    cambios contra la inspección anterior. Re-finalizar la misma inspección
+    reemplaza su entrada. Escritura optimista por 'rev' (finalize concurrente
+    de la misma placa reintenta).
+    """
+    plate = plate.upper()
+    at = at or datetime.utcnow()
+    cur = {k: n for k, n in counts.items() if n > 0}
+    for _ in range(_MAX_RETRIES):
+        doc = damage_timeline_col.find_one({"plate": plate}) or {}
+        entries = [e for e in doc.get("entries", []) if e["inspection_id"] != inspection_id]
+        prev = entries[-1] if entries else None
+        # Primera inspección de la placa: no hay contra qué comparar
+        new, missing = diff_counts(_as_counts(prev["damage"]), cur) if prev else ([], [])
+        entry = {"inspection_id": inspection_id, "at": at, "damage": _as_list(cur), "new": new, "missing": missing}
+        entries = (entries + [entry])[-settings.DAMAGE_TIMELINE_MAX_ENTRIES:]
+        current = [{**i, "first_seen": _first_seen(entries[:-1], (i["part"], i["label"]), at)} for i in entry["damage"]]
+        state = {"plate": plate, "entries": entries, "current": current, "last_inspection_id": inspection_id,
+                 "last_at": at, "updated_at": datetime.utcnow()}
+        try:
+            if doc:
+                res = damage_timeline_col.update_one({"plate": plate, "rev": doc.get("rev", 0)},
+                                                     {"$set": {**state, "rev": doc.get("rev", 0) + 1}})
+                if not res.matched_count:
+                    continue
+            else:
+                damage_timeline_col.insert_one({**state, "rev": 1})
+        except DuplicateKeyError:
+            continue
+        return {
+            "previous_inspection_id": prev["inspection_id"] if prev else None,
+            "previous_at": prev["at"] if prev else None,
+            "new": new,
+            "missing": missing,
+        }
+    log_event("damage_timeline_conflict", plate=plate, inspection_id=inspection_id)
+    return {"previous_inspection_id": None, "previous_at": None, "new": [], "missing": [], "conflict": True}
+
+async def get_timeline(plate: str, limit: int = 10) -> Optional[Dict[str, Any]]:
+    """Estado y cambios ya calculados al finalizar: una lectura por placa, sin tocar inspections."""
+    doc = await damage_timeline_acol.find_one(
+        {"plate": plate.upper()}, {"_id": 0, "rev": 0, "entries": {"$slice": -limit}}
+    )
+    if not doc:
+        return None
+    last = doc["entries"][-1] if doc.get("entries") else {}
+    return {
+        "last_inspection_id": doc.get("last_inspection_id"),
+        "last_at": doc.get("last_at"),
+        "current": doc.get("current", []),
+        "new_since_last": last.get("new", []),
+        "missing_since_last": last.get("missing", []),
+        "entries": [{k: e[k] for k in ("inspection_id", "at", "damage", "new", "missing")} for e in doc.get("entries", [])],
+    }
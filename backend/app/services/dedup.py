@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from prometheus_client import Counter
+from ..config import settings
+from ..logging_utils import log_event
+from ..repositories import session_repo_async as arepo
+from ..repositories.session_repo import image_hash_entry
+from ..utils.image_hash import hamming
+
+# Campos del análisis que produce run_full_pipeline: es lo que se reutiliza
+PIPELINE_KEYS = ("damage", "parts_presence", "missing_parts", "color_detected", "color_match",
+                 "exif_geo", "segmentation", "illumination", "background", "ocr", "tamper")
+
+DEDUP_MATCHES = Counter("dedup_matches_total", "Imágenes casi duplicadas dentro de la sesión", ["action"])
+
+def nearest(entries: List[Dict[str, Any]], phash: str, dhash: str) -> Optional[Dict[str, Any]]:
+    """Entrada más cercana por pHash con ambas distancias bajo umbral (None si no hay)."""
+    best, best_d = None, None
+    for e in entries:
+        dp = hamming(phash, e.get("phash"))
+        if dp > settings.DEDUP_PHASH_MAX_DIST or hamming(dhash, e.get("dhash")) > settings.DEDUP_DHASH_MAX_DIST:
+            continue
+        if best_d is None or dp < best_d:
+            best, best_d = e, dp
+    return {**best, "distance": best_d} if best else None
+
+class SessionHashIndex:
+    """
+    Índice de hashes perceptuales por sesión. En memoria (LRU de
+    DEDUP_INDEX_MAX_SESSIONS) con el análisis reutilizable de cada imagen;
+    si la sesión no está cargada (otro worker, reinicio) se reconstruye desde
+    session.agg.hashes y el análisis se lee de session.images al reutilizar.
+    Ante un miss se relee agg.hashes: la imagen pudo llegar por otro worker.
+    Con pocas imágenes por sesión el escaneo lineal alcanza.
+    """
+    def __init__(self):
+        self._sessions: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    async def _entries(self, session_id: str) -> Tuple[List[Dict[str, Any]], bool]:
+        """(entradas, recién leídas de Mongo)."""
+        entries = self._sessions.get(session_id)
+        fresh = entries is None
+        if fresh:
+            entries = [dict(e) for e in await arepo.list_image_hashes(session_id)]
+            self._sessions[session_id] = entries
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > settings.DEDUP_INDEX_MAX_SESSIONS:
+            self._sessions.popitem(last=False)
+        return entries, fresh
+
+    async def _refresh(self, session_id: str, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Agrega las entradas persistidas por otros workers; devuelve las nuevas."""
+        known = {e.get("analysis_id") for e in entries}
+        new = [dict(e) for e in await arepo.list_image_hashes(session_id) if e.get("analysis_id") not in known]
+        entries.extend(new)
+        return new
+
+    async def find(self, session_id: str, phash: str, dhash: str) -> Optional[Dict[str, Any]]:
+        if settings.DEDUP_POLICY == "off" or not phash:
+            return None
+        entries, fresh = await self._entries(session_id)
+        match = nearest(entries, phash, dhash)
+        if match is None and not fresh:
+            match = nearest(await self._refresh(session_id, entries), phash, dhash)
+        return match
+
+    async def reusable(self, session_id: str, match: Optional[Dict[str, Any]], photo_key: str,
+                       quality_status: str) -> Optional[Dict[str, Any]]:
+        """
+        Análisis previo reutilizable: misma foto (photo_key, que decide OCR y
+        política de fondo) y misma calidad (una toma repetida por blur debe
+        volver a correr). None si hay que correr el pipeline.
+        """
+        if not match or settings.DEDUP_POLICY != "reuse":
+            return None
+        if match.get("photo_key") != photo_key or match.get("quality_status") != quality_status:
+            return None
+        prev = match.get("pipeline")
+        if prev is None:
+            analysis = await arepo.get_image_analysis(session_id, match["analysis_id"])
+            if not analysis:  # aún en write-behind u otro worker sin flush
+                return None
+            prev = {k: analysis.get(k) for k in PIPELINE_KEYS}
+        return prev
+
+    def add(self, session_id: str, analysis: Dict[str, Any]):
+        entries = self._sessions.get(session_id)
+        if entries is None:  # se carga completa desde Mongo en el próximo find
+            return
+        entry = image_hash_entry(analysis)
+        entry["pipeline"] = {k: analysis.get(k) for k in PIPELINE_KEYS}
+        for i, e in enumerate(entries):
+            if e.get("analysis_id") == entry["analysis_id"]:  # ya traída por un refresh
+                entries[i] = entry
+                return
+        entries.append(entry)
+
+    def record(self, session_id: str, match: Dict[str, Any], photo_key: str, reused: bool):
+        action = "reuse" if reused else "flag"
+        DEDUP_MATCHES.labels(action).inc()
+        log_event("image_duplicate", session_id=session_id, photo_key=photo_key, action=action,
+                  duplicate_of=match.get("analysis_id"), distance=match.get("distance"))
+
+index = SessionHashIndex()
@@ -1,21 +1,29 @@
 from ..database import drivers_col
-from ..utils.random_data import gen_driver_record
+from ..database_async import drivers_acol
+from .seeding import seed_stream
+from .reference_cache import driver_pool
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
 
-def seed_drivers(n=50):
-    bulk = [gen_driver_record() for _ in range(n)]
-    if bulk:
-        drivers_col.insert_many(bulk)
-    return n
+def seed_drivers(n=50, chunk_size: int = 5000, workers: int = 1, seed: Optional[int] = None):
+    return seed_stream("drivers", n, chunk_size, workers, seed)["inserted"]
 
 def get_random_driver():
-    doc = drivers_col.aggregate([{"$sample":{"size":1}}])
-    for d in doc:
-        d.pop("_id", None)
-        return d
-    seed_drivers(10)
-    return get_random_driver()
+    # Muestreo local sobre el pool precargado (sin $sample por request)
+    return driver_pool.sample()
 
 def get_driver(driver_id: str) -> Optional[dict]:
     d = drivers_col.find_one({"driver_id": driver_id},{"_id":0})
-    return d
\ No newline at end of file
+    return d
+
+# --- Variantes async (handlers) ---
+async def get_random_driver_async():
+    if driver_pool.loaded_at is None:
+        await run_in_threadpool(driver_pool.refresh)
+    return driver_pool.sample()
+
+async def get_driver_async(driver_id: str) -> Optional[dict]:
+    return await drivers_acol.find_one({"driver_id": driver_id},{"_id":0})
+
+async def find_driver_by_document_async(document: str) -> Optional[dict]:
+    return await drivers_acol.find_one({"document": document},{"_id":0})
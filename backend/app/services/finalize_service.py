@@ -0,0 +1,191 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from prometheus_client import Histogram
+from ..config import settings
+from ..database import inspections_col
+from ..logging_utils import log_event
+from ..repositories.session_repository import SessionRepository
+from ..telemetry import stage
+from .color_exif import majority_color_fraud_counts
+from .damage_timeline import inspection_counts, update_timeline
+from .driver_service import get_random_driver
+from .geo import evaluate_geolocation
+from .markdown_builder import build_markdown_report
+from .pipeline_profiles import lowest as lowest_profile
+from .vehicle_service import get_or_create_vehicle
+from .verdict import compute_verdict as _compute_verdict
+
+FINALIZE_LAT = Histogram("inspection_finalize_seconds", "Finalize endpoint latency")
+
+session_repo = SessionRepository()
+
+ProgressFn = Callable[[str, float], None]
+
+class EmptySessionError(Exception):
+    pass
+
+def finalize_session(
+    session_id: str,
+    plate: str,
+    clear: bool = True,
+    progress: Optional[ProgressFn] = None
+) -> Dict[str, Any]:
+    """
+    Consolida las imágenes de la sesión en el documento de inspección,
+    lo persiste y (opcionalmente) limpia la sesión. Síncrono: lo ejecutan
+    los workers de la cola de finalize en el threadpool.
+    progress(step, fraction) se invoca entre fases.
+    """
+    def _progress(step: str, pct: float):
+        if progress:
+            progress(step, pct)
+
+    with FINALIZE_LAT.time():
+        _progress("load", 0.1)
+        # Solo agregados incrementales (session.agg); no se cargan imágenes ni bytes
+        session = session_repo.get_session_summary(session_id)
+        agg = (session or {}).get("agg") or {}
+        # Sesión previa a agg (o agregada solo en parte): se reconstruye desde sus imágenes
+        if session and agg.get("image_count", 0) < session_repo.stored_image_count(session_id):
+            if session_repo.rebuild_aggregate(session_id):
+                log_event("session_agg_rebuilt", session_id=session_id)
+            session = session_repo.get_session_summary(session_id)
+            agg = (session or {}).get("agg") or {}
+        if not agg.get("image_count"):
+            raise EmptySessionError(session_id)
+
+        aborted, abort_reason = session.get("aborted", False), session.get("abort_reason")
+        _progress("reference_data", 0.25)
+        vehicle = get_or_create_vehicle(plate)
+        driver = get_random_driver()
+
+        _progress("aggregate", 0.4)
+        all_damage: List[Dict[str,Any]] = agg.get("damage", [])
+        parts_union: Dict[str, Dict[str,Any]] = agg.get("parts", {})
+        color_counts: Dict[str, int] = agg.get("colors", {})
+        exif_points = [tuple(p) for p in agg.get("geo_points", [])]
+        illum_list = agg.get("illumination", [])
+        bg_list = agg.get("background", [])
+        ocr_plate_matches = agg.get("ocr_plates", [])
+        ocr_vin_candidates = agg.get("ocr_vins", [])
+        tamper_suspects = agg.get("tamper_suspects", 0)
+
+        missing = [p for p, i in parts_union.items() if not i["present"]]
+
+        _progress("rules", 0.6)
+
+        registered_color = (vehicle.get("color") or "").lower()
+        color_eval = majority_color_fraud_counts(registered_color, color_counts) if registered_color else {
+            "fraud": False, "reason": "no_registered", "mismatch_ratio": 0.0
+        }
+
+        geo_block = evaluate_geolocation(exif_points)
+        fraud_flags = list(set(session.get("flags", []) + geo_block.get("flags", [])))
+        review_flags = list(session.get("review_flags", []))
+
+        if color_eval.get("fraud"):
+            fraud_flags.append("COLOR_FRAUD")
+            if settings.COLOR_FRAUD_POLICY == "ABORT":
+                aborted = True
+                abort_reason = "COLOR_FRAUD"
+            elif settings.COLOR_FRAUD_POLICY == "REVIEW":
+                review_flags.append("COLOR_REVIEW")
+
+        vin_detected = ocr_vin_candidates[0]["text"] if ocr_vin_candidates else None
+        if ocr_plate_matches:
+            best_plate = ocr_plate_matches[0].get("text")
+            if best_plate and best_plate != plate:
+                fraud_flags.append("PLATE_OCR_MISMATCH")
+
+        if tamper_suspects > 0:
+            fraud_flags.append("TAMPER_SUSPECT")
+
+        status = "COMPLETED"
+        verdict_block = None
+        if aborted:
+            status = f"ABORTED_{abort_reason}"
+            fraud_flags.append(abort_reason)
+        elif geo_block["status"] == "FAIL":
+            status = "FAILED_GEO_MISMATCH"
+            fraud_flags.append("INSPECTION_ABORTED_GEO")
+        else:
+            verdict_block = _compute_verdict(len(all_damage), len(missing), not color_eval.get("fraud"))
+
+        notes = session.get("notes", [])
+        identity_payload = session.get("identity")
+        vehicle_history = session.get("vehicle_history")
+        identity_validated = bool(identity_payload and identity_payload.get("valid"))
+
+        completeness_score = None
+        if settings.ENABLE_PART_COMPLETENESS_SCORE and parts_union:
+            present = sum(1 for v in parts_union.values() if v["present"])
+            completeness_score = round(present / max(1, len(parts_union)), 3)
+
+        # Línea de tiempo por placa: cambios de daño (parte/tipo) contra la inspección anterior
+        created_at = datetime.utcnow()
+        damage_changes = None
+        if settings.ENABLE_DAMAGE_TIMELINE and not aborted and plate:
+            _progress("timeline", 0.7)
+            with stage("damage_timeline"):
+                damage_changes = update_timeline(plate, session_id, inspection_counts(agg), created_at)
+            if damage_changes["missing"]:
+                review_flags.append("DAMAGE_MISSING_SINCE_LAST")
+
+        doc = {
+            "inspection_id": session_id,
+            "session_id": session_id,
+            "plate": plate,
+            "created_at": created_at,
+            "damage_detections": all_damage,
+            "damage_counts": {
+                "total": agg.get("damage_total", len(all_damage)),
+                "by_label": agg.get("damage_by_label", {})
+            },
+            "images_count": agg["image_count"],
+            "geo_bbox": agg.get("geo_bbox"),
+            "parts_presence": parts_union,
+            "missing_parts": missing,
+            "color_evaluation": color_eval,
+            "vehicle_color_db": vehicle.get("color"),
+            "fraud_flags": list(set(fraud_flags)),
+            "review_flags": list(set(review_flags)),
+            "status": status,
+            "aborted": aborted,
+            "abort_reason": abort_reason,
+            "verdict": verdict_block,
+            "vehicle": vehicle,
+            "driver": driver,
+            "notes": notes,
+            "identity_validated": identity_validated,
+            "identity_payload": identity_payload,
+            "vehicle_history": vehicle_history,
+            "geo_summary": geo_block,
+            "part_completeness_score": completeness_score,
+            "illumination_frames": illum_list,
+            "background_frames": bg_list,
+            "tamper_suspects": tamper_suspects,
+            "pipeline_profiles": agg.get("profiles", {}),
+            "analysis_fidelity": lowest_profile(agg.get("profiles", {})),
+            "degraded_images": agg.get("degraded_images", 0),
+            "duplicate_images": agg.get("duplicate_images", 0),
+            # Hashes perceptuales: fuente durable para reconstruir image_hashes (la sesión se borra)
+            "image_hashes": [{k: h.get(k) for k in ("analysis_id", "photo_key", "phash", "dhash")}
+                             for h in agg.get("hashes", [])],
+            "damage_changes": damage_changes,
+            "ocr_summary": {
+                "plate_candidates": ocr_plate_matches[:5],
+                "vin_candidates": ocr_vin_candidates[:5],
+                "vin_detected": vin_detected
+            }
+        }
+
+        _progress("report", 0.75)
+        doc["report_markdown"] = build_markdown_report(doc)
+        _progress("persist", 0.9)
+        with stage("mongo_write"):
+            inspections_col.replace_one({"inspection_id": session_id}, doc, upsert=True)
+
+        if clear:
+            session_repo.clear_session(session_id)
+
+        return doc
@@ -0,0 +1,3 @@
+from .inspection_service import evaluate_geolocation
+
+__all__ = ["evaluate_geolocation"]
@@ -0,0 +1,273 @@
+import asyncio, threading, time
+from datetime import datetime, timedelta
+from itertools import combinations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from bson import ObjectId
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge, Histogram
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from ..config import settings
+from ..database import image_hashes_col, inspections_col, sessions_col
+from ..database_async import image_hashes_acol
+from ..logging_utils import log_event
+from ..quality import perceptual_hashes
+from .job_queue import JobQueue
+
+BANDS = 4
+BAND_BITS = 16
+_BAND_MASK = (1 << BAND_BITS) - 1
+
+IMAGE_INDEX_SIZE = Gauge("image_index_entries", "Imágenes en el índice global en memoria")
+IMAGE_INDEX_QUERY = Histogram(
+    "image_index_query_seconds", "Consulta al índice global de hashes",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+IMAGE_REUSE = Counter("image_reuse_matches_total", "Imágenes ya vistas en otra sesión", ["other_plate"])
+
+def band_keys(h: int) -> List[int]:
+    """Clave por banda: (índice de banda << 16) | valor, única entre bandas."""
+    return [(i << BAND_BITS) | ((h >> (BAND_BITS * i)) & _BAND_MASK) for i in range(BANDS)]
+
+def probe_keys(h: int, radius: int) -> List[int]:
+    """
+    Multi-index hashing: con distancia total <= radius, alguna banda difiere
+    en <= radius // BANDS bits. Se prueban esas variantes de cada banda.
+    """
+    flips = radius // BANDS
+    keys = []
+    for i in range(BANDS):
+        v = (h >> (BAND_BITS * i)) & _BAND_MASK
+        for k in range(flips + 1):
+            for bits in combinations(range(BAND_BITS), k):
+                m = 0
+                for b in bits:
+                    m |= 1 << b
+                keys.append((i << BAND_BITS) | (v ^ m))
+    return keys
+
+def index_doc(analysis: Dict[str, Any], session_id: str, plate: str) -> Dict[str, Any]:
+    ph = int(analysis["phash"], 16)
+    return {
+        "analysis_id": analysis["analysis_id"],
+        "session_id": session_id,
+        "plate": (plate or "").upper(),
+        "photo_key": analysis.get("photo_key"),
+        "phash": analysis["phash"],
+        "dhash": analysis.get("dhash"),
+        "bands": band_keys(ph),
+        "created_at": datetime.utcnow(),
+    }
+
+class ImageHashIndex:
+    """
+    Índice global de pHash/dHash. Persistido en image_hashes (una clave por
+    banda con índice multikey) y replicado en memoria: buckets por banda ->
+    posiciones en arrays de hashes. La consulta prueba las claves de
+    probe_keys y verifica Hamming sobre pHash y dHash (sin I/O). Otros
+    workers se incorporan con un sync incremental por _id cada
+    IMAGE_INDEX_SYNC_S que relee IMAGE_INDEX_SYNC_OVERLAP_S hacia atrás (los
+    ObjectId de otros hosts no son monótonos entre sí) más una recarga
+    completa cada IMAGE_INDEX_RECONCILE_S; hasta la primera carga se
+    consulta Mongo.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[int, List[int]] = {}
+        self._phash: List[int] = []
+        self._dhash: List[int] = []
+        self._meta: List[Tuple[str, str, str, Optional[str]]] = []  # analysis_id, session_id, plate, photo_key
+        self._ids: set = set()
+        self._last_id = None
+        self._last_full = 0.0
+        self.loaded = False
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._meta)
+
+    def _insert(self, doc: Dict[str, Any]) -> bool:
+        if doc["analysis_id"] in self._ids:
+            return False
+        pos = len(self._meta)
+        ph = int(doc["phash"], 16)
+        self._phash.append(ph)
+        self._dhash.append(int(doc["dhash"], 16) if doc.get("dhash") else -1)
+        self._meta.append((doc["analysis_id"], doc["session_id"], doc.get("plate") or "", doc.get("photo_key")))
+        self._ids.add(doc["analysis_id"])
+        for key in doc.get("bands") or band_keys(ph):
+            self._buckets.setdefault(key, []).append(pos)
+        return True
+
+    def sync(self, full: bool = False) -> int:
+        """Incorpora lo nuevo en Mongo (todo en la primera llamada o con full). Síncrono: threadpool."""
+        flt = {}
+        if self._last_id is not None and not full:
+            since = self._last_id.generation_time - timedelta(seconds=settings.IMAGE_INDEX_SYNC_OVERLAP_S)
+            flt = {"_id": {"$gte": ObjectId.from_datetime(since)}}
+        if not flt:
+            self._last_full = time.monotonic()
+        n = 0
+        for doc in image_hashes_col.find(flt, {"created_at": 0}).sort("_id", 1):
+            with self._lock:
+                n += self._insert(doc)
+            if self._last_id is None or doc["_id"] > self._last_id:
+                self._last_id = doc["_id"]
+        if full and self.loaded and n:
+            log_event("image_index_reconciled", added=n)  # se los había saltado el incremental
+        self.loaded = True
+        IMAGE_INDEX_SIZE.set(len(self))
+        return n
+
+    async def start(self):
+        if not settings.ENABLE_IMAGE_INDEX:
+            return
+        t0 = time.perf_counter()
+        try:
+            n = await run_in_threadpool(self.sync)
+            log_event("image_index_loaded", entries=n, ms=round((time.perf_counter() - t0) * 1000, 1))
+        except PyMongoError as e:
+            log_event("image_index_load_failed", error=str(e))
+        if settings.IMAGE_INDEX_SYNC_S > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.IMAGE_INDEX_SYNC_S)
+            full = 0 < settings.IMAGE_INDEX_RECONCILE_S <= time.monotonic() - self._last_full
+            try:
+                await run_in_threadpool(self.sync, full)
+            except PyMongoError as e:
+                log_event("image_index_sync_failed", error=str(e))
+
+    def _candidates(self, keys: List[int]) -> List[Tuple[int, int, Tuple[str, str, str, Optional[str]]]]:
+        with self._lock:
+            seen = set()
+            for key in keys:
+                seen.update(self._buckets.get(key, ()))
+            return [(self._phash[p], self._dhash[p], self._meta[p]) for p in seen]
+
+    async def _mongo_candidates(self, keys: List[int]):
+        docs = await image_hashes_acol.find({"bands": {"$in": keys}}, {"_id": 0, "created_at": 0, "bands": 0}).to_list(None)
+        return [(int(d["phash"], 16), int(d["dhash"], 16) if d.get("dhash") else -1,
+                 (d["analysis_id"], d["session_id"], d.get("plate") or "", d.get("photo_key"))) for d in docs]
+
+    async def query(self, phash: Optional[str], dhash: Optional[str], session_id: str) -> List[Dict[str, Any]]:
+        """Imágenes de OTRAS sesiones dentro de los umbrales, más cercanas primero."""
+        if not settings.ENABLE_IMAGE_INDEX or not phash:
+            return []
+        with IMAGE_INDEX_QUERY.time():
+            ph = int(phash, 16)
+            dh = int(dhash, 16) if dhash else None
+            keys = probe_keys(ph, settings.IMAGE_INDEX_PHASH_MAX_DIST)
+            cands = self._candidates(keys) if self.loaded else await self._mongo_candidates(keys)
+            out = []
+            for cph, cdh, (analysis_id, other_session, plate, photo_key) in cands:
+                if other_session == session_id:
+                    continue  # dentro de la sesión lo resuelve dedup
+                dp = (ph ^ cph).bit_count()
+                if dp > settings.IMAGE_INDEX_PHASH_MAX_DIST:
+                    continue
+                if dh is not None and cdh >= 0 and (dh ^ cdh).bit_count() > settings.IMAGE_INDEX_DHASH_MAX_DIST:
+                    continue
+                out.append({"analysis_id": analysis_id, "session_id": other_session, "plate": plate,
+                            "photo_key": photo_key, "distance": dp})
+            out.sort(key=lambda m: m["distance"])
+        return out[:settings.IMAGE_INDEX_MAX_MATCHES]
+
+    async def add(self, analysis: Dict[str, Any], session_id: str, plate: str):
+        if not settings.ENABLE_IMAGE_INDEX or not analysis.get("phash"):
+            return
+        doc = index_doc(analysis, session_id, plate)
+        await image_hashes_acol.update_one({"analysis_id": doc["analysis_id"]}, {"$setOnInsert": doc}, upsert=True)
+        if self.loaded:
+            with self._lock:
+                self._insert(doc)
+            IMAGE_INDEX_SIZE.set(len(self))
+
+    def record(self, session_id: str, plate: str, matches: List[Dict[str, Any]]):
+        other = any(m["plate"] != (plate or "").upper() for m in matches)
+        IMAGE_REUSE.labels(str(other).lower()).inc()
+        log_event("image_reused", session_id=session_id, plate=plate, matches=matches)
+
+def rebuild(batch_size: int = 500, since: Optional[datetime] = None,
+            progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+    """
+    Reconstrucción masiva. Fuente durable: inspections.image_hashes (guardados
+    al finalizar; la sesión se borra ahí o por TTL). Además las sesiones aún
+    abiertas, con el hash del análisis o, si falta (previas al índice),
+    calculado desde los bytes crudos. Idempotente (upsert por analysis_id);
+    las imágenes sin analysis_id usan session_id:posición.
+    """
+    t0 = time.perf_counter()
+    flt = {"created_at": {"$gte": since}} if since else {}
+    total = max(1, inspections_col.count_documents(flt) + sessions_col.count_documents(flt))
+    ops: List[UpdateOne] = []
+    stats = {"inspections": 0, "sessions": 0, "images": 0, "computed": 0, "skipped": 0, "without_hashes": 0}
+
+    def add(entry: Dict[str, Any], session_id: str, plate: Optional[str]):
+        doc = index_doc(entry, session_id, plate)
+        ops.append(UpdateOne({"analysis_id": doc["analysis_id"]}, {"$setOnInsert": doc}, upsert=True))
+        stats["images"] += 1
+        if len(ops) >= batch_size:
+            flush()
+
+    def flush():
+        if ops:
+            image_hashes_col.bulk_write(ops, ordered=False)
+            ops.clear()
+        if progress:
+            progress("rebuild", min(0.99, (stats["inspections"] + stats["sessions"]) / total))
+
+    for ins in inspections_col.find(flt, {"inspection_id": 1, "session_id": 1, "plate": 1, "image_hashes": 1}).batch_size(200):
+        stats["inspections"] += 1
+        if ins.get("image_hashes") is None:
+            stats["without_hashes"] += 1  # finalizada antes de guardar hashes; sin bytes para recalcular
+            continue
+        for h in ins["image_hashes"]:
+            if h.get("phash") and h.get("analysis_id"):
+                add(h, ins.get("session_id") or ins["inspection_id"], ins.get("plate"))
+            else:
+                stats["skipped"] += 1
+
+    proj = {"session_id": 1, "images.raw": 1, "images.plate": 1, "images.photo_key": 1,
+            "images.analysis.analysis_id": 1, "images.analysis.phash": 1, "images.analysis.dhash": 1,
+            "images.analysis.duplicate_of": 1}
+    for s in sessions_col.find(flt, proj).batch_size(50):
+        stats["sessions"] += 1
+        for i, img in enumerate(s.get("images") or []):
+            analysis = img.get("analysis") or {}
+            if (analysis.get("duplicate_of") or {}).get("reused"):
+                stats["skipped"] += 1  # el original ya está indexado
+                continue
+            hashes = {k: analysis[k] for k in ("phash", "dhash") if analysis.get(k)}
+            if "phash" not in hashes:
+                hashes = perceptual_hashes(img.get("raw"))
+                if not hashes:
+                    stats["skipped"] += 1
+                    continue
+                stats["computed"] += 1
+            add({**hashes, "analysis_id": analysis.get("analysis_id") or f"{s['session_id']}:{i}",
+                 "photo_key": img.get("photo_key")}, s["session_id"], img.get("plate"))
+    flush()
+    stats["elapsed_s"] = round(time.perf_counter() - t0, 2)
+    log_event("image_index_rebuilt", **stats)
+    return stats
+
+def _rebuild_job(job: Dict[str, Any], progress) -> Dict[str, Any]:
+    p = job["params"]
+    since = datetime.fromisoformat(p["since"]) if p.get("since") else None
+    return rebuild(batch_size=p.get("batch_size", 500), since=since, progress=progress)
+
+# Un rebuild a la vez en todo el cluster (job activo único por clave); cada
+# worker incorpora lo reindexado en su próximo sync
+REBUILD_JOB_KEY = "image-index"
+rebuild_queue = JobQueue("image_index_rebuild", _rebuild_job, workers=1, maxsize=1)
+
+index = ImageHashIndex()
@@ -6,6 +6,7 @@ from prometheus_client import Counter
 from ..config import settings
 from ..logging_utils import log_event
 from ..repositories import session_repo as repo
+from ..repositories.session_write_buffer import SessionWriteBuffer
 from ..services.vehicle_service import get_or_create_vehicle
 from ..yolo_model import detect_damage, detect_parts
 from ..utils.color_detection import detect_dominant_color
@@ -155,11 +156,13 @@ async def analyze_image(
         "quality": {"ok": quality_ok},
         "session": {"images": existing_images_count + 1}
     }
-    rule_fraud, rule_review = evaluate_rules(context)
+    rule_fraud, rule_review = evaluate_rules(context, skip_missing=True)
     fraud_flags = list(set(fraud_flags + rule_fraud))
     review_flags = list(set(review_flags + rule_review))
 
-    repo.append_image(session_id, {
+    # Imagen, nota y flags en un solo bulk_write
+    buf = SessionWriteBuffer(session_id)
+    buf.append_image({
         "image_hash": img_hash,
         "browser_lat": browser_lat,
         "browser_lon": browser_lon,
@@ -168,11 +171,12 @@ async def analyze_image(
         "analysis": analysis
     })
     if note:
-        repo.add_note(session_id, note)
+        buf.add_note(note)
     for f in fraud_flags:
-        repo.add_flag(session_id, f)
+        buf.add_flag(f)
     for rf in review_flags:
-        repo.add_review_flag(session_id, rf)
+        buf.add_review_flag(rf)
+    await buf.flush()
 
     log_event(
         "analyze_done",
@@ -4,6 +4,8 @@ from typing import Dict, Any, List, Tuple
 from ..database import inspections_col
 from ..utils.exif_geo import geo_stats
 from ..config import settings
+# Builder único del reporte (antes había uno propio aquí con otro formato)
+from .markdown_builder import build_markdown_report  # noqa: F401
 
 def _aggregate_colors(colors: List[str])->Dict[str,Any]:
     c=[x for x in colors if x]
@@ -61,45 +63,3 @@ def save_inspection(plate, damage, parts_presence, missing_parts,
     inspections_col.insert_one(doc)
     doc.pop("_id",None)
     return doc
-
-def build_markdown_report(inspection: Dict[str,Any])->str:
-    dmg=len(inspection.get("damage_detections",[]))
-    miss=len(inspection.get("missing_parts",[]))
-    colors=inspection.get("colors",{})
-    geo=inspection.get("geo",{})
-    lines=[
-        "# Reporte de Inspección Vehicular",
-        f"- ID: {inspection['inspection_id']}",
-        f"- Placa: {inspection['plate']}",
-        f"- Fecha: {inspection['timestamp']}",
-        f"- Modelo YOLO: {inspection.get('model_version')} ({inspection.get('model_sha')})",
-        "",
-        "## Resumen",
-        f"- Daños: {dmg}",
-        f"- Partes faltantes: {miss}",
-        f"- Color consenso: {colors.get('consensus')}",
-        f"- Estado: {inspection['status']}",
-    ]
-    if inspection.get("verdict"):
-        lines.append(f"- Veredicto: {inspection['verdict']['verdict']} (score {inspection['verdict']['score']})")
-    if inspection.get("review_flags"):
-        lines.append(f"- Flags revisión: {', '.join(inspection['review_flags'])}")
-    if inspection.get("fraud_flags"):
-        lines.append(f"- Flags fraude: {', '.join(inspection['fraud_flags'])}")
-    lines += ["", "## Geolocalización"]
-    if geo:
-        lines.append(f"- Estado geo: {geo.get('status')} | max_dist={geo.get('stats',{}).get('max_dist','?')} m")
-    lines += ["", "## Daños"]
-    for d in inspection.get("damage_detections",[]):
-        lines.append(f"- {d['label']} (conf {d['confidence']:.2f}) box={d['box']}")
-    lines += ["", "## Partes"]
-    for p,info in inspection.get("parts_presence",{}).items():
-        est="OK" if info["present"] else "FALTA"
-        lines.append(f"- {p}: {est} (conf {info['confidence']:.2f})")
-    lines += ["", "## Notas"]
-    notes=inspection.get("notes",[])
-    if notes:
-        for n in notes: lines.append(f"- {n}")
-    else:
-        lines.append("- (sin notas)")
-    return "\n".join(lines)
\ No newline at end of file
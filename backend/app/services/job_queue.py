@@ -0,0 +1,211 @@
+import asyncio, os, socket, uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from anyio import from_thread
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter, Gauge
+from pymongo.errors import DuplicateKeyError
+from ..config import settings
+from ..database import jobs_col
+from ..database_async import jobs_acol
+from ..logging_utils import log_event
+from ..websocket_manager import manager
+
+JOBS_TOTAL = Counter("jobs_total", "Jobs procesados", ["kind", "status"])
+JOBS_QUEUED = Gauge("jobs_queued", "Jobs en cola", ["kind"])
+
+# handler(job, progress) -> resultado (dict pequeño, se guarda en el job)
+JobHandler = Callable[[Dict[str, Any], Callable[[str, float], None]], Dict[str, Any]]
+
+# Identifica a este proceso como dueño del lease de los jobs que corre
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def _now():
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class QueueFullError(Exception):
+    pass
+
+class JobQueue:
+    """
+    Cola persistida en jobs_col con N workers asyncio por proceso; el handler
+    síncrono corre en el threadpool. Los workers reclaman jobs de Mongo con
+    find_one_and_update (lease de JOB_LEASE_S renovado mientras corre), así un
+    job encolado o en curso en un proceso que murió lo retoma cualquier otro
+    al vencer el lease (hasta JOB_MAX_ATTEMPTS). El job activo por
+    (kind, session_id) es único por índice único sparse sobre 'active_key'. El progreso
+    se emite por el WebSocket de la sesión como '<kind>:progress' /
+    '<kind>:done' / '<kind>:error'.
+    """
+    def __init__(self, kind: str, handler: JobHandler, workers: int, maxsize: int):
+        self.kind = kind
+        self._handler = handler
+        self._workers_n = max(1, workers)
+        self._maxsize = maxsize
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self._workers_n)]
+        log_event("job_queue_started", kind=self.kind, workers=self._workers_n, owner=OWNER)
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def find_active(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await jobs_acol.find_one(
+            {"kind": self.kind, "session_id": session_id, "status": {"$in": ["queued", "running"]}},
+            {"_id": 0}
+        )
+
+    async def _queued_count(self) -> int:
+        n = await jobs_acol.count_documents({"kind": self.kind, "status": "queued"})
+        JOBS_QUEUED.labels(self.kind).set(n)
+        return n
+
+    async def enqueue(self, session_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Encola o devuelve el job activo de la sesión (dedup atómico por índice único)."""
+        if not self._tasks:
+            await self.start()
+        if await self._queued_count() >= self._maxsize:
+            raise QueueFullError(self.kind)
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": self.kind,
+            "session_id": session_id,
+            "params": params,
+            "status": "queued",
+            "active_key": f"{self.kind}:{session_id}",  # solo mientras está activo
+            "step": None,
+            "progress": 0.0,
+            "result": None,
+            "error": None,
+            "attempts": 0,
+            "owner": None,
+            "lease_until": None,
+            "created_at": datetime.utcnow(),  # fecha BSON: índice TTL
+            "updated_at": _now()
+        }
+        try:
+            await jobs_acol.insert_one(dict(job))
+        except DuplicateKeyError:
+            existing = await self.find_active(session_id)
+            if existing is not None:
+                return existing
+            await jobs_acol.insert_one(dict(job))  # el activo terminó entre medio
+        JOBS_QUEUED.labels(self.kind).inc()
+        self._wake.set()
+        await manager.broadcast(session_id, {
+            "event": f"{self.kind}:queued", "session_id": session_id, "job_id": job["job_id"]
+        })
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await jobs_acol.find_one({"job_id": job_id}, {"_id": 0})
+
+    def _update(self, job_id: str, **fields):
+        # Desde el hilo del handler (progreso)
+        jobs_col.update_one({"job_id": job_id}, {"$set": {**fields, "updated_at": _now()}})
+
+    async def _aupdate(self, job_id: str, **fields):
+        await jobs_acol.update_one({"job_id": job_id, "owner": OWNER}, {"$set": {**fields, "updated_at": _now()}})
+
+    async def _finish(self, job_id: str, **fields):
+        # Estado terminal: libera el slot único de job activo de la sesión
+        await jobs_acol.update_one({"job_id": job_id, "owner": OWNER},
+                                   {"$set": {**fields, "updated_at": _now()}, "$unset": {"active_key": ""}})
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        """El job en cola más viejo, o uno 'running' con lease vencido (su proceso murió)."""
+        now = datetime.utcnow()
+        claim = {"status": "running", "owner": OWNER, "lease_until": now + timedelta(seconds=settings.JOB_LEASE_S),
+                 "updated_at": _now()}
+        prev = await jobs_acol.find_one_and_update(
+            {"kind": self.kind, "$or": [{"status": "queued"},
+                                        {"status": "running", "lease_until": {"$lt": now}},
+                                        {"status": "running", "lease_until": None}]},  # previos al lease
+            {"$set": claim, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)], projection={"_id": 0}
+        )
+        if prev is None:
+            return None
+        job = {**prev, **claim, "attempts": prev.get("attempts", 0) + 1}
+        if job["attempts"] > 1:
+            log_event("job_recovered", kind=self.kind, job_id=job["job_id"], session_id=job["session_id"],
+                      attempts=job["attempts"])
+        return job
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_S / 3)
+            await jobs_acol.update_one(
+                {"job_id": job_id, "owner": OWNER},
+                {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_S)}}
+            )
+
+    async def _next(self) -> Dict[str, Any]:
+        while True:
+            job = await self._claim()
+            if job is not None:
+                return job
+            # Sin trabajo: espera un enqueue local o sondea (jobs de otros procesos / leases vencidos)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.JOB_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+
+    def _run_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        session_id = job["session_id"]
+
+        def progress(step: str, pct: float):
+            self._update(job["job_id"], step=step, progress=round(pct, 3))
+            from_thread.run(manager.broadcast, session_id, {
+                "event": f"{self.kind}:progress",
+                "session_id": session_id,
+                "job_id": job["job_id"],
+                "step": step,
+                "progress": round(pct, 3)
+            })
+
+        return self._handler(job, progress)
+
+    async def _worker(self, idx: int):
+        while True:
+            job = await self._next()
+            await self._queued_count()
+            job_id, session_id = job["job_id"], job["session_id"]
+            if job["attempts"] > settings.JOB_MAX_ATTEMPTS:
+                await self._fail(job_id, session_id, "interrupted")
+                continue
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                result = await run_in_threadpool(self._run_job, job)
+            except asyncio.CancelledError:
+                # Apagado ordenado: vuelve a la cola para otro proceso
+                await self._aupdate(job_id, status="queued", lease_until=None)
+                raise
+            except Exception as e:
+                await self._fail(job_id, session_id, str(e) or type(e).__name__)
+            else:
+                await self._finish(job_id, status="done", step="done", progress=1.0, result=result)
+                JOBS_TOTAL.labels(self.kind, "done").inc()
+                await manager.broadcast(session_id, {
+                    "event": f"{self.kind}:done", "session_id": session_id, "job_id": job_id, **result
+                })
+            finally:
+                heartbeat.cancel()
+
+    async def _fail(self, job_id: str, session_id: str, error: str):
+        await self._finish(job_id, status="failed", error=error)
+        JOBS_TOTAL.labels(self.kind, "failed").inc()
+        log_event("job_failed", kind=self.kind, job_id=job_id, session_id=session_id, error=error)
+        await manager.broadcast(session_id, {
+            "event": f"{self.kind}:error", "session_id": session_id, "job_id": job_id, "error": error
+        })
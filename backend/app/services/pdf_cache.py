@@ -0,0 +1,254 @@
+import hashlib, os, tempfile, threading, time
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional
+import bson
+from prometheus_client import Counter
+from ..config import settings
+from ..logging_utils import log_event
+
+# Subir al cambiar el layout del PDF: invalida todo lo cacheado
+PDF_RENDER_VERSION = "4"
+CHUNK_SIZE = 64 * 1024
+
+PDF_CACHE = Counter("pdf_cache_total", "Descargas de PDF por resultado de caché", ["result"])
+
+Renderer = Callable[[BinaryIO], None]
+
+def content_hash(doc: Dict[str, Any]) -> str:
+    """sha256 del documento de inspección (BSON, sin _id) + versión de render."""
+    body = {k: v for k, v in doc.items() if k != "_id"}
+    h = hashlib.sha256(PDF_RENDER_VERSION.encode())
+    h.update(bson.encode(body))
+    return h.hexdigest()
+
+class CachedPdf:
+    """PDF listo para servir por rangos sin cargarlo entero en memoria."""
+    def __init__(self, key: str, size: int, opener: Callable[[], BinaryIO]):
+        self.key, self.size, self._opener = key, size, opener
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.key[:32]}"'
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        end = self.size - 1 if end is None else end
+        with self._opener() as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+class _KeyLocks:
+    # Dos descargas simultáneas de un PDF nuevo lo renderizan una sola vez.
+    # Cada entrada lleva cuántos hilos la usan: se borra con el último, nunca
+    # mientras otro espera (si no, el siguiente crearía un lock nuevo y renderizaría de nuevo)
+    def __init__(self):
+        self._locks: Dict[str, list] = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: str):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._guard:
+            return len(self._locks)
+
+class MemoryPdfCache:
+    """Sin caché (PDF_CACHE_BACKEND=none): renderiza en memoria en cada descarga."""
+    name = "none"
+
+    def get(self, key: str) -> Optional[CachedPdf]:
+        return None
+
+    def store(self, key: str, render: Renderer) -> CachedPdf:
+        buf = BytesIO()
+        render(buf)
+        data = buf.getvalue()
+        return CachedPdf(key, len(data), lambda: BytesIO(data))
+
+class DiskPdfCache:
+    """
+    Un archivo por hash en PDF_CACHE_DIR. El render escribe a un temporal en
+    el mismo directorio y se publica con os.replace (atómico). Eviction LRU
+    por mtime (se toca en cada hit) cuando el total supera max_bytes.
+    """
+    name = "disk"
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.dir = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.dir, f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[CachedPdf]:
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return CachedPdf(key, size, lambda: open(path, "rb"))
+
+    def store(self, key: str, render: Renderer) -> CachedPdf:
+        fd, tmp = tempfile.mkstemp(dir=self.dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                render(f)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._evict(keep=key)
+        return self.get(key)
+
+    def _evict(self, keep: str):
+        entries = []
+        for name in os.listdir(self.dir):
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(e[1] for e in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == f"{keep}.pdf":
+                continue
+            try:
+                os.remove(os.path.join(self.dir, name))
+                total -= size
+            except FileNotFoundError:
+                pass
+        log_event("pdf_cache_size", backend=self.name, bytes=total)
+
+class GridFSPdfCache:
+    """
+    GridFS (bucket PDF_CACHE_BUCKET): compartido entre workers/instancias.
+    metadata.accessed_at se actualiza en cada hit; al superar max_bytes se
+    borran los menos usados.
+    """
+    name = "gridfs"
+
+    def __init__(self, bucket: str, max_bytes: int):
+        import gridfs
+        from ..database import db
+        self._bucket = gridfs.GridFSBucket(db, bucket_name=bucket)
+        self._files = db[f"{bucket}.files"]
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[CachedPdf]:
+        meta = self._files.find_one_and_update(
+            {"filename": key}, {"$set": {"metadata.accessed_at": datetime.utcnow()}},
+            projection={"_id": 1, "length": 1}
+        )
+        if not meta:
+            return None
+        file_id = meta["_id"]
+        return CachedPdf(key, meta["length"], lambda: self._bucket.open_download_stream(file_id))
+
+    def store(self, key: str, render: Renderer) -> CachedPdf:
+        # Spool: el PDF pasa a disco si supera 8 MB en vez de quedar en memoria
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as f:
+            render(f)
+            f.seek(0)
+            self._bucket.upload_from_stream(key, f, metadata={"accessed_at": datetime.utcnow()})
+        self._evict(keep=key)
+        return self.get(key)
+
+    def _evict(self, keep: str):
+        total = 0
+        for meta in self._files.find({}, {"length": 1, "filename": 1}).sort("metadata.accessed_at", -1):
+            total += meta["length"]
+            if total > self.max_bytes and meta["filename"] != keep:
+                self._bucket.delete(meta["_id"])
+
+def build_cache(kind: Optional[str] = None):
+    kind = (kind or settings.PDF_CACHE_BACKEND).lower()
+    max_bytes = settings.PDF_CACHE_MAX_MB * 1024 * 1024
+    if kind == "gridfs":
+        return GridFSPdfCache(settings.PDF_CACHE_BUCKET, max_bytes)
+    if kind == "disk":
+        return DiskPdfCache(settings.PDF_CACHE_DIR, max_bytes)
+    return MemoryPdfCache()
+
+_cache = None
+_locks = _KeyLocks()
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = build_cache()
+    return _cache
+
+def lookup(doc: Dict[str, Any]) -> Optional[CachedPdf]:
+    """Solo consulta el caché (sin renderizar)."""
+    hit = get_cache().get(content_hash(doc))
+    if hit:
+        PDF_CACHE.labels("hit").inc()
+    return hit
+
+def get_or_render(doc: Dict[str, Any], render: Callable[[Dict[str, Any], BinaryIO], None]) -> CachedPdf:
+    """Bloqueante (threadpool): hit por hash de contenido o render único por clave."""
+    cache = get_cache()
+    key = content_hash(doc)
+    hit = cache.get(key)
+    if hit:
+        PDF_CACHE.labels("hit").inc()
+        return hit
+    with _locks.hold(key):
+        hit = cache.get(key)
+        if hit:
+            PDF_CACHE.labels("hit").inc()
+            return hit
+        t0 = time.perf_counter()
+        pdf = cache.store(key, lambda out: render(doc, out))
+        PDF_CACHE.labels("miss").inc()
+        log_event("pdf_rendered", inspection_id=doc.get("inspection_id"), backend=cache.name,
+                  bytes=pdf.size, ms=round((time.perf_counter() - t0) * 1000, 1))
+    return pdf
+
+def parse_range(header: Optional[str], size: int):
+    """
+    'bytes=a-b' | 'bytes=a-' | 'bytes=-n' -> (start, end) inclusivo.
+    None si no hay Range (o es multi-rango: se sirve completo);
+    ValueError si no es satisfacible (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[6:].strip().partition("-")
+    try:
+        if not start_s:
+            n = int(end_s)
+            if n <= 0:
+                raise ValueError(header)
+            return max(0, size - n), size - 1
+        start = int(start_s)
+        end = min(int(end_s), size - 1) if end_s else size - 1
+    except ValueError:
+        raise ValueError(header)
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
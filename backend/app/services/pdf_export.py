@@ -1,25 +1,38 @@
 from io import BytesIO
-from typing import Dict, Any, List
+from typing import Dict, Any, List, BinaryIO, Optional, Tuple
+from PIL import Image as PILImage
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
-from textwrap import wrap
 import base64
 import datetime
+from ..config import settings
 
-def _wrap(text: str, width: int = 110) -> str:
-    out = []
-    for line in text.splitlines():
-        if not line.strip():
-            out.append("")
-            continue
-        out.extend(wrap(line, width=width))
-    return "\n".join(out)
+def make_thumbnail(img_bytes: bytes, max_w: float, max_h: float) -> Optional[Tuple[bytes, float, float]]:
+    """
+    JPEG reducido al tamaño impreso (puntos -> px a PDF_THUMB_DPI). Con draft()
+    el decoder JPEG ya escala al leer: no se materializa la imagen completa.
+    Devuelve (jpeg, ancho_pt, alto_pt) o None si no es una imagen válida.
+    """
+    try:
+        with PILImage.open(BytesIO(img_bytes)) as im:
+            iw, ih = im.size
+            scale = min(1.0, max_w / float(iw), max_h / float(ih))
+            w_pt, h_pt = iw * scale, ih * scale
+            px = (max(1, int(w_pt / 72.0 * settings.PDF_THUMB_DPI)), max(1, int(h_pt / 72.0 * settings.PDF_THUMB_DPI)))
+            im.draft("RGB", px)
+            thumb = im.convert("RGB")
+            thumb.thumbnail(px)
+            out = BytesIO()
+            thumb.save(out, "JPEG", quality=settings.PDF_THUMB_QUALITY, optimize=True)
+            return out.getvalue(), w_pt, h_pt
+    except Exception:
+        return None
 
-def build_images_table(images: List[Dict[str, Any]], max_w: int = 520):
+def build_images_table(images: List[Dict[str, Any]], max_w: int = 520, max_h: int = 620):
     """
     Crea flujo (list) de elementos reportlab con miniaturas y datos de calidad.
     Cada imagen en session_repo debería tener estructura {"analysis": {...}, "raw_bytes": ..., etc}.
@@ -73,84 +86,57 @@ def build_images_table(images: List[Dict[str, Any]], max_w: int = 520):
         if not img_bytes:
             continue
         flow.append(Paragraph(f"<b>Imagen {idx}</b>", styles["Normal"]))
-        try:
-            img = ImageReader(BytesIO(img_bytes))
-            iw, ih = img.getSize()
-            scale = 1.0
-            if iw > max_w:
-                scale = max_w / float(iw)
-            w = iw * scale
-            h = ih * scale
-            # Canvas image will be added later (we are using SimpleDocTemplate -> need flowable)
+        # Miniatura JPEG al tamaño impreso en vez del original (memoria y tamaño del PDF)
+        thumb = make_thumbnail(img_bytes, max_w, max_h)
+        img_bytes = None
+        if thumb:
             from reportlab.platypus import Image
-            flow.append(Image(BytesIO(img_bytes), width=w, height=h))
-        except Exception:
+            data, w, h = thumb
+            flow.append(Image(BytesIO(data), width=w, height=h))
+        else:
             flow.append(Paragraph("No se pudo renderizar imagen.", styles["Italic"]))
         flow.append(Spacer(1, 6))
     return flow
 
-def markdown_to_pdf_bytes(markdown_text: str, doc_meta: Dict[str, Any]) -> bytes:
-    """
-    Conversión simple Markdown -> PDF (subset):
-    - Negritas ** ** y encabezados # se dejan como texto plano estilizado parcial.
-    - Para un reporte formal podrías migrar a md->HTML->WeasyPrint.
-    """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4,
-                            leftMargin=36, rightMargin=36,
-                            topMargin=42, bottomMargin=42)
-    story = []
-    styles = getSampleStyleSheet()
-
-    title = doc_meta.get("pdf_title") or "Reporte Inspección"
-    story.append(Paragraph(f"<b>{title}</b>", styles["Title"]))
-    story.append(Spacer(1, 12))
-    story.append(Paragraph(f"Generado: {datetime.datetime.utcnow().isoformat()}Z", styles["Normal"]))
-    story.append(Spacer(1, 12))
+def _doc_template(out: BinaryIO) -> SimpleDocTemplate:
+    return SimpleDocTemplate(out, pagesize=A4,
+                             leftMargin=36, rightMargin=36,
+                             topMargin=42, bottomMargin=42)
 
-    # Procesamiento simple del markdown a párrafos
-    # Partimos por secciones separadas por --- ya producido en build_markdown_report
-    sections = markdown_text.split("\n---\n")
-    for sec in sections:
-        sec_stripped = sec.strip()
-        if not sec_stripped:
-            continue
-        # Quitar # inicial para encabezados
-        lines = sec_stripped.splitlines()
-        heading = None
-        if lines and lines[0].startswith("#"):
-            heading = lines[0].lstrip("# ").strip()
-            content = "\n".join(lines[1:])
-        else:
-            content = sec_stripped
-        if heading:
-            story.append(Paragraph(f"<b>{heading}</b>", styles["Heading3"]))
-        # Reemplazo muy básico de **bold**
-        content = content.replace("**", "")
-        # persist wrap
-        content = _wrap(content, width=115)
-        for paragraph in content.split("\n\n"):
-            story.append(Paragraph(paragraph.replace("\n", "<br/>"), styles["BodyText"]))
-            story.append(Spacer(1, 4))
-        story.append(Spacer(1, 8))
+def _title_story(title: str, styles) -> List[Any]:
+    return [
+        Paragraph(f"<b>{title}</b>", styles["Title"]),
+        Spacer(1, 12),
+        Paragraph(f"Generado: {datetime.datetime.utcnow().isoformat()}Z", styles["Normal"]),
+        Spacer(1, 12),
+    ]
 
-    # Adjuntar tabla de imágenes si se pasó (desde build_pdf_report)
-    images_list = doc_meta.get("images_list")
-    if images_list:
-        story.extend(build_images_table(images_list))
+def _full_meta(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "pdf_title": doc.get("pdf_title") or "Reporte Inspección Vehicular",
+        "images_list": doc.get("images", [])
+    }
 
-    doc.build(story)
+def build_full_pdf(doc: Dict[str, Any]) -> bytes:
+    """
+    Crea el PDF completo (secciones del reporte + miniaturas de imágenes)
+    desde el documento de inspección.
+    """
+    buffer = BytesIO()
+    write_full_pdf(doc, buffer)
     return buffer.getvalue()
 
-def build_full_pdf(doc: Dict[str, Any]) -> bytes:
+def write_full_pdf(doc: Dict[str, Any], out: BinaryIO, model: Optional[Dict[str, Any]] = None):
     """
-    Crea el PDF completo usando el markdown ya existente + miniaturas de imágenes.
-    doc debe contener 'report_markdown' y opcional 'images'.
+    Flowables directos desde el modelo del reporte (report_model): no
+    re-parsea el markdown persistido.
     """
-    md = doc.get("report_markdown", "")
-    images = doc.get("images", [])
-    meta = {
-        "pdf_title": doc.get("pdf_title") or "Reporte Inspección Vehicular",
-        "images_list": images
-    }
-    return markdown_to_pdf_bytes(md, meta)
\ No newline at end of file
+    from .report_model import build_report_model, render_flowables
+    meta = _full_meta(doc)
+    styles = getSampleStyleSheet()
+    story = _title_story(meta["pdf_title"], styles)
+    story.extend(render_flowables(model or build_report_model(doc), styles))
+    if meta["images_list"]:
+        story.append(Spacer(1, 8))
+        story.extend(build_images_table(meta["images_list"]))
+    _doc_template(out).build(story)
\ No newline at end of file
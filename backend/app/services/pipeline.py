@@ -1,6 +1,7 @@
 from typing import Dict, Any
 import cv2, numpy as np
 from ..config import settings
+from ..telemetry import stage
 from ..yolo_model import infer_damage, infer_parts
 from .image_preprocess import enhance_for_damage, nms_merge
 from .color_exif import dominant_color, extract_exif_gps
@@ -10,6 +11,7 @@ from .illumination import illumination_summary
 from .ocr import ocr_text, extract_plate_candidates, extract_vin_candidates
 from .tamper import analyze_tamper
 from .scratch_severity import classify_scratch_severity
+from .analysis_progress import AnalysisProgress
 
 OCR_ALLOWED_PHOTOS = {"front", "rear", "vin"}
 
@@ -23,6 +25,23 @@ def _background_policy(photo_key: str, bg_cls: dict | None):
             return {"inconsistent": True, "expected": "outdoor"}
     return {"inconsistent": False}
 
+def assign_damage_parts(damage: list, parts_presence: Dict[str, Any], min_overlap: float = 0.3):
+    """
+    Asocia cada daño a la parte presente cuya caja cubre la mayor fracción
+    del daño (d["part"]); "unknown" si ninguna cubre min_overlap. Alimenta
+    la línea de tiempo de daños por placa.
+    """
+    boxes = [(name, p["box"]) for name, p in parts_presence.items() if p.get("present") and p.get("box")]
+    for d in damage:
+        x1, y1, x2, y2 = d["box"]
+        area = max(1e-6, (x2 - x1) * (y2 - y1))
+        best, best_f = "unknown", min_overlap
+        for name, (px1, py1, px2, py2) in boxes:
+            inter = max(0.0, min(x2, px2) - max(x1, px1)) * max(0.0, min(y2, py2) - max(y1, py1))
+            if inter / area >= best_f:
+                best, best_f = name, inter / area
+        d["part"] = best
+
 async def run_full_pipeline(
     session_id: str,
     plate: str,
@@ -32,11 +51,33 @@ async def run_full_pipeline(
     conf_parts: float | None,
     note: str | None,
     browser_lat: float | None,
-    browser_lon: float | None
+    browser_lon: float | None,
+    progress: AnalysisProgress | None = None,
+    plan: Dict[str, bool] | None = None
 ) -> Dict[str, Any]:
+    """
+    Con progress emite analyze:progress al cerrar cada etapa visible
+    (damage, parts, color, ocr, tamper) y corta con AnalysisCancelled entre
+    etapas si la sesión pidió cancelar. plan (perfil + admission) puede
+    apagar etapas opcionales: dual_pass, ocr, tamper_cnn, scratch_severity,
+    background.
+    """
+    plan = plan or {}
+
+    async def emit(step: str, data: Dict[str, Any]):
+        if progress:
+            await progress.emit(step, data)
+
+    def check(step: str):
+        if progress:
+            progress.check(step)
+
     cd = conf_damage or settings.DEFAULT_CONF_DAMAGE
     cp = conf_parts or settings.DEFAULT_CONF_PARTS
-    bgr = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+    with stage("decode") as rec:
+        bgr = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            rec["outcome"] = "failed"
     if bgr is None:
         return {
             "damage": [],
@@ -47,35 +88,61 @@ async def run_full_pipeline(
             "exif_geo": None
         }
     rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-    seg_mask, seg_cov = vehicle_mask(rgb)
-    damage_primary = infer_damage(img_bytes, cd)
+    with stage("segmentation"):
+        seg_mask, seg_cov = vehicle_mask(rgb)
+    with stage("damage_primary"):
+        damage_primary = infer_damage(img_bytes, cd)
     damage_enhanced = []
-    if settings.ENABLE_IMAGE_ENHANCEMENT and settings.ENABLE_DUAL_PASS_DAMAGE:
-        enhanced = enhance_for_damage(rgb)
-        _, buf = cv2.imencode(".jpg", cv2.cvtColor(enhanced, cv2.COLOR_RGB2BGR))
-        damage_enhanced = infer_damage(buf.tobytes(), cd)
+    if settings.ENABLE_IMAGE_ENHANCEMENT and settings.ENABLE_DUAL_PASS_DAMAGE and plan.get("dual_pass", True):
+        check("damage")
+        with stage("damage_enhanced"):
+            enhanced = enhance_for_damage(rgb)
+            _, buf = cv2.imencode(".jpg", cv2.cvtColor(enhanced, cv2.COLOR_RGB2BGR))
+            damage_enhanced = infer_damage(buf.tobytes(), cd)
     all_damage = nms_merge(damage_primary + damage_enhanced, [], settings.MERGE_IOU_THRESHOLD)
     if seg_mask is not None:
         all_damage = filter_detections_by_mask(all_damage, seg_mask)
-    if settings.ENABLE_SCRATCH_SEVERITY:
-        for d in all_damage:
-            if d.get("label") == "scratch":
-                d["scratch_severity"] = classify_scratch_severity(rgb, d["box"])
-    parts_presence = infer_parts(img_bytes, cp)
+    if settings.ENABLE_SCRATCH_SEVERITY and plan.get("scratch_severity", True):
+        check("damage")
+        with stage("scratch_severity"):
+            for d in all_damage:
+                if d.get("label") == "scratch":
+                    d["scratch_severity"] = classify_scratch_severity(rgb, d["box"])
+    await emit("damage", {"damage": all_damage})
+    with stage("parts"):
+        parts_presence = infer_parts(img_bytes, cp)
     missing_parts = [k for k,v in parts_presence.items() if not v.get("present")]
-    color_info = dominant_color(img_bytes)
-    exif_gps = extract_exif_gps(img_bytes)
-    illum = illumination_summary(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY))
-    bg_cls = classify_background(rgb)
+    assign_damage_parts(all_damage, parts_presence)
+    await emit("parts", {"parts_presence": parts_presence, "missing_parts": missing_parts})
+    with stage("color"):
+        color_info = dominant_color(img_bytes)
+    await emit("color", {"color_detected": color_info})
+    with stage("exif"):
+        exif_gps = extract_exif_gps(img_bytes)
+    with stage("illumination"):
+        illum = illumination_summary(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY))
+    bg_cls = None
+    if plan.get("background", True):
+        with stage("background"):
+            bg_cls = classify_background(rgb)
     bg_policy = _background_policy(photo_key, bg_cls)
     ocr_results = []
     plate_candidates = []
     vin_candidates = []
-    if photo_key in OCR_ALLOWED_PHOTOS:
-        ocr_results = ocr_text(img_bytes)
-        plate_candidates = extract_plate_candidates(ocr_results)
-        vin_candidates = extract_vin_candidates(ocr_results)
-    tamper = analyze_tamper(img_bytes)
+    run_ocr = photo_key in OCR_ALLOWED_PHOTOS and plan.get("ocr", True)
+    if run_ocr:
+        with stage("ocr"):
+            ocr_results = ocr_text(img_bytes)
+            plate_candidates = extract_plate_candidates(ocr_results)
+            vin_candidates = extract_vin_candidates(ocr_results)
+    await emit("ocr", {
+        "skipped": not run_ocr,
+        "plate_candidates": plate_candidates,
+        "vin_candidates": vin_candidates
+    })
+    with stage("tamper"):
+        tamper = analyze_tamper(img_bytes, use_cnn=plan.get("tamper_cnn", True))
+    await emit("tamper", {"tamper": tamper})
     return {
         "damage": all_damage,
         "parts_presence": parts_presence,
@@ -0,0 +1,96 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from prometheus_client import Counter, Gauge
+from ..config import settings
+from ..logging_utils import log_event
+
+# Etapas opcionales por perfil (de mayor a menor fidelidad). Lo que el
+# perfil deja en True todavía depende de los ENABLE_* y de admission.
+PROFILES: Dict[str, Dict[str, bool]] = {
+    "full": {"dual_pass": True, "ocr": True, "tamper_cnn": True, "scratch_severity": True, "background": True},
+    "balanced": {"dual_pass": False, "ocr": True, "tamper_cnn": True, "scratch_severity": True, "background": False},
+    "fast": {"dual_pass": False, "ocr": False, "tamper_cnn": False, "scratch_severity": False, "background": False},
+}
+ORDER = ("full", "balanced", "fast")
+
+PROFILE_ACTIVE = Gauge("pipeline_profile_active", "Perfil activo (1 = activo)", ["profile"])
+PROFILE_SWITCHES = Counter("pipeline_profile_switches_total", "Cambios automáticos de perfil", ["to", "reason"])
+PROFILE_USED = Counter("pipeline_profile_used_total", "Análisis por perfil", ["profile"])
+
+def lowest(names) -> Optional[str]:
+    """Perfil de menor fidelidad entre los usados (None si no hay)."""
+    ranked = [n for n in names if n in PROFILES]
+    return max(ranked, key=ORDER.index) if ranked else None
+
+class ProfileSelector:
+    """
+    PIPELINE_PROFILE fija el perfil; con "auto" se elige por p95 de analyze
+    (ventana PROFILE_WINDOW_S) y profundidad de la cola de admission. Baja
+    de fidelidad apenas se cruza un umbral; vuelve a subir solo tras
+    PROFILE_COOLDOWN_S y con la carga bajo el 80% del umbral (histéresis).
+    """
+    def __init__(self):
+        self._samples: Deque[Tuple[float, float]] = deque()
+        self.current = "full"
+        self._switched_at = 0.0
+        self._set_gauge()
+
+    def _set_gauge(self):
+        for name in ORDER:
+            PROFILE_ACTIVE.labels(name).set(1 if name == self.current else 0)
+
+    def observe(self, seconds: float):
+        now = time.monotonic()
+        self._samples.append((now, seconds))
+        self._trim(now)
+
+    def _trim(self, now: float):
+        while self._samples and now - self._samples[0][0] > settings.PROFILE_WINDOW_S:
+            self._samples.popleft()
+
+    def p95_ms(self) -> Optional[float]:
+        self._trim(time.monotonic())
+        if len(self._samples) < settings.PROFILE_MIN_SAMPLES:
+            return None
+        vals = sorted(s for _, s in self._samples)
+        return vals[min(len(vals) - 1, int(round(0.95 * (len(vals) - 1))))] * 1000
+
+    def _target(self, p95: Optional[float], queue: int, slack: float = 1.0) -> Tuple[str, str]:
+        p95 = p95 or 0.0
+        if p95 > settings.PROFILE_FAST_P95_MS * slack or queue >= settings.PROFILE_FAST_QUEUE * slack:
+            return "fast", "p95" if p95 > settings.PROFILE_FAST_P95_MS * slack else "queue"
+        if p95 > settings.PROFILE_BALANCED_P95_MS * slack or queue >= settings.PROFILE_BALANCED_QUEUE * slack:
+            return "balanced", "p95" if p95 > settings.PROFILE_BALANCED_P95_MS * slack else "queue"
+        return "full", "recovered"
+
+    def select(self, queue_depth: int = 0) -> str:
+        mode = settings.PIPELINE_PROFILE.lower()
+        if mode in PROFILES:
+            return mode
+        p95 = self.p95_ms()
+        target, reason = self._target(p95, queue_depth)
+        now = time.monotonic()
+        if ORDER.index(target) < ORDER.index(self.current):
+            # Subir de fidelidad: con margen y tras el cooldown
+            target, reason = self._target(p95, queue_depth, slack=0.8)
+            if ORDER.index(target) >= ORDER.index(self.current) or now - self._switched_at < settings.PROFILE_COOLDOWN_S:
+                return self.current
+        if target != self.current:
+            log_event("pipeline_profile_switch", frm=self.current, to=target, reason=reason,
+                      p95_ms=round(p95, 1) if p95 is not None else None, queue=queue_depth)
+            PROFILE_SWITCHES.labels(target, reason).inc()
+            self.current = target
+            self._switched_at = now
+            self._set_gauge()
+        return self.current
+
+    def plan(self, name: str) -> Dict[str, bool]:
+        return dict(PROFILES[name])
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95_ms()
+        return {"mode": settings.PIPELINE_PROFILE, "current": self.current,
+                "p95_ms": round(p95, 1) if p95 is not None else None, "samples": len(self._samples)}
+
+selector = ProfileSelector()
@@ -0,0 +1,158 @@
+import asyncio, copy, random, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Counter
+from pymongo.errors import PyMongoError
+from ..config import settings
+from ..database import drivers_col, vehicles_col
+from ..logging_utils import log_event
+
+CACHE_LOOKUPS = Counter("reference_cache_lookups_total", "Lookups a cachés de referencia", ["cache", "result"])
+
+class DriverPool:
+    """
+    Pool en memoria de conductores (proyección sin _id) para muestrear
+    localmente en vez de $sample por finalize. Si la colección supera
+    DRIVER_POOL_SIZE se carga una muestra de ese tamaño (un $sample por
+    refresco, no por request). Se refresca por intervalo o por change stream.
+    """
+    def __init__(self, size: int, seed_fn: Optional[Callable[[int], Any]] = None):
+        self.size = size
+        self._seed_fn = seed_fn
+        self._docs: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+
+    def refresh(self) -> int:
+        total = drivers_col.estimated_document_count()
+        if total == 0 and self._seed_fn:
+            self._seed_fn(10)
+            total = drivers_col.estimated_document_count()
+        if total > self.size:
+            docs = list(drivers_col.aggregate([{"$sample": {"size": self.size}}, {"$project": {"_id": 0}}]))
+        else:
+            docs = list(drivers_col.find({}, {"_id": 0}))
+        with self._lock:
+            self._docs = docs
+            self.loaded_at = time.time()
+        log_event("driver_pool_refreshed", size=len(docs), total=total)
+        return len(docs)
+
+    def sample(self) -> Optional[Dict[str, Any]]:
+        if not self._docs:
+            self.refresh()
+        with self._lock:
+            if not self._docs:
+                return None
+            doc = random.choice(self._docs)
+        CACHE_LOOKUPS.labels("driver_pool", "hit").inc()
+        return copy.deepcopy(doc)
+
+    def invalidate(self):
+        with self._lock:
+            self._docs = []
+
+class TTLCache:
+    """LRU acotado con expiración por entrada; thread-safe (finalize corre en el threadpool)."""
+    def __init__(self, name: str, ttl_s: float, max_items: int):
+        self.name = name
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item and item[0] > now:
+                self._data.move_to_end(key)
+                CACHE_LOOKUPS.labels(self.name, "hit").inc()
+                return copy.deepcopy(item[1])
+            if item:
+                del self._data[key]
+        CACHE_LOOKUPS.labels(self.name, "miss").inc()
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        if self.ttl_s <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_s, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+def _seed_drivers(n: int):
+    from .driver_service import seed_drivers
+    seed_drivers(n)
+
+driver_pool = DriverPool(settings.DRIVER_POOL_SIZE, seed_fn=_seed_drivers)
+vehicle_cache = TTLCache("vehicle", settings.VEHICLE_CACHE_TTL_S, settings.VEHICLE_CACHE_MAX)
+
+class ReferenceRefresher:
+    """
+    Refresco periódico del pool de conductores y, si REFERENCE_CHANGE_STREAMS,
+    invalidación por change streams (requiere replica set; si no está
+    disponible queda solo el refresco periódico).
+    """
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    async def start(self):
+        await run_in_threadpool(driver_pool.refresh)
+        if settings.DRIVER_POOL_REFRESH_S > 0:
+            self._task = asyncio.create_task(self._loop())
+        if settings.REFERENCE_CHANGE_STREAMS:
+            self._stop.clear()
+            for target in (self._watch_drivers, self._watch_vehicles):
+                t = threading.Thread(target=target, daemon=True, name=target.__name__)
+                t.start()
+                self._threads.append(t)
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.DRIVER_POOL_REFRESH_S)
+            try:
+                await run_in_threadpool(driver_pool.refresh)
+            except PyMongoError as e:
+                log_event("driver_pool_refresh_failed", error=str(e))
+
+    def _watch(self, col, on_change: Callable[[Dict[str, Any]], None]):
+        try:
+            with col.watch(full_document="updateLookup", max_await_time_ms=1000) as stream:
+                while not self._stop.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        on_change(change)
+        except (PyMongoError, NotImplementedError, AttributeError) as e:
+            log_event("change_stream_unavailable", collection=col.name, error=str(e))
+
+    def _watch_drivers(self):
+        # Cambios poco frecuentes: se recarga el pool completo
+        self._watch(drivers_col, lambda change: driver_pool.refresh())
+
+    def _watch_vehicles(self):
+        def on_change(change):
+            plate = (change.get("fullDocument") or {}).get("plate")
+            vehicle_cache.invalidate(plate.upper() if plate else None)
+        self._watch(vehicles_col, on_change)
+
+refresher = ReferenceRefresher()
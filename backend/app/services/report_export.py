@@ -0,0 +1,159 @@
+import asyncio, csv, io, multiprocessing, tempfile, time, zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from ..database_async import inspections_acol
+from ..logging_utils import log_event
+from .pdf_cache import CachedPdf, get_cache
+
+PAGE_SIZE = 200
+
+class _ZipSink(io.RawIOBase):
+    """Destino no seekable de ZipFile: acumula lo escrito hasta que el generador lo drena."""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+def _render_one(inspection_id: str) -> Dict[str, Any]:
+    """
+    Corre en un worker (proceso spawn o hilo): lee la inspección y deja el PDF
+    en el caché compartido (disk/gridfs). Solo con PDF_CACHE_BACKEND=none
+    devuelve los bytes.
+    """
+    from ..database import inspections_col
+    from .pdf_cache import get_or_render
+    from .report_service import render_report_pdf
+    doc = inspections_col.find_one({"inspection_id": inspection_id})
+    if not doc:
+        return {"error": "not_found"}
+    pdf = get_or_render(doc, render_report_pdf)
+    out: Dict[str, Any] = {"key": pdf.key, "size": pdf.size}
+    if get_cache().name == "none":
+        out["data"] = b"".join(pdf.iter_range())
+    return out
+
+async def _targets(match: Dict[str, Any], limit: Optional[int]) -> AsyncIterator[Dict[str, Any]]:
+    # Paginado por _id: nunca se materializa la lista completa de ids
+    last_id = None
+    sent = 0
+    while True:
+        flt = dict(match)
+        if last_id is not None:
+            flt["_id"] = {"$gt": last_id}
+        page_size = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit - sent)
+        if page_size <= 0:
+            return
+        page = await inspections_acol.find(flt, {"_id": 1, "inspection_id": 1, "plate": 1}) \
+            .sort("_id", 1).limit(page_size).to_list(page_size)
+        if not page:
+            return
+        for item in page:
+            yield item
+        sent += len(page)
+        last_id = page[-1]["_id"]
+
+def _executor(workers: int) -> Executor:
+    if workers <= 1:
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="report_export")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+async def _iter_pdf(pdf: CachedPdf) -> AsyncIterator[bytes]:
+    # Lecturas del caché (disco o GridFS) fuera del event loop
+    it: Iterator[bytes] = pdf.iter_range()
+    while True:
+        chunk = await run_in_threadpool(next, it, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def _entry_name(item: Dict[str, Any]) -> str:
+    plate = (item.get("plate") or "sin_placa").replace("/", "_")
+    return f"{plate}/reporte_{item['inspection_id']}.pdf"
+
+async def export_reports_zip(match: Dict[str, Any], limit: Optional[int] = None, workers: int = 1) -> AsyncIterator[bytes]:
+    """
+    ZIP en streaming (ZIP_STORED: los PDF ya vienen comprimidos). Los PDF que
+    faltan se renderizan en paralelo (máx. 2*workers en vuelo) y cada entrada
+    se escribe apenas su render termina; en memoria queda un chunk de 64 KB
+    por entrada en escritura, no el lote. Al final va manifest.csv con el
+    resultado por inspección.
+    """
+    t0 = time.perf_counter()
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED, allowZip64=True)
+    cache = get_cache()
+    loop = asyncio.get_running_loop()
+    executor = _executor(workers)
+    pending: Dict[asyncio.Future, Dict[str, Any]] = {}
+    # Spooled: pasa a disco si el lote es grande
+    manifest = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode="w+", newline="", encoding="utf-8")
+    rows = csv.writer(manifest)
+    rows.writerow(["inspection_id", "plate", "file", "status", "bytes"])
+    counts = {"ok": 0, "error": 0}
+
+    async def write_done(fut: asyncio.Future, item: Dict[str, Any]) -> AsyncIterator[bytes]:
+        try:
+            res = fut.result()
+        except Exception as e:
+            res = {"error": str(e) or type(e).__name__}
+        pdf = None
+        if "data" in res:
+            data = res["data"]
+            pdf = CachedPdf(res["key"], len(data), lambda: io.BytesIO(data))
+        elif "key" in res:
+            pdf = await run_in_threadpool(cache.get, res["key"])
+        if pdf is None:
+            counts["error"] += 1
+            rows.writerow([item["inspection_id"], item.get("plate"), "", res.get("error", "cache_miss"), 0])
+            return
+        name = _entry_name(item)
+        with zf.open(zipfile.ZipInfo(name, date_time=time.localtime()[:6]), "w", force_zip64=True) as dst:
+            async for chunk in _iter_pdf(pdf):
+                dst.write(chunk)
+                out = sink.drain()
+                if out:
+                    yield out
+        counts["ok"] += 1
+        rows.writerow([item["inspection_id"], item.get("plate"), name, "ok", pdf.size])
+        out = sink.drain()
+        if out:
+            yield out
+
+    try:
+        async for item in _targets(match, limit):
+            pending[loop.run_in_executor(executor, _render_one, item["inspection_id"])] = item
+            if len(pending) >= 2 * max(1, workers):
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    async for chunk in write_done(fut, pending.pop(fut)):
+                        yield chunk
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                async for chunk in write_done(fut, pending.pop(fut)):
+                    yield chunk
+        manifest.seek(0)
+        with zf.open("manifest.csv", "w", force_zip64=True) as dst:
+            for line in manifest:
+                dst.write(line.encode("utf-8"))
+        zf.close()
+        yield sink.drain()
+        log_event("reports_exported", ok=counts["ok"], errors=counts["error"], workers=workers,
+                  elapsed_s=round(time.perf_counter() - t0, 3))
+    finally:
+        # Cliente desconectado o error: no seguir renderizando
+        manifest.close()
+        for fut in pending:
+            fut.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,288 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+# Modelo único del reporte: secciones con bloques tipados, sin markup.
+# Lo consumen render_markdown (texto persistido en la inspección) y
+# render_flowables (PDF, sin re-parsear el markdown).
+#   {"kind": "empty", "text"}                       -> texto en itálica
+#   {"kind": "fields", "items": [(label, value, bold)], "breaks": bool}
+#   {"kind": "list", "title"?, "items": [str | (str, [sub])], "none"?}
+#   {"kind": "table", "header": [...], "rows": [[...]]}
+#   {"kind": "text", "text"}
+
+SECTION_BAR = "\n---\n"
+
+def _empty(text: str) -> Dict[str, Any]:
+    return {"kind": "empty", "text": text}
+
+def _pct(v: Any) -> str:
+    return f"{(v or 0) * 100:.1f}%"
+
+def _identity_blocks(payload: Dict[str, Any] | None, validated: bool | None) -> List[Dict[str, Any]]:
+    if not payload:
+        return [_empty("No se registró validación de identidad.")]
+    driver = payload.get("matched_driver") or payload
+    return [{"kind": "fields", "breaks": True, "items": [
+        ("Estado", "VALIDADA" if validated else "NO COINCIDE", True),
+        ("Nombre (DB)", driver.get("name") or driver.get("full_name") or "N/D", False),
+        ("Documento", driver.get("document") or "N/D", False),
+    ]}]
+
+def _vehicle_blocks(vehicle: Dict[str, Any] | None, history: Dict[str, Any] | None) -> List[Dict[str, Any]]:
+    if not vehicle:
+        return [_empty("Sin datos de vehículo.")]
+    blocks: List[Dict[str, Any]] = [{"kind": "fields", "breaks": False, "items": [
+        ("Placa", vehicle.get("plate", "N/D"), True),
+        ("Marca / Modelo / Año", f"{vehicle.get('brand','?')} / {vehicle.get('model','?')} / {vehicle.get('year','?')}", False),
+        ("Color DB", vehicle.get("color", "?"), False),
+        ("Propietario (DB)", vehicle.get("owner", "?"), False),
+    ]}]
+    if history:
+        items: List[Any] = [
+            f"Infracciones: {history.get('infractions', 0)}",
+            f"Dueños previos: {history.get('previous_owners', 1)}",
+            f"Técnica vigente: {'Sí' if history.get('tech_ok', True) else 'No'}",
+        ]
+        notes = history.get("notes") or []
+        if notes:
+            items.append(("Notas:", [str(n) for n in notes]))
+        blocks.append({"kind": "list", "title": "Historial:", "items": items})
+    return blocks
+
+def _quality_blocks(images: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not images:
+        return [_empty("Sin imágenes en sesión.")]
+    rows = []
+    lap_sum = edge_sum = 0.0
+    scratches_total = 0
+    for idx, im in enumerate(images, start=1):
+        an = im.get("analysis") or {}
+        pre = an.get("preproc_metrics") or {}
+        lap, edge = pre.get("lap_var"), pre.get("edge_density")
+        sc = (an.get("scratch") or {}).get("count", 0)
+        scratches_total += sc
+        lap_sum += lap or 0
+        edge_sum += edge or 0
+        rows.append([idx, "-" if lap is None else lap, "-" if edge is None else edge, an.get("quality_status", "n/a"), sc])
+    n = len(images)
+    return [
+        {"kind": "fields", "breaks": True, "items": [
+            ("Promedio LapVar", round(lap_sum / n, 2), False),
+            ("Promedio EdgeDensity", round(edge_sum / n, 4), False),
+            ("Total scratches candidatos", scratches_total, False),
+        ]},
+        {"kind": "table", "header": ["Img", "LapVar", "EdgeDensity", "Calidad", "Scratches"], "rows": rows},
+    ]
+
+def _fidelity_blocks(profiles: Dict[str, int], fidelity: str | None, degraded: int,
+                     duplicates: int = 0) -> List[Dict[str, Any]]:
+    # Perfil de pipeline con que se analizaron las imágenes (ver pipeline_profiles)
+    # y casi duplicados excluidos de los agregados (ver dedup)
+    items = []
+    if profiles:
+        used = ", ".join(f"{name} ×{n}" for name, n in profiles.items())
+        items += [("Fidelidad del análisis", fidelity or "N/D", True), ("Perfiles usados", used, False)]
+    if degraded:
+        items.append(("Imágenes con etapas omitidas (sobrecarga)", degraded, False))
+    if duplicates:
+        items.append(("Imágenes casi duplicadas (no suman daños)", duplicates, False))
+    return [{"kind": "fields", "breaks": True, "items": items}] if items else []
+
+def _damage_blocks(damage: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not damage:
+        return [_empty("Sin detecciones de daño.")]
+    rows = [[i, d.get("label", "damage"), d.get("part", "-"), _pct(d.get("confidence")), d.get("box", [])]
+            for i, d in enumerate(damage, start=1)]
+    return [{"kind": "table", "header": ["#", "Daño", "Parte", "Confianza", "Box"], "rows": rows}]
+
+def _damage_change_blocks(changes: Dict[str, Any] | None) -> List[Dict[str, Any]]:
+    # Comparación con la inspección anterior de la misma placa (damage_timeline)
+    if not changes or not changes.get("previous_inspection_id"):
+        return []
+    def fmt(items):
+        return [f"{i['part']} / {i['label']} ×{i['count']}" for i in items]
+    return [
+        {"kind": "fields", "breaks": True, "items": [("Inspección anterior", changes["previous_inspection_id"], True)]},
+        {"kind": "list", "title": "Nuevos desde la inspección anterior:", "items": fmt(changes.get("new", [])), "none": "Ninguno"},
+        {"kind": "list", "title": "Reportados antes y ausentes ahora:", "items": fmt(changes.get("missing", [])), "none": "Ninguno"},
+    ]
+
+def _parts_blocks(parts: Dict[str, Any], missing: List[str]) -> List[Dict[str, Any]]:
+    if not parts:
+        return [_empty("Sin análisis de partes.")]
+    rows = [[k, "OK" if v.get("present") else "NO", _pct(v.get("confidence"))] for k, v in parts.items()]
+    blocks: List[Dict[str, Any]] = [{"kind": "table", "header": ["Parte", "Presente", "Confianza"], "rows": rows}]
+    if missing:
+        blocks.append({"kind": "fields", "breaks": False, "items": [("Faltantes", ", ".join(missing), False)]})
+    return blocks
+
+def _verdict_blocks(verdict: Dict[str, Any] | None) -> List[Dict[str, Any]]:
+    if not verdict:
+        return [_empty("Sin veredicto (posible aborto o fallo geo).")]
+    return [
+        {"kind": "fields", "breaks": True, "items": [
+            ("Veredicto", verdict.get("verdict", "N/A"), True),
+            ("Puntaje", verdict.get("score", "?"), False),
+        ]},
+        {"kind": "list", "title": "Condiciones:", "items": [str(c) for c in verdict.get("conditions") or []],
+         "none": "(sin condiciones)"},
+    ]
+
+def _flags_blocks(fraud: List[str], review: List[str]) -> List[Dict[str, Any]]:
+    return [
+        {"kind": "list", "title": "Fraud Flags:", "items": list(fraud or []), "none": "Ninguno"},
+        {"kind": "list", "title": "Review Flags:", "items": list(review or []), "none": "Ninguno"},
+    ]
+
+def _notes_blocks(notes: List[str]) -> List[Dict[str, Any]]:
+    if not notes:
+        return [_empty("Sin notas manuales.")]
+    return [{"kind": "list", "items": [str(n) for n in notes]}]
+
+def build_report_model(doc: Dict[str, Any], generated_at: Optional[datetime] = None) -> Dict[str, Any]:
+    """Modelo del reporte a partir de la inspección (FinalizeResponse + campos auxiliares)."""
+    footer: List[Any] = [("Color referencial DB", doc.get("vehicle_color_db", "?"), False)]
+    if doc.get("color_match") is not None:
+        footer.append(("Color coincide con DB", "Sí" if doc["color_match"] else "No", True))
+    return {
+        "title": "Reporte Inspección",
+        "meta": [
+            ("ID Sesión", doc.get("session_id"), True),
+            ("Fecha", f"{(generated_at or datetime.utcnow()).isoformat()}Z", False),
+        ],
+        "status": doc.get("status", "N/A"),
+        "sections": [
+            ("Identidad", _identity_blocks(doc.get("identity_payload"), doc.get("identity_validated"))),
+            ("Vehículo", _vehicle_blocks(doc.get("vehicle"), doc.get("vehicle_history"))),
+            ("Calidad de Imágenes",
+             _fidelity_blocks(doc.get("pipeline_profiles") or {}, doc.get("analysis_fidelity"),
+                              doc.get("degraded_images", 0), doc.get("duplicate_images", 0))
+             + _quality_blocks(doc.get("images", []))),
+            ("Daños Detectados", _damage_blocks(doc.get("damage_detections", []))
+             + _damage_change_blocks(doc.get("damage_changes"))),
+            ("Partes Detectadas", _parts_blocks(doc.get("parts_presence", {}), doc.get("missing_parts", []))),
+            ("Veredicto", _verdict_blocks(doc.get("verdict"))),
+            ("Flags", _flags_blocks(doc.get("fraud_flags", []), doc.get("review_flags", []))),
+            ("Notas Manuales", _notes_blocks(doc.get("notes", []))),
+        ],
+        "footer": footer,
+    }
+
+# ---------------- Markdown ----------------
+# Plantillas compiladas una vez (bound str.format)
+_MD_FIELD = "{}: {}".format
+_MD_FIELD_BOLD = "{}: **{}**".format
+_MD_ITEM = "- {}".format
+_MD_SUBITEM = "  - {}".format
+_MD_EMPTY = "_{}_".format
+_MD_HEADING = "## {}\n".format
+
+def _md_fields(items, breaks: bool) -> str:
+    sep = "  \n" if breaks else "\n"
+    return sep.join((_MD_FIELD_BOLD if bold else _MD_FIELD)(label, value) for label, value, bold in items)
+
+def _md_list(block: Dict[str, Any]) -> str:
+    items = block["items"]
+    title = block.get("title")
+    if not items and block.get("none"):
+        none = block["none"]
+        return f"{title[:-1]}: {_MD_EMPTY(none)}" if title else _MD_EMPTY(none)
+    lines = [title] if title else []
+    for it in items:
+        if isinstance(it, tuple):
+            lines.append(_MD_ITEM(it[0]))
+            lines.extend(_MD_SUBITEM(s) for s in it[1])
+        else:
+            lines.append(_MD_ITEM(it))
+    return "\n".join(lines)
+
+def _md_table(block: Dict[str, Any]) -> str:
+    header = block["header"]
+    head = "| " + " | ".join(header) + " |\n|" + "|".join("-" * (len(h) + 2) for h in header) + "|"
+    body = "\n".join("| " + " | ".join(map(str, r)) + " |" for r in block["rows"])
+    return head + ("\n" + body if body else "")
+
+_MD_BLOCKS = {
+    "empty": lambda b: _MD_EMPTY(b["text"]),
+    "fields": lambda b: _md_fields(b["items"], b.get("breaks", False)),
+    "list": _md_list,
+    "table": _md_table,
+    "text": lambda b: b["text"],
+}
+
+def render_markdown(model: Dict[str, Any]) -> str:
+    head = f"# {model['title']}\n\n" + _md_fields(model["meta"], True) + "\n" + \
+        _MD_FIELD_BOLD("Estado final", model["status"]) + "\n\n"
+    sections = "".join(
+        _MD_HEADING(title) + "\n\n".join(_MD_BLOCKS[b["kind"]](b) for b in blocks) + SECTION_BAR
+        for title, blocks in model["sections"]
+    )
+    return head + sections + _md_fields(model["footer"], False) + "\n"
+
+# ---------------- reportlab ----------------
+def _rl_value(value: Any, bold: bool) -> str:
+    v = escape(str(value))
+    return f"<b>{v}</b>" if bold else v
+
+def render_flowables(model: Dict[str, Any], styles=None, include_header: bool = True) -> List[Any]:
+    """Flowables directos desde el modelo; las listas largas (daños, partes) van como Table."""
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+    styles = styles or getSampleStyleSheet()
+    body, italic = styles["BodyText"], styles["Italic"]
+    table_style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("FONTSIZE", (0, 0), (-1, -1), 8),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ])
+
+    def fields(items) -> Any:
+        return Paragraph("<br/>".join(f"{escape(str(l))}: {_rl_value(v, b)}" for l, v, b in items), body)
+
+    def listing(block) -> List[Any]:
+        out = []
+        title = block.get("title")
+        items = block["items"]
+        if not items and block.get("none"):
+            text = f"{escape(title[:-1])}: <i>{escape(block['none'])}</i>" if title else f"<i>{escape(block['none'])}</i>"
+            return [Paragraph(text, body)]
+        lines = [f"<b>{escape(title)}</b>"] if title else []
+        for it in items:
+            if isinstance(it, tuple):
+                lines.append(f"• {escape(it[0])}")
+                lines.extend(f"&nbsp;&nbsp;&nbsp;– {escape(s)}" for s in it[1])
+            else:
+                lines.append(f"• {escape(it)}")
+        out.append(Paragraph("<br/>".join(lines), body))
+        return out
+
+    def table(block) -> Any:
+        tbl = Table([block["header"]] + [[str(c) for c in r] for r in block["rows"]], repeatRows=1)
+        tbl.setStyle(table_style)
+        return tbl
+
+    flow: List[Any] = []
+    if include_header:
+        flow.append(fields(model["meta"] + [("Estado final", model["status"], True)]))
+        flow.append(Spacer(1, 8))
+    for title, blocks in model["sections"]:
+        flow.append(Paragraph(f"<b>{escape(title)}</b>", styles["Heading3"]))
+        for b in blocks:
+            kind = b["kind"]
+            if kind == "empty":
+                flow.append(Paragraph(escape(b["text"]), italic))
+            elif kind == "fields":
+                flow.append(fields(b["items"]))
+            elif kind == "list":
+                flow.extend(listing(b))
+            elif kind == "table":
+                flow.append(table(b))
+            else:
+                flow.append(Paragraph(escape(b["text"]), body))
+            flow.append(Spacer(1, 4))
+        flow.append(Spacer(1, 8))
+    flow.append(fields(model["footer"]))
+    return flow
@@ -0,0 +1,38 @@
+from typing import Any, BinaryIO, Callable, Dict
+from ..config import settings
+from ..database import inspections_col
+from ..logging_utils import log_event
+from ..telemetry import stage
+from .markdown_builder import build_markdown_report
+from .pdf_cache import get_or_render
+from .pdf_export import write_full_pdf
+
+def render_report_pdf(doc: Dict[str, Any], out: BinaryIO):
+    # El PDF sale del modelo del reporte; no depende de report_markdown
+    write_full_pdf(doc, out)
+
+def prerender_report(inspection_id: str, progress: Callable[[str, float], None]) -> Dict[str, Any]:
+    """
+    Job 'report' (encolado por finalize): deja listos el markdown (persistido
+    en la inspección) y el PDF (en el caché por hash de contenido), para que
+    la descarga no espere a reportlab.
+    """
+    doc = inspections_col.find_one({"inspection_id": inspection_id})
+    if not doc:
+        raise ValueError(f"Inspección no encontrada: {inspection_id}")
+    progress("markdown", 0.1)
+    if not doc.get("report_markdown"):
+        with stage("report_markdown"):
+            md = build_markdown_report(doc)
+        inspections_col.update_one({"inspection_id": inspection_id}, {"$set": {"report_markdown": md}})
+        # Se renderiza sobre el documento persistido: mismo hash que verá la descarga
+        doc = inspections_col.find_one({"inspection_id": inspection_id})
+    out = {"inspection_id": inspection_id, "markdown": True, "pdf": False}
+    if settings.ENABLE_PDF_EXPORT:
+        progress("pdf", 0.4)
+        with stage("report_pdf"):
+            pdf = get_or_render(doc, render_report_pdf)
+        out.update({"pdf": True, "pdf_bytes": pdf.size, "etag": pdf.etag,
+                    "download_url": f"/inspection/report/{inspection_id}"})
+    log_event("report_prerendered", **out)
+    return out
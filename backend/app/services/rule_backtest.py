@@ -0,0 +1,192 @@
+import multiprocessing, time
+from concurrent.futures import ProcessPoolExecutor, Future
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import yaml
+from ..logging_utils import log_event
+from .rules_engine import RuleSet, compile_rules, evaluate_rules_batch, _RULES_PATH
+
+LOW_QUALITY_FLAGS = {"LOW_SHARPNESS", "LOW_IMAGE_QUALITY"}
+
+def _pipeline(match: Dict[str, Any], limit: Optional[int]) -> List[Dict[str, Any]]:
+    """Proyección en el servidor: solo los escalares que alimentan el contexto de reglas."""
+    pipe: List[Dict[str, Any]] = [{"$match": match}] if match else []
+    if limit:
+        pipe.append({"$limit": limit})
+    pipe.append({"$project": {
+        "_id": 0,
+        "inspection_id": 1,
+        "damage_count": {"$ifNull": ["$damage_counts.total", {"$size": {"$ifNull": ["$damage_detections", []]}}]},
+        "missing_count": {"$size": {"$ifNull": ["$missing_parts", []]}},
+        "geo_status": {"$ifNull": ["$geo_summary.status", "$geo.status"]},
+        "geo_max_dist": {"$ifNull": ["$geo_summary.stats.max_dist", "$geo.stats.max_dist"]},
+        "color_fraud": "$color_evaluation.fraud",
+        "review_flags": 1,
+        "images_count": 1,
+        "tamper_suspects": 1
+    }})
+    return pipe
+
+def inspection_context(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reconstruye el contexto de reglas desde una inspección persistida.
+    geo.browser_distance no se guarda por inspección: queda ausente y las
+    reglas que lo usan no disparan en el backtest.
+    """
+    ctx: Dict[str, Any] = {
+        "damage": {"count": doc.get("damage_count") or 0},
+        "parts": {"missing_count": doc.get("missing_count") or 0},
+        "geo": {"hard_mismatch": doc.get("geo_status") == "FAIL"},
+        "quality": {"ok": not (set(doc.get("review_flags") or []) & LOW_QUALITY_FLAGS)},
+        "tamper": {"suspects": doc.get("tamper_suspects") or 0}
+    }
+    if doc.get("geo_max_dist") is not None:
+        ctx["geo"]["max_distance"] = doc["geo_max_dist"]
+    if doc.get("color_fraud") is not None:
+        ctx["color"] = {"mismatch": bool(doc["color_fraud"])}
+    if doc.get("images_count") is not None:
+        ctx["session"] = {"images": doc["images_count"]}
+    return ctx
+
+def _empty_batch_result(rule_ids: Iterable[str]) -> Dict[str, Any]:
+    return {
+        "n": 0,
+        "rules": {rid: {"old": 0, "new": 0, "added": 0, "removed": 0} for rid in rule_ids},
+        "outcomes": {k: 0 for k in ("fraud_added", "fraud_removed", "review_added", "review_removed")},
+        "samples": {k: [] for k in ("fraud_added", "fraud_removed", "review_added", "review_removed")}
+    }
+
+def score_batch(items: List[Tuple[str, Dict[str, Any]]], old: RuleSet, new: RuleSet, sample: int = 20) -> Dict[str, Any]:
+    """Evalúa ambos conjuntos (modo vectorizado) sobre un lote y resume los cambios."""
+    ids = [i for i, _ in items]
+    ctxs = [c for _, c in items]
+    n = len(ctxs)
+    rule_ids = sorted({r.id for r in old.rules} | {r.id for r in new.rules})
+    out = _empty_batch_result(rule_ids)
+    out["n"] = n
+    if not n:
+        return out
+    m_old, m_new = evaluate_rules_batch(ctxs, old), evaluate_rules_batch(ctxs, new)
+    zeros = np.zeros(n, dtype=bool)
+    for rid in rule_ids:
+        a, b = m_old.get(rid, zeros), m_new.get(rid, zeros)
+        out["rules"][rid] = {
+            "old": int(a.sum()), "new": int(b.sum()),
+            "added": int((b & ~a).sum()), "removed": int((a & ~b).sum())
+        }
+
+    def any_of(masks: Dict[str, np.ndarray], rules) -> np.ndarray:
+        return np.logical_or.reduce([masks[r.id] for r in rules]) if rules else zeros
+
+    for kind, o, nw in (("fraud", any_of(m_old, old.fraud), any_of(m_new, new.fraud)),
+                        ("review", any_of(m_old, old.review), any_of(m_new, new.review))):
+        for label, mask in ((f"{kind}_added", nw & ~o), (f"{kind}_removed", o & ~nw)):
+            idx = np.flatnonzero(mask)
+            out["outcomes"][label] = int(idx.size)
+            out["samples"][label] = [ids[i] for i in idx[:sample]]
+    return out
+
+def _merge(total: Dict[str, Any], part: Dict[str, Any], sample: int):
+    total["n"] += part["n"]
+    for rid, c in part["rules"].items():
+        dst = total["rules"].setdefault(rid, {"old": 0, "new": 0, "added": 0, "removed": 0})
+        for k, v in c.items():
+            dst[k] += v
+    for k, v in part["outcomes"].items():
+        total["outcomes"][k] += v
+        room = sample - len(total["samples"][k])
+        if room > 0:
+            total["samples"][k].extend(part["samples"][k][:room])
+
+def _batches(cursor, batch_size: int) -> Iterator[List[Tuple[str, Dict[str, Any]]]]:
+    batch = []
+    for doc in cursor:
+        batch.append((doc.get("inspection_id"), inspection_context(doc)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ---- Workers (spawn): cada proceso compila los dos conjuntos una vez ----
+_worker_sets: Tuple[RuleSet, RuleSet] | None = None
+
+def _init_worker(old_yaml: str, new_yaml: str):
+    global _worker_sets
+    _worker_sets = (compile_rules(yaml.safe_load(old_yaml) or {}), compile_rules(yaml.safe_load(new_yaml) or {}))
+
+def _worker_score(items, sample: int):
+    return score_batch(items, _worker_sets[0], _worker_sets[1], sample)
+
+def build_match(plates: Optional[List[str]] = None, since: Optional[datetime] = None,
+                until: Optional[datetime] = None, status: Optional[str] = None) -> Dict[str, Any]:
+    match: Dict[str, Any] = {}
+    if plates:
+        match["plate"] = {"$in": [p.upper() for p in plates]}
+    if since or until:
+        match["created_at"] = {k: v for k, v in (("$gte", since), ("$lt", until)) if v}
+    if status:
+        match["status"] = status
+    return match
+
+def run_backtest(
+    new_yaml: str,
+    old_yaml: Optional[str] = None,
+    workers: int = 1,
+    batch_size: int = 2000,
+    limit: Optional[int] = None,
+    match: Optional[Dict[str, Any]] = None,
+    sample: int = 20
+) -> Dict[str, Any]:
+    """
+    Re-evalúa las inspecciones históricas con el conjunto actual (o old_yaml)
+    y con new_yaml. Lee inspections_col con un cursor y proyección en el
+    servidor; con workers > 1 reparte lotes entre procesos manteniendo como
+    máximo 2*workers lotes en vuelo (memoria acotada).
+    """
+    from ..database import inspections_col
+    if old_yaml is None:
+        with open(_RULES_PATH, "r", encoding="utf-8") as f:
+            old_yaml = f.read()
+    # Valida ambos antes de recorrer la colección (ValueError si alguno es inválido)
+    old_set = compile_rules(yaml.safe_load(old_yaml) or {})
+    new_set = compile_rules(yaml.safe_load(new_yaml) or {})
+    rule_ids = sorted({r.id for r in old_set.rules} | {r.id for r in new_set.rules})
+    total = _empty_batch_result(rule_ids)
+
+    t0 = time.perf_counter()
+    cursor = inspections_col.aggregate(_pipeline(match or {}, limit), allowDiskUse=True, batchSize=batch_size)
+    batches = _batches(cursor, max(1, batch_size))
+    if workers <= 1:
+        for b in batches:
+            _merge(total, score_batch(b, old_set, new_set, sample), sample)
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(old_yaml, new_yaml)) as ex:
+            inflight: List[Future] = []
+            for b in batches:
+                inflight.append(ex.submit(_worker_score, b, sample))
+                if len(inflight) >= 2 * workers:
+                    _merge(total, inflight.pop(0).result(), sample)
+            for fut in inflight:
+                _merge(total, fut.result(), sample)
+    elapsed = time.perf_counter() - t0
+
+    report = {
+        "inspections": total["n"],
+        "elapsed_s": round(elapsed, 3),
+        "inspections_per_s": round(total["n"] / elapsed, 1) if elapsed else 0.0,
+        "workers": workers,
+        "rules": {rid: {**c, "delta": c["new"] - c["old"]} for rid, c in total["rules"].items()},
+        "outcomes": total["outcomes"],
+        "samples": total["samples"],
+        "rule_sets": {
+            "old": {"fraud": [r.id for r in old_set.fraud], "review": [r.id for r in old_set.review]},
+            "new": {"fraud": [r.id for r in new_set.fraud], "review": [r.id for r in new_set.review]}
+        }
+    }
+    log_event("rules_backtest", inspections=report["inspections"], elapsed_s=report["elapsed_s"],
+              outcomes=report["outcomes"])
+    return report
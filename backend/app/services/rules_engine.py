@@ -1,9 +1,10 @@
-import yaml, os, ast
-from typing import Dict, Any, List, Tuple
+import yaml, os, ast, hashlib, operator, threading, time
+from typing import Dict, Any, List, Tuple, Callable, Optional
+import numpy as np
+from ..config import settings
 from ..logging_utils import log_event
 
 _RULES_PATH = os.path.join(os.path.dirname(__file__), "..", "fraud_rules.yaml")
-_cached: Dict[str, List[Dict[str, Any]]] | None = None
 
 ALLOWED_NODES = (
     ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp,
@@ -13,61 +14,307 @@ ALLOWED_NODES = (
     ast.Div, ast.Mod, ast.Num, ast.Constant
 )
 
-def _safe_eval(expr: str, ctx: Dict[str, Any]) -> bool:
-    tree = ast.parse(expr, mode="eval")
+_BIN_OPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+            ast.Div: operator.truediv, ast.Mod: operator.mod}
+_CMP_OPS = {ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Gt: operator.gt,
+            ast.GtE: operator.ge, ast.Lt: operator.lt, ast.LtE: operator.le}
+
+Path = Tuple[str, ...]
+Evaluator = Callable[[Any], Any]
+
+class CompiledRule:
+    """
+    Regla validada y compilada una sola vez: 'fn' evalúa un contexto anidado
+    y 'vec' un lote de columnas (numpy). 'paths' son los campos que usa.
+    """
+    __slots__ = ("id", "kind", "level", "when", "fn", "vec", "paths")
+
+    def __init__(self, rule_id: str, kind: str, level: Optional[str], when: str,
+                 fn: Evaluator, vec: Evaluator, paths: List[Path]):
+        self.id, self.kind, self.level, self.when = rule_id, kind, level, when
+        self.fn, self.vec, self.paths = fn, vec, paths
+
+class RuleSet:
+    def __init__(self, fraud: List[CompiledRule], review: List[CompiledRule], digest: str, source: str):
+        self.fraud, self.review, self.digest, self.source = fraud, review, digest, source
+
+    @property
+    def rules(self) -> List[CompiledRule]:
+        return self.fraud + self.review
+
+    @property
+    def paths(self) -> List[Path]:
+        return sorted({p for r in self.rules for p in r.paths})
+
+# ---------------- Compilación ----------------
+def _path(node) -> Path:
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        raise ValueError("Solo se permiten nombres con atributos (p.ej. geo.browser_distance)")
+    parts.append(node.id)
+    return tuple(reversed(parts))
+
+def _short_circuit(items, is_and: bool):
+    """
+    all()/any() de Python sobre columnas (valor, error): un operando solo
+    cuenta (y solo puede fallar) en las filas que los anteriores no decidieron.
+    """
+    decided, err = np.False_, np.False_
+    for val, item_err in items:
+        pending = ~(decided | err)
+        err = err | (pending & item_err)
+        stop = ~np.asarray(val, dtype=bool) if is_and else np.asarray(val, dtype=bool)
+        decided = decided | (pending & ~item_err & stop)
+    return (~(decided | err) if is_and else decided), err
+
+def _build(node, vec: bool, paths: List[Path]) -> Evaluator:
+    """
+    Árbol de closures. Escalar: env[path] devuelve el valor y un campo ausente
+    lanza KeyError. Lote: env = (columnas, ausentes) y cada nodo devuelve
+    (valor, error) por fila, donde error marca las filas en que la versión
+    escalar lanzaría excepción (así and/or cortocircuitan igual en ambos modos).
+    """
+    if isinstance(node, ast.Expression):
+        return _build(node.body, vec, paths)
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if vec:
+            return lambda env: (value, np.False_)
+        return lambda env: value
+    if isinstance(node, (ast.Name, ast.Attribute)):
+        path = _path(node)
+        if path not in paths:
+            paths.append(path)
+        if vec:
+            return lambda env: (env[0][path], env[1][path])
+        return lambda env: env[path]
+    if isinstance(node, ast.BoolOp):
+        fns = [_build(v, vec, paths) for v in node.values]
+        is_and = isinstance(node.op, ast.And)
+        if vec:
+            return lambda env: _short_circuit((f(env) for f in fns), is_and)
+        if is_and:
+            return lambda env: all(f(env) for f in fns)
+        return lambda env: any(f(env) for f in fns)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        fn = _build(node.operand, vec, paths)
+        if vec:
+            def negate(env):
+                val, err = fn(env)
+                return np.logical_not(np.asarray(val, dtype=bool)), err
+            return negate
+        return lambda env: not fn(env)
+    if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+        op = _BIN_OPS[type(node.op)]
+        left, right = _build(node.left, vec, paths), _build(node.right, vec, paths)
+        if vec:
+            by_zero = type(node.op) in (ast.Div, ast.Mod)
+            def binop(env):
+                (a, err_a), (b, err_b) = left(env), right(env)
+                err = np.logical_or(err_a, err_b)
+                if by_zero:
+                    # ZeroDivisionError en escalar; numpy daría inf/nan
+                    err = err | np.asarray(b == 0, dtype=bool)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    return op(a, b), err
+            return binop
+        return lambda env: op(left(env), right(env))
+    if isinstance(node, ast.Compare):
+        operands = [_build(node.left, vec, paths)] + [_build(c, vec, paths) for c in node.comparators]
+        ops = [_CMP_OPS[type(o)] for o in node.ops]
+        pairs = list(zip(ops, operands, operands[1:]))
+        if vec:
+            def compare(op, a, b, env):
+                (x, err_x), (y, err_y) = a(env), b(env)
+                with np.errstate(invalid="ignore"):
+                    return op(x, y), np.logical_or(err_x, err_y)
+            return lambda env: _short_circuit((compare(op, a, b, env) for op, a, b in pairs), True)
+        return lambda env: all(op(a(env), b(env)) for op, a, b in pairs)
+    raise ValueError(f"Nodo no soportado: {type(node).__name__}")
+
+def compile_rule(rule: Dict[str, Any], kind: str) -> CompiledRule:
+    if not rule.get("id") or not isinstance(rule.get("when"), str):
+        raise ValueError(f"Regla inválida (id/when): {rule}")
+    tree = ast.parse(rule["when"], mode="eval")
     for node in ast.walk(tree):
         if not isinstance(node, ALLOWED_NODES):
             raise ValueError(f"Nodo no permitido: {type(node).__name__}")
-    return bool(eval(compile(tree, "<rule>", "eval"), {"__builtins__": {}}, ctx))
+    paths: List[Path] = []
+    fn = _build(tree, False, paths)
+    vec = _build(tree, True, [])
+    return CompiledRule(rule["id"], kind, rule.get("level"), rule["when"], fn, vec, paths)
+
+def compile_rules(data: Dict[str, Any], digest: str = "", source: str = "") -> RuleSet:
+    """Valida y compila todo el archivo; cualquier regla inválida rechaza el conjunto."""
+    data = data or {}
+    compiled: Dict[str, List[CompiledRule]] = {"fraud": [], "review": []}
+    errors = []
+    for kind in compiled:
+        for r in data.get(kind) or []:
+            try:
+                compiled[kind].append(compile_rule(r, kind))
+            except (SyntaxError, ValueError) as e:
+                errors.append(f"{r.get('id') if isinstance(r, dict) else r}: {e}")
+    if errors:
+        raise ValueError("Reglas inválidas: " + "; ".join(errors))
+    return RuleSet(compiled["fraud"], compiled["review"], digest, source)
+
+def load_rule_file(path: str) -> RuleSet:
+    with open(path, "rb") as f:
+        raw = f.read()
+    return compile_rules(yaml.safe_load(raw) or {}, hashlib.sha256(raw).hexdigest(), path)
 
-def load_rules() -> Dict[str, List[Dict[str, Any]]]:
-    global _cached
-    if _cached is not None:
+# ---------------- Carga con watcher (mtime/hash) ----------------
+_cached: RuleSet | None = None
+_sig: Tuple[int, int] | None = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+def load_rules() -> RuleSet:
+    """
+    Devuelve el conjunto compilado. Cada RULES_WATCH_INTERVAL_S revisa
+    mtime/tamaño de fraud_rules.yaml y, si cambió y el hash del contenido es
+    distinto, recompila. Un archivo inválido mantiene las reglas anteriores.
+    """
+    global _cached, _sig, _checked_at
+    now = time.monotonic()
+    interval = settings.RULES_WATCH_INTERVAL_S
+    if _cached is not None and (interval <= 0 or now - _checked_at < interval):
         return _cached
-    if not os.path.exists(_RULES_PATH):
-        _cached = {"fraud": [], "review": []}
+    with _lock:
+        _checked_at = now
+        try:
+            st = os.stat(_RULES_PATH)
+        except FileNotFoundError:
+            if _cached is None:
+                _cached = RuleSet([], [], "", _RULES_PATH)
+            return _cached
+        sig = (st.st_mtime_ns, st.st_size)
+        if _cached is not None and sig == _sig:
+            return _cached
+        with open(_RULES_PATH, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        _sig = sig
+        if _cached is not None and digest == _cached.digest:
+            return _cached
+        try:
+            rules = compile_rules(yaml.safe_load(raw) or {}, digest, _RULES_PATH)
+        except (yaml.YAMLError, ValueError) as e:
+            log_event("rules_invalid", error=str(e), kept=_cached.digest[:12] if _cached else None)
+            if _cached is None:
+                raise
+            return _cached
+        _cached = rules
+        log_event("rules_loaded", fraud=len(rules.fraud), review=len(rules.review), digest=digest[:12])
         return _cached
-    with open(_RULES_PATH, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f) or {}
-    _cached = {
-        "fraud": data.get("fraud", []),
-        "review": data.get("review", [])
-    }
-    log_event("rules_loaded", fraud=len(_cached["fraud"]), review=len(_cached["review"]))
-    return _cached
-
-def evaluate_rules(context: Dict[str, Any]) -> Tuple[List[str], List[str]]:
-    rules = load_rules()
+
+def reload_rules():
+    global _cached, _sig
+    with _lock:
+        _cached, _sig = None, None
+    load_rules()
+    log_event("rules_reloaded")
+
+# ---------------- Evaluación ----------------
+class _PathView:
+    """Acceso por ruta sobre el contexto anidado (sin aplanarlo)."""
+    __slots__ = ("ctx",)
+
+    def __init__(self, ctx: Dict[str, Any]):
+        self.ctx = ctx
+
+    def __getitem__(self, path: Path):
+        v = self.ctx
+        for k in path:
+            v = v[k]
+        return v
+
+def _has_path(ctx: Dict[str, Any], path: Path) -> bool:
+    v = ctx
+    for k in path:
+        if not isinstance(v, dict) or k not in v:
+            return False
+        v = v[k]
+    return True
+
+def evaluate_rules(context: Dict[str, Any], rules: RuleSet | None = None,
+                   skip_missing: bool = False) -> Tuple[List[str], List[str]]:
+    """
+    skip_missing: contexto parcial (p.ej. por imagen en analyze); las reglas
+    que usan campos ausentes no se evalúan en vez de registrar error.
+    """
+    rules = rules or load_rules()
+    env = _PathView(context)
     fraud_flags: List[str] = []
     review_flags: List[str] = []
-    flat_ctx = _flatten_context(context)
-    for r in rules["fraud"]:
-        try:
-            if _safe_eval(r["when"], flat_ctx):
-                fraud_flags.append(r["id"])
-        except Exception as e:
-            log_event("rule_eval_error", rule=r.get("id"), error=str(e))
-    for r in rules["review"]:
-        try:
-            if _safe_eval(r["when"], flat_ctx):
-                review_flags.append(r["id"])
-        except Exception as e:
-            log_event("rule_eval_error", rule=r.get("id"), error=str(e))
+    for out, group in ((fraud_flags, rules.fraud), (review_flags, rules.review)):
+        for r in group:
+            if skip_missing and not all(_has_path(context, p) for p in r.paths):
+                continue
+            try:
+                if r.fn(env):
+                    out.append(r.id)
+            except Exception as e:
+                log_event("rule_eval_error", rule=r.id, error=str(e))
     return fraud_flags, review_flags
 
-def _flatten_context(ctx: Dict[str, Any], prefix: str = "", out=None):
-    if out is None:
-        out = {}
-    for k, v in ctx.items():
-        key = f"{prefix}{k}" if prefix else k
-        if isinstance(v, dict):
-            _flatten_context(v, key + ".", out)
+_MISSING = object()
+
+def _columns(contexts: List[Dict[str, Any]], paths: List[Path]):
+    cols: Dict[Path, np.ndarray] = {}
+    missing: Dict[Path, np.ndarray] = {}
+    for path in paths:
+        vals = []
+        for ctx in contexts:
+            v = ctx
+            for k in path:
+                v = v.get(k, _MISSING) if isinstance(v, dict) else _MISSING
+            vals.append(v)
+        ok = np.array([v is not _MISSING and v is not None for v in vals], dtype=bool)
+        present = [v for v, o in zip(vals, ok) if o]
+        if all(isinstance(v, (bool, int, float, np.number, np.bool_)) for v in present):
+            cols[path] = np.array([float(v) if o else np.nan for v, o in zip(vals, ok)], dtype=np.float64)
         else:
-            out[key] = v
+            cols[path] = np.array([v if o else None for v, o in zip(vals, ok)], dtype=object)
+        missing[path] = ~ok
+    return cols, missing
+
+def evaluate_rules_batch(contexts: List[Dict[str, Any]], rules: RuleSet | None = None) -> Dict[str, np.ndarray]:
+    """
+    Modo vectorizado: evalúa todo el conjunto sobre un lote de contextos.
+    Devuelve {rule_id: máscara bool por contexto}, igual a evaluate_rules fila
+    por fila: un campo ausente solo anula la regla si la evaluación escalar
+    llegaría a leerlo (un 'or' ya verdadero o un 'and' ya falso no lo necesita).
+    """
+    rules = rules or load_rules()
+    n = len(contexts)
+    env = _columns(contexts, rules.paths)
+    out: Dict[str, np.ndarray] = {}
+    for r in rules.rules:
+        try:
+            val, err = r.vec(env)
+            hit = np.broadcast_to(np.asarray(val, dtype=bool) & ~np.asarray(err, dtype=bool), (n,))
+        except TypeError:
+            # Tipos mixtos en una columna object: regla por regla, fila por fila
+            hit = np.array([_safe_call(r, ctx) for ctx in contexts], dtype=bool)
+        out[r.id] = hit
     return out
 
-def reload_rules():
-    global _cached
-    _cached = None
-    load_rules()
-    log_event("rules_reloaded")
\ No newline at end of file
+def _safe_call(rule: CompiledRule, ctx: Dict[str, Any]) -> bool:
+    try:
+        return bool(rule.fn(_PathView(ctx)))
+    except Exception:
+        return False
+
+def batch_flags(masks: Dict[str, np.ndarray], rules: RuleSet | None = None) -> List[Tuple[List[str], List[str]]]:
+    """Convierte las máscaras de evaluate_rules_batch en (fraud, review) por contexto."""
+    rules = rules or load_rules()
+    n = len(next(iter(masks.values()))) if masks else 0
+    return [
+        ([r.id for r in rules.fraud if masks[r.id][i]], [r.id for r in rules.review if masks[r.id][i]])
+        for i in range(n)
+    ]
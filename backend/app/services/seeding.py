@@ -0,0 +1,89 @@
+import multiprocessing, random, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from pymongo.errors import BulkWriteError
+from ..logging_utils import log_event
+from ..utils.random_data import gen_vehicle_record, gen_driver_record
+
+# Los generadores reciben rng=: un random.Random propio no toca el RNG global del proceso
+GENERATORS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "vehicles": gen_vehicle_record,
+    "drivers": gen_driver_record,
+}
+
+def _collection(kind: str):
+    from ..database import vehicles_col, drivers_col
+    return {"vehicles": vehicles_col, "drivers": drivers_col}[kind]
+
+def record_chunks(kind: str, count: int, chunk_size: int,
+                  rng: Optional[random.Random] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Genera los registros por bloques: memoria acotada a chunk_size."""
+    gen = GENERATORS[kind]
+    rng = rng or random.Random()
+    remaining = count
+    while remaining > 0:
+        n = min(chunk_size, remaining)
+        yield [gen(rng=rng) for _ in range(n)]
+        remaining -= n
+
+def _seed_range(kind: str, count: int, chunk_size: int, seed: Optional[int]) -> Dict[str, int]:
+    # Corre en el proceso actual o en un worker (spawn: cliente Mongo propio)
+    rng = random.Random(seed)
+    col = _collection(kind)
+    inserted = duplicates = 0
+    for chunk in record_chunks(kind, count, chunk_size, rng):
+        try:
+            res = col.insert_many(chunk, ordered=False)
+            inserted += len(res.inserted_ids)
+        except BulkWriteError as e:
+            # unordered: los duplicados (placa única) no frenan el resto del bloque
+            errors = e.details.get("writeErrors", [])
+            inserted += e.details.get("nInserted", 0)
+            duplicates += sum(1 for err in errors if err.get("code") == 11000)
+            if any(err.get("code") != 11000 for err in errors) or e.details.get("writeConcernErrors"):
+                raise
+    return {"inserted": inserted, "duplicates": duplicates}
+
+def _split(count: int, parts: int) -> List[int]:
+    base, extra = divmod(count, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+def seed_stream(
+    kind: str,
+    count: int,
+    chunk_size: int = 5000,
+    workers: int = 1,
+    seed: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Inserta count registros de kind ('vehicles' | 'drivers') en bloques con
+    insert_many no ordenado. Con workers > 1 reparte el conteo entre procesos;
+    con seed el worker i usa seed + i (resultado reproducible).
+    """
+    if kind not in GENERATORS:
+        raise ValueError(f"kind desconocido: {kind}")
+    workers = max(1, min(workers, count or 1))
+    chunk_size = max(1, chunk_size)
+    t0 = time.perf_counter()
+    if workers == 1:
+        parts = [_seed_range(kind, count, chunk_size, seed)]
+    else:
+        seeds = [None if seed is None else seed + i for i in range(workers)]
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as ex:
+            parts = list(ex.map(_seed_range, [kind] * workers, _split(count, workers),
+                                [chunk_size] * workers, seeds))
+    elapsed = time.perf_counter() - t0
+    inserted = sum(p["inserted"] for p in parts)
+    out = {
+        "kind": kind,
+        "requested": count,
+        "inserted": inserted,
+        "duplicates": sum(p["duplicates"] for p in parts),
+        "workers": workers,
+        "chunk_size": chunk_size,
+        "elapsed_s": round(elapsed, 3),
+        "records_per_s": round(inserted / elapsed, 1) if elapsed else 0.0
+    }
+    log_event("seed_done", **out)
+    return out
@@ -80,7 +80,7 @@ def _exif_analyze(pil: Image.Image):
                 flags.append("MISSING_DateTimeOriginal")
     return {"flags": flags or []}
 
-def analyze_tamper(img_bytes: bytes):
+def analyze_tamper(img_bytes: bytes, use_cnn: bool = True):
     if not settings.ENABLE_TAMPER_DETECTION:
         return None
     try:
@@ -101,7 +101,7 @@ def analyze_tamper(img_bytes: bytes):
     block_vals = np.array(block_vals)
     block_std = float(block_vals.std()) if block_vals.size else 0.0
     rgb = np.array(pil)
-    cnn_score = _cnn_score(rgb)
+    cnn_score = _cnn_score(rgb) if use_cnn else None
     exif_report = _exif_analyze(pil)
     suspect_reasons = []
     if mean_diff > settings.TAMPER_ELA_MEAN_THRESHOLD and block_std > settings.TAMPER_BLOCK_DIFF_THRESHOLD:
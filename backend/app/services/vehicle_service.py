@@ -1,14 +1,24 @@
 from typing import Optional, List
 from ..database import vehicles_col
+from ..database_async import vehicles_acol
 from ..utils.random_data import gen_vehicle_record
+from .reference_cache import vehicle_cache
+from .seeding import seed_stream
 
 def get_vehicle(plate: str):
-    return vehicles_col.find_one({"plate": plate.upper()},{"_id":0})
+    key = plate.upper()
+    doc = vehicle_cache.get(key)
+    if doc is None:
+        doc = vehicles_col.find_one({"plate": key},{"_id":0})
+        if doc:
+            vehicle_cache.put(key, doc)
+    return doc
 
 def create_vehicle(plate: Optional[str] = None):
-    doc = gen_vehicle_record(plate)
+    doc = gen_vehicle_record(plate.upper() if plate else None)
     vehicles_col.insert_one(doc)
     doc.pop("_id", None)
+    vehicle_cache.put(doc["plate"], doc)
     return doc
 
 def get_or_create_vehicle(plate: str):
@@ -17,12 +27,32 @@ def get_or_create_vehicle(plate: str):
         return existing
     return create_vehicle(plate)
 
-def seed_vehicles(n: int = 50):
-    bulk = [gen_vehicle_record() for _ in range(n)]
-    if bulk:
-        vehicles_col.insert_many(bulk)
-    return n
+def seed_vehicles(n: int = 50, chunk_size: int = 5000, workers: int = 1, seed: Optional[int] = None):
+    return seed_stream("vehicles", n, chunk_size, workers, seed)["inserted"]
 
 def list_vehicle_plates(limit=50) -> List[str]:
     cur = vehicles_col.find({}, {"plate":1, "_id":0}).limit(limit)
-    return [c["plate"] for c in cur]
\ No newline at end of file
+    return [c["plate"] for c in cur]
+
+# --- Variantes async (handlers) ---
+async def get_vehicle_async(plate: str):
+    key = plate.upper()
+    doc = vehicle_cache.get(key)
+    if doc is None:
+        doc = await vehicles_acol.find_one({"plate": key},{"_id":0})
+        if doc:
+            vehicle_cache.put(key, doc)
+    return doc
+
+async def create_vehicle_async(plate: Optional[str] = None):
+    doc = gen_vehicle_record(plate.upper() if plate else None)
+    await vehicles_acol.insert_one(doc)
+    doc.pop("_id", None)
+    vehicle_cache.put(doc["plate"], doc)
+    return doc
+
+async def get_or_create_vehicle_async(plate: str):
+    existing = await get_vehicle_async(plate)
+    if existing:
+        return existing
+    return await create_vehicle_async(plate)
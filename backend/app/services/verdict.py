@@ -0,0 +1,3 @@
+from .inspection_service import _compute_verdict as compute_verdict
+
+__all__ = ["compute_verdict"]
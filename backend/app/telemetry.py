@@ -0,0 +1,112 @@
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from prometheus_client import Histogram
+from .config import settings
+from .logging_utils import log_event
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except Exception:
+    trace = None
+
+STAGE_LAT = Histogram(
+    "inspection_stage_seconds",
+    "Latencia por etapa del pipeline de inspección",
+    ["stage", "outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+# Desglose por request (solo se activa con debug=1)
+_breakdown: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("stage_breakdown", default=None)
+_tracer = None
+_provider = None
+_trace_file = None  # handle del exporter 'file' (ConsoleSpanExporter no lo cierra)
+
+def _build_exporter():
+    global _trace_file
+    kind = settings.TRACING_EXPORTER.lower()
+    if kind == "file":
+        _trace_file = open(settings.TRACING_FILE_PATH, "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=_trace_file, formatter=lambda span: span.to_json(indent=None) + "\n")
+    if kind == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        except Exception:
+            log_event("tracing_exporter_missing", exporter=kind)
+            return None
+        return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT, insecure=True)
+    log_event("tracing_exporter_unknown", exporter=kind)
+    return None
+
+def setup_tracing():
+    """
+    Configura OpenTelemetry si está habilitado e instalado.
+    Sin ENABLE_TRACING (o sin el paquete) las etapas solo alimentan Prometheus.
+    """
+    global _tracer, _provider
+    if not settings.ENABLE_TRACING:
+        return None
+    if trace is None:
+        log_event("tracing_unavailable", reason="opentelemetry_not_installed")
+        return None
+    exporter = _build_exporter()
+    if exporter is None:
+        return None
+    _provider = TracerProvider(resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    _tracer = trace.get_tracer("inspection.pipeline")
+    log_event("tracing_enabled", exporter=settings.TRACING_EXPORTER)
+    return _tracer
+
+def shutdown_tracing():
+    """Hook de shutdown: vacía los spans pendientes del BatchSpanProcessor y cierra el archivo."""
+    global _tracer, _provider, _trace_file
+    _tracer = None
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+    if _trace_file is not None:
+        _trace_file.close()
+        _trace_file = None
+
+def start_breakdown() -> List[Dict[str, Any]]:
+    """
+    Activa el registro de etapas para el request actual y devuelve la lista
+    (se sigue llenando hasta que termina el request).
+    """
+    items: List[Dict[str, Any]] = []
+    _breakdown.set(items)
+    return items
+
+def span(name: str, **attrs: Any):
+    """Span raíz (sin histograma); no-op si el tracing está apagado."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attrs)
+
+@contextmanager
+def stage(name: str, **attrs: Any):
+    """
+    Mide una etapa: histograma (stage, outcome), span OTel opcional y
+    entrada en el desglose debug. El bloque puede fijar rec["outcome"].
+    """
+    rec = {"outcome": "ok"}
+    t0 = time.perf_counter()
+    with span(f"stage.{name}", **attrs):
+        try:
+            yield rec
+        except Exception:
+            rec["outcome"] = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            STAGE_LAT.labels(name, rec["outcome"]).observe(elapsed)
+            items = _breakdown.get()
+            if items is not None:
+                items.append({"stage": name, "ms": round(elapsed * 1000, 2), "outcome": rec["outcome"]})
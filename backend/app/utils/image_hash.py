@@ -0,0 +1,36 @@
+import cv2
+import numpy as np
+from typing import Dict, Optional
+
+HASH_SIZE = 8
+_SMALL = 32  # gray reducido compartido por pHash y dHash
+
+def small_gray(gray: np.ndarray) -> np.ndarray:
+    return cv2.resize(gray, (_SMALL, _SMALL), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    out = 0
+    for b in bits.ravel():
+        out = (out << 1) | int(b)
+    return out
+
+def phash(small: np.ndarray) -> int:
+    """pHash 64 bits: DCT del gray 32x32, bloque 8x8 de bajas frecuencias contra su mediana."""
+    low = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE]
+    med = np.median(low.ravel()[1:])  # sin el término DC
+    return _bits_to_int(low > med)
+
+def dhash(small: np.ndarray) -> int:
+    """dHash 64 bits: gradiente horizontal sobre 9x8."""
+    tiny = cv2.resize(small, (HASH_SIZE + 1, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    return _bits_to_int(tiny[:, 1:] > tiny[:, :-1])
+
+def image_hashes(gray: np.ndarray) -> Dict[str, str]:
+    """Hex de 16 caracteres (64 bits no entran en int64 de BSON)."""
+    small = small_gray(gray)
+    return {"phash": f"{phash(small):016x}", "dhash": f"{dhash(small):016x}"}
+
+def hamming(a: Optional[str], b: Optional[str]) -> int:
+    if not a or not b:
+        return 64
+    return (int(a, 16) ^ int(b, 16)).bit_count()
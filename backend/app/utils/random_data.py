@@ -15,62 +15,62 @@ FINE_TYPES = [
 SEVERITIES = ["LOW","MEDIUM","HIGH"]
 PARTS_IMPACT = ["front_bumper","rear_bumper","hood","door_left","door_right","trunk","windshield"]
 
-def random_plate():
-    return ''.join(random.choices(string.ascii_uppercase, k=3)) + ''.join(random.choices(string.digits, k=3))
+def random_plate(rng=random):
+    return ''.join(rng.choices(string.ascii_uppercase, k=3)) + ''.join(rng.choices(string.digits, k=3))
 
-def random_owner_name():
+def random_owner_name(rng=random):
     names = ["Juan","Ana","Pedro","Laura","Carlos","Sofia","Diego","Paula","Miguel","Camila","Andres","Valentina"]
     last = ["Gomez","Perez","Ruiz","Martinez","Sanchez","Torres","Luna","Ramirez","Lopez","Vargas"]
-    return random.choice(names) + " " + random.choice(last)
+    return rng.choice(names) + " " + rng.choice(last)
 
-def rand_date_future(days=365):
+def rand_date_future(days=365, rng=random):
     base = datetime.datetime.utcnow()
-    delta = datetime.timedelta(days=random.randint(15, days))
+    delta = datetime.timedelta(days=rng.randint(15, days))
     return (base + delta).strftime("%Y-%m-%d")
 
-def rand_date_past(days=365*5):
+def rand_date_past(days=365*5, rng=random):
     base = datetime.datetime.utcnow()
-    delta = datetime.timedelta(days=random.randint(15, days))
+    delta = datetime.timedelta(days=rng.randint(15, days))
     return (base - delta).strftime("%Y-%m-%d")
 
-def hash_document(name):
-    return hashlib.sha256((name + str(random.random())).encode()).hexdigest()[:16]
+def hash_document(name, rng=random):
+    return hashlib.sha256((name + str(rng.random())).encode()).hexdigest()[:16]
 
-def gen_fines(max_count=5):
+def gen_fines(max_count=5, rng=random):
     fines = []
-    count = random.randint(0,max_count)
+    count = rng.randint(0,max_count)
     for _ in range(count):
-        t, pts = random.choice(FINE_TYPES)
-        amount = round(random.uniform(80, 900) * (pts/4),2)
+        t, pts = rng.choice(FINE_TYPES)
+        amount = round(rng.uniform(80, 900) * (pts/4),2)
         fines.append({
-            "code": ''.join(random.choices(string.ascii_uppercase+string.digits, k=6)),
+            "code": ''.join(rng.choices(string.ascii_uppercase+string.digits, k=6)),
             "type": t,
             "amount": amount,
-            "issued_at": rand_date_past(900),
-            "status": random.choice(["PAID","PENDING","IN_APPEAL"]),
+            "issued_at": rand_date_past(900, rng),
+            "status": rng.choice(["PAID","PENDING","IN_APPEAL"]),
             "points": pts
         })
     return fines
 
-def gen_accidents():
+def gen_accidents(rng=random):
     arr=[]
-    for _ in range(random.randint(0,3)):
+    for _ in range(rng.randint(0,3)):
         arr.append({
-            "date": rand_date_past(1500),
-            "severity": random.choice(SEVERITIES),
-            "part_impacted": random.choice(PARTS_IMPACT),
-            "claim_cost": round(random.uniform(200, 5000),2)
+            "date": rand_date_past(1500, rng),
+            "severity": rng.choice(SEVERITIES),
+            "part_impacted": rng.choice(PARTS_IMPACT),
+            "claim_cost": round(rng.uniform(200, 5000),2)
         })
     return arr
 
-def gen_claims():
+def gen_claims(rng=random):
     arr=[]
-    for _ in range(random.randint(0,2)):
+    for _ in range(rng.randint(0,2)):
         arr.append({
-            "date": rand_date_past(1200),
-            "provider": random.choice(INSURERS),
-            "amount": round(random.uniform(150, 4000),2),
-            "status": random.choice(["OPEN","CLOSED","REJECTED"])
+            "date": rand_date_past(1200, rng),
+            "provider": rng.choice(INSURERS),
+            "amount": round(rng.uniform(150, 4000),2),
+            "status": rng.choice(["OPEN","CLOSED","REJECTED"])
         })
     return arr
 
@@ -80,41 +80,41 @@ def compute_vehicle_risk(fines, accidents):
     base = 0.15 + 0.02*pts + 0.04*sev
     return round(min(base, 0.95), 3)
 
-def gen_vehicle_record(plate=None):
-    plate = plate or random_plate()
-    owner_name = random_owner_name()
-    fines = gen_fines()
-    accidents = gen_accidents()
-    claims = gen_claims()
+def gen_vehicle_record(plate=None, rng=random):
+    plate = plate or random_plate(rng)
+    owner_name = random_owner_name(rng)
+    fines = gen_fines(rng=rng)
+    accidents = gen_accidents(rng)
+    claims = gen_claims(rng)
     risk = compute_vehicle_risk(fines, accidents)
     now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
     return {
         "plate": plate,
-        "brand": random.choice(BRANDS),
-        "model": random.choice(MODELS),
-        "year": random.randint(2012, 2024),
-        "color": random.choice(COLORS),
-        "vin": ''.join(random.choices(string.ascii_uppercase+string.digits, k=17)),
-        "owner_id": hash_document(owner_name),
+        "brand": rng.choice(BRANDS),
+        "model": rng.choice(MODELS),
+        "year": rng.randint(2012, 2024),
+        "color": rng.choice(COLORS),
+        "vin": ''.join(rng.choices(string.ascii_uppercase+string.digits, k=17)),
+        "owner_id": hash_document(owner_name, rng),
         "ownership": {
             "owner_name": owner_name,
-            "document_hash": hash_document(owner_name),
-            "since": rand_date_past(2000)
+            "document_hash": hash_document(owner_name, rng),
+            "since": rand_date_past(2000, rng)
         },
         "registration": {
-            "runt_id": ''.join(random.choices(string.ascii_uppercase+string.digits, k=10)),
-            "registered_at": rand_date_past(4000),
-            "status": random.choice(["ACTIVE","SUSPENDED","PENDING"])
+            "runt_id": ''.join(rng.choices(string.ascii_uppercase+string.digits, k=10)),
+            "registered_at": rand_date_past(4000, rng),
+            "status": rng.choice(["ACTIVE","SUSPENDED","PENDING"])
         },
         "soat": {
-            "policy_number": ''.join(random.choices(string.digits, k=12)),
-            "insurer": random.choice(INSURERS),
-            "expires": rand_date_future(380),
+            "policy_number": ''.join(rng.choices(string.digits, k=12)),
+            "insurer": rng.choice(INSURERS),
+            "expires": rand_date_future(380, rng),
             "active": True
         },
         "tech_review": {
-            "center": "CENTRO_"+''.join(random.choices(string.ascii_uppercase, k=3)),
-            "expires": rand_date_future(480),
+            "center": "CENTRO_"+''.join(rng.choices(string.ascii_uppercase, k=3)),
+            "expires": rand_date_future(480, rng),
             "passed": True
         },
         "fines": fines,
@@ -124,26 +124,26 @@ def gen_vehicle_record(plate=None):
         "last_update": now
     }
 
-def gen_driver_record():
-    name = random_owner_name()
+def gen_driver_record(rng=random):
+    name = random_owner_name(rng)
     infractions=[]
-    for _ in range(random.randint(0,4)):
-        t, pts = random.choice(FINE_TYPES)
+    for _ in range(rng.randint(0,4)):
+        t, pts = rng.choice(FINE_TYPES)
         infractions.append({
-            "code": ''.join(random.choices(string.ascii_uppercase+string.digits, k=6)),
+            "code": ''.join(rng.choices(string.ascii_uppercase+string.digits, k=6)),
             "type": t,
             "points": pts,
-            "resolved": random.choice([True, False])
+            "resolved": rng.choice([True, False])
         })
-    risk = round(0.1 + 0.05*len(infractions) + random.uniform(0,0.3),3)
+    risk = round(0.1 + 0.05*len(infractions) + rng.uniform(0,0.3),3)
     return {
-        "driver_id": hash_document(name),
+        "driver_id": hash_document(name, rng),
         "name": name,
-        "license_category": random.choice(["A2","B1","B2","C1","C2"]),
-        "license_expires": rand_date_future(900),
-        "years_experience": random.randint(1,25),
+        "license_category": rng.choice(["A2","B1","B2","C1","C2"]),
+        "license_expires": rand_date_future(900, rng),
+        "years_experience": rng.randint(1,25),
         "infractions_history": infractions,
-        "accident_count": random.randint(0,5),
+        "accident_count": rng.randint(0,5),
         "risk_factor": min(risk,0.95),
         "simulated": True
     }
\ No newline at end of file
@@ -1,42 +1,137 @@
-from typing import Dict, Set
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from fastapi import WebSocket
 from asyncio import Lock
+from prometheus_client import Counter, Gauge
+from .config import settings
 from .logging_utils import log_event
+from .telemetry import stage
+from .ws_pubsub import InProcessBackend, PubSubBackend, build_backend, dumps_payload
+
+WS_CONNECTIONS = Gauge("ws_connections", "Sockets abiertos en este worker")
+WS_EVENTS = Counter("ws_events_total", "Eventos publicados", ["event"])
+WS_DROPPED = Counter("ws_dropped_total", "Mensajes o clientes descartados", ["reason"])
+
+class _Client:
+    """
+    Socket con cola de salida acotada y tarea de envío propia: un cliente
+    lento no frena al resto. Cola llena → se descarta el mensaje más viejo
+    (los progress intermedios son reemplazables); envío que supera
+    WS_SEND_TIMEOUT_S → se cierra el socket.
+    """
+    def __init__(self, ws: WebSocket, on_dead):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.WS_SEND_QUEUE_MAX))
+        self._on_dead = on_dead
+        self.task = asyncio.create_task(self._sender())
+
+    def offer(self, text: str):
+        if self.queue.full():
+            self.queue.get_nowait()
+            WS_DROPPED.labels("queue_full").inc()
+        self.queue.put_nowait(text)
+
+    async def _sender(self):
+        while True:
+            text = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.ws.send_text(text), settings.WS_SEND_TIMEOUT_S)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                WS_DROPPED.labels("timeout" if isinstance(e, asyncio.TimeoutError) else "send_error").inc()
+                await self._on_dead(self)
+                return
 
 class WSManager:
-    def __init__(self):
-        self._sessions: Dict[str, Set[WebSocket]] = {}
+    def __init__(self, backend: Optional[PubSubBackend] = None):
+        self._sessions: Dict[str, Dict[WebSocket, _Client]] = {}
         self._lock = Lock()
+        self._backend = backend or InProcessBackend()
+        self._started = False
+        # Interés por sesión (sockets locales + watchers): decide subscribe/unsubscribe
+        self._interest: Dict[str, int] = {}
+        self._listeners: List[Callable[[str, Dict[str, Any]], Awaitable[None]]] = []
+
+    async def start(self, backend: Optional[PubSubBackend] = None):
+        """Conecta el backend pub/sub (WS_PUBSUB_BACKEND) y reentrega a los sockets locales."""
+        if backend is not None or not self._started:
+            self._backend = backend or build_backend()
+        await self._backend.start(self._deliver)
+        self._started = True
+        log_event("ws_pubsub_started", backend=self._backend.name)
+
+    async def stop(self):
+        await self._backend.stop()
+        self._started = False
 
     async def connect(self, session_id: str, ws: WebSocket):
         await ws.accept()
         async with self._lock:
-            self._sessions.setdefault(session_id, set()).add(ws)
+            self._sessions.setdefault(session_id, {})[ws] = _Client(ws, lambda c: self._drop(session_id, c))
+        await self.watch(session_id)
+        WS_CONNECTIONS.inc()
         log_event("ws_connect", session_id=session_id)
 
     async def disconnect(self, session_id: str, ws: WebSocket):
+        if await self._remove(session_id, ws):
+            log_event("ws_disconnect", session_id=session_id)
+
+    async def _remove(self, session_id: str, ws: WebSocket) -> bool:
         async with self._lock:
-            conns = self._sessions.get(session_id, set())
-            if ws in conns:
-                conns.remove(ws)
-            if not conns and session_id in self._sessions:
+            conns = self._sessions.get(session_id, {})
+            client = conns.pop(ws, None)
+            if client is not None and not conns:
                 self._sessions.pop(session_id, None)
-        log_event("ws_disconnect", session_id=session_id)
+        if client is None:
+            return False
+        if client.task is not asyncio.current_task():
+            client.task.cancel()
+        await self.unwatch(session_id)
+        WS_CONNECTIONS.dec()
+        return True
 
-    async def broadcast(self, session_id: str, payload: dict):
-        async with self._lock:
-            conns = list(self._sessions.get(session_id, []))
-        dead = []
-        for ws in conns:
+    async def watch(self, session_id: str):
+        """Recibe eventos de la sesión en este worker aunque no tenga sockets (p.ej. cancelaciones)."""
+        self._interest[session_id] = self._interest.get(session_id, 0) + 1
+        if self._interest[session_id] == 1:
+            await self._backend.subscribe(session_id)
+
+    async def unwatch(self, session_id: str):
+        n = self._interest.get(session_id, 0) - 1
+        if n > 0:
+            self._interest[session_id] = n
+            return
+        self._interest.pop(session_id, None)
+        await self._backend.unsubscribe(session_id)
+
+    def add_listener(self, fn: Callable[[str, Dict[str, Any]], Awaitable[None]]):
+        """Callback por evento entregado a este worker (antes de encolar a los sockets)."""
+        self._listeners.append(fn)
+
+    async def _drop(self, session_id: str, client: _Client):
+        if await self._remove(session_id, client.ws):
             try:
-                await ws.send_json(payload)
+                await client.ws.close(code=1013)
             except Exception:
-                dead.append(ws)
-        if dead:
-            async with self._lock:
-                for d in dead:
-                    self._sessions.get(session_id, set()).discard(d)
+                pass
+            log_event("ws_slow_client_dropped", session_id=session_id)
+
+    async def _deliver(self, session_id: str, payload: Dict[str, Any]):
+        # Llamado por el backend en cada worker: serializa una vez y solo encola (no bloquea)
+        for fn in self._listeners:
+            await fn(session_id, payload)
+        clients = list(self._sessions.get(session_id, {}).values())
+        if not clients:
+            return
+        text = dumps_payload(payload)
+        for client in clients:
+            client.offer(text)
+
+    async def broadcast(self, session_id: str, payload: dict):
+        with stage("ws_broadcast"):
+            await self._backend.publish(session_id, payload)
         if payload.get("event"):
-            log_event("ws_event", session_id=session_id, event=payload["event"])
+            WS_EVENTS.labels(payload["event"]).inc()
 
-manager = WSManager()
\ No newline at end of file
+manager = WSManager()
@@ -0,0 +1,198 @@
+import asyncio, json, threading
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from pymongo.errors import OperationFailure, PyMongoError
+from .config import settings
+from .logging_utils import log_event
+
+try:  # opcional: solo con WS_PUBSUB_BACKEND=redis
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover
+    aioredis = None
+
+Handler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+# Reintentos del change stream (failover, red): backoff exponencial con tope
+CHANGE_STREAM_RETRY_S = (0.5, 30.0)
+CHANGE_STREAM_HISTORY_LOST = 286  # el resume token ya salió del oplog
+STOP_JOIN_TIMEOUT_S = 5.0
+
+class PubSubBackend:
+    """
+    Reparte eventos de sesión entre workers. Cada worker llama start(handler)
+    una vez y subscribe/unsubscribe según tenga sockets locales de la sesión;
+    publish entrega a todos los workers suscritos (incluido el propio).
+    """
+    name = "base"
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, session_id: str):
+        pass
+
+    async def unsubscribe(self, session_id: str):
+        pass
+
+    async def publish(self, session_id: str, payload: Dict[str, Any]):
+        raise NotImplementedError
+
+class InProcessBackend(PubSubBackend):
+    """Un solo worker (o tests): entrega directa, sin serializar."""
+    name = "memory"
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+
+    async def publish(self, session_id: str, payload: Dict[str, Any]):
+        if self._handler:
+            await self._handler(session_id, payload)
+
+def dumps_payload(payload: Dict[str, Any]) -> str:
+    # Resultados de jobs pueden traer datetimes
+    return json.dumps(payload, default=str)
+
+class RedisBackend(PubSubBackend):
+    """Redis pub/sub: un canal por sesión; el worker solo se suscribe a las que tiene abiertas."""
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str):
+        self._url, self._prefix = url, prefix
+        self._redis = None
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._redis = aioredis.from_url(self._url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self._redis is not None:
+            await self._redis.close()
+
+    async def subscribe(self, session_id: str):
+        await self._pubsub.subscribe(self._prefix + session_id)
+
+    async def unsubscribe(self, session_id: str):
+        await self._pubsub.unsubscribe(self._prefix + session_id)
+
+    async def publish(self, session_id: str, payload: Dict[str, Any]):
+        await self._redis.publish(self._prefix + session_id, dumps_payload(payload))
+
+    async def _listen(self):
+        while True:
+            try:
+                msg = await self._pubsub.get_message(timeout=1.0)
+                if not msg:
+                    continue
+                channel = msg["channel"].decode() if isinstance(msg["channel"], bytes) else msg["channel"]
+                await self._handler(channel[len(self._prefix):], json.loads(msg["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_event("ws_pubsub_error", backend=self.name, error=str(e))
+                await asyncio.sleep(1.0)
+
+class MongoChangeStreamBackend(PubSubBackend):
+    """
+    Inserta cada evento en una colección (TTL corto) y lo recibe por change
+    stream (requiere replica set). El stream corre en un hilo, como los de
+    reference_cache, y reentrega en el loop; se filtran sesiones no locales.
+    Si el stream se cae se reabre con backoff desde el último resume token,
+    así no se pierden eventos insertados mientras tanto.
+    """
+    name = "mongo"
+
+    def __init__(self, collection: str):
+        from .database import db
+        from .database_async import async_db
+        self._col, self._acol = db[collection], async_db[collection]
+        self._sessions: Set[str] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._resume_token: Optional[Dict[str, Any]] = None
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._loop = asyncio.get_running_loop()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, daemon=True, name="ws_change_stream")
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            # try_next espera a lo sumo max_await_time_ms; no bloquear el loop mientras
+            await asyncio.to_thread(self._thread.join, STOP_JOIN_TIMEOUT_S)
+            if self._thread.is_alive():
+                log_event("change_stream_stop_timeout", collection=self._col.name)
+            self._thread = None
+
+    async def subscribe(self, session_id: str):
+        self._sessions.add(session_id)
+
+    async def unsubscribe(self, session_id: str):
+        self._sessions.discard(session_id)
+
+    async def publish(self, session_id: str, payload: Dict[str, Any]):
+        await self._acol.insert_one({
+            "session_id": session_id, "payload": json.loads(dumps_payload(payload)), "created_at": datetime.utcnow()
+        })
+
+    def _watch(self):
+        self._retry_delay = CHANGE_STREAM_RETRY_S[0]
+        while not self._stop.is_set():
+            try:
+                self._stream_once()
+                return
+            except (NotImplementedError, AttributeError) as e:
+                # Sin soporte de change streams (mongomock): no tiene sentido reintentar
+                log_event("change_stream_unavailable", collection=self._col.name, error=str(e))
+                return
+            except PyMongoError as e:
+                if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST:
+                    self._resume_token = None
+                delay = self._retry_delay
+                log_event("change_stream_retry", collection=self._col.name, error=str(e), retry_in_s=delay)
+            if self._stop.wait(delay):
+                return
+            self._retry_delay = min(delay * 2, CHANGE_STREAM_RETRY_S[1])
+
+    def _stream_once(self):
+        with self._col.watch(
+            [{"$match": {"operationType": "insert"}}], max_await_time_ms=1000, resume_after=self._resume_token
+        ) as stream:
+            self._retry_delay = CHANGE_STREAM_RETRY_S[0]  # abierto: el próximo corte reintenta rápido
+            while not self._stop.is_set():
+                change = stream.try_next()
+                # También avanza con lotes vacíos (postBatchResumeToken)
+                if stream.resume_token is not None:
+                    self._resume_token = stream.resume_token
+                if change is None:
+                    continue
+                doc = change["fullDocument"]
+                if doc["session_id"] in self._sessions:
+                    asyncio.run_coroutine_threadsafe(self._handler(doc["session_id"], doc["payload"]), self._loop)
+
+def build_backend(kind: Optional[str] = None) -> PubSubBackend:
+    kind = (kind or settings.WS_PUBSUB_BACKEND).lower()
+    if kind == "redis":
+        if aioredis is None:
+            log_event("ws_pubsub_unavailable", backend=kind, error="redis no instalado; se usa memory")
+            return InProcessBackend()
+        return RedisBackend(settings.WS_REDIS_URL, settings.WS_CHANNEL_PREFIX)
+    if kind == "mongo":
+        return MongoChangeStreamBackend(settings.WS_MONGO_COLLECTION)
+    return InProcessBackend()
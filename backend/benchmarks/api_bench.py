@@ -0,0 +1,220 @@
+"""
+Benchmark end-to-end de /inspection/analyze + /inspection/finalize.
+
+Uso (desde backend/):
+    python -m benchmarks.api_bench --sessions 16 --concurrency 4 --images 4 \\
+        --resolutions 1280x720,1920x1080,4032x3024
+    python -m benchmarks.api_bench --compare benchmarks/results/api_baseline.json
+
+Por defecto corre la app en proceso contra mongomock, con modelos stub donde
+faltan los pesos. --mongo-uri usa una base efímera real (se elimina al final)
+y --base-url apunta a un servidor ya levantado (p.ej. uvicorn con N workers).
+"""
+import argparse, asyncio, os, sys, time, uuid
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.common import (
+    parse_resolutions, synthetic_jpeg, use_mongomock, install_stub_models,
+    summarize, peak_rss_mb, stage_snapshot, stage_delta, run_meta,
+    write_results, load_results, compare_metrics, format_table
+)
+
+PHOTO_KEYS = ["front", "rear", "left", "right", "vin"]
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark E2E de la API de inspección")
+    ap.add_argument("--sessions", type=int, default=8, help="Sesiones medidas (analyze xN + finalize)")
+    ap.add_argument("--images", type=int, default=4, help="Imágenes por sesión")
+    ap.add_argument("--concurrency", type=int, default=2, help="Sesiones simultáneas")
+    ap.add_argument("--resolutions", default="1280x720,1920x1080,4032x3024")
+    ap.add_argument("--warmup", type=int, default=1, help="Sesiones de calentamiento (no medidas)")
+    ap.add_argument("--stub-latency-ms", type=float, default=0.0, help="Latencia simulada por inferencia stub")
+    ap.add_argument("--force-stub", action="store_true", help="Usar stubs aunque existan pesos reales")
+    ap.add_argument("--debug-timings", action="store_true", help="Enviar debug=1 y agregar stage_timings de la respuesta")
+    ap.add_argument("--mongo-uri", default=None, help="Mongo real; se crea y elimina una base efímera")
+    ap.add_argument("--base-url", default=None, help="Servidor externo en lugar de la app en proceso")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--out", default=None, help="Ruta del JSON (por defecto benchmarks/results/api_<ts>.json)")
+    ap.add_argument("--compare", default=None, help="JSON de referencia para detectar regresiones")
+    ap.add_argument("--threshold", type=float, default=0.15, help="Tolerancia de regresión (fracción)")
+    return ap.parse_args(argv)
+
+def _prepare_env(args) -> str | None:
+    # Debe correr antes de importar app.*
+    os.environ["RATE_LIMIT"] = "1000000/minute"
+    if args.base_url:
+        return None
+    if args.mongo_uri:
+        db_name = f"bench_{uuid.uuid4().hex[:8]}"
+        os.environ["MONGO_URI"] = args.mongo_uri
+        os.environ["MONGO_DB"] = db_name
+        return db_name
+    use_mongomock()
+    return None
+
+class _Recorder:
+    def __init__(self):
+        self.lat: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.stage_ms: Dict[str, List[float]] = {}
+
+    def add(self, key: str, dt: float, ok: bool):
+        self.lat.setdefault(key, [])
+        self.errors.setdefault(key, 0)
+        if ok:
+            self.lat[key].append(dt)
+        else:
+            self.errors[key] += 1
+
+    def add_stages(self, timings: List[Dict[str, Any]] | None):
+        for t in timings or []:
+            self.stage_ms.setdefault(t["stage"], []).append(t["ms"])
+
+async def _timed_post(client, path: str, **kw) -> Tuple[float, Any]:
+    t0 = time.perf_counter()
+    try:
+        r = await client.post(path, **kw)
+    except Exception:
+        return time.perf_counter() - t0, None
+    return time.perf_counter() - t0, r
+
+async def _run_session(client, idx: int, run_id: str, args, images, rec: _Recorder | None):
+    session_id = f"bench-{run_id}-{idx}"
+    plate = f"BEN{idx % 1000:03d}"
+    for j in range(args.images):
+        res_key, payload = images[(idx + j) % len(images)]
+        photo_key = PHOTO_KEYS[j % len(PHOTO_KEYS)]
+        dt, r = await _timed_post(
+            client, "/inspection/analyze",
+            data={
+                "session_id": session_id, "plate": plate, "photo_key": photo_key,
+                "debug": "1" if args.debug_timings else "0"
+            },
+            files={"file": (f"{photo_key}.jpg", payload, "image/jpeg")}
+        )
+        if rec is not None:
+            ok = r is not None and r.status_code == 200
+            rec.add("analyze", dt, ok)
+            rec.add(f"analyze@{res_key}", dt, ok)
+            if ok and args.debug_timings:
+                rec.add_stages(r.json().get("stage_timings"))
+    t0 = time.perf_counter()
+    dt, r = await _timed_post(client, "/inspection/finalize", data={"session_id": session_id, "plate": plate})
+    ok = r is not None and r.status_code == 202
+    if rec is not None:
+        rec.add("finalize_enqueue", dt, ok)
+    if ok:
+        ok = await _wait_job(client, r.json()["poll_url"], args.timeout)
+    if rec is not None:
+        rec.add("finalize", time.perf_counter() - t0, ok)
+
+async def _wait_job(client, poll_url: str, timeout: float, interval: float = 0.05) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            r = await client.get(poll_url)
+        except Exception:
+            return False
+        status = r.json().get("status") if r.status_code == 200 else "failed"
+        if status == "done":
+            return True
+        if status == "failed":
+            return False
+        await asyncio.sleep(interval)
+    return False
+
+async def _drive(args, images) -> Tuple[_Recorder, float, Dict[str, Any]]:
+    import httpx
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+    else:
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=args.timeout)
+    run_id = uuid.uuid4().hex[:6]
+    async with client:
+        for w in range(args.warmup):
+            await _run_session(client, 10_000 + w, run_id, args, images, None)
+        before = stage_snapshot() if not args.base_url else {}
+        rec = _Recorder()
+        sem = asyncio.Semaphore(max(1, args.concurrency))
+
+        async def one(i: int):
+            async with sem:
+                await _run_session(client, i, run_id, args, images, rec)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.sessions)))
+        wall = time.perf_counter() - t0
+    stages = stage_delta(before, stage_snapshot()) if not args.base_url else {}
+    return rec, wall, stages
+
+def _stage_summary_from_debug(rec: _Recorder) -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for name, vals in rec.stage_ms.items():
+        s = summarize([v / 1000 for v in vals])
+        out[name] = {"count": s["count"], "mean_ms": s["mean_ms"], "p50_ms": s["p50_ms"], "p95_ms": s["p95_ms"]}
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["mean_ms"]))
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    db_name = _prepare_env(args)
+    resolutions = parse_resolutions(args.resolutions)
+    images = [(f"{w}x{h}", synthetic_jpeg(w, h, seed=i)) for i, (w, h) in enumerate(resolutions)]
+
+    stubbed: List[str] = []
+    if not args.base_url:
+        stubbed = install_stub_models(args.stub_latency_ms, force=args.force_stub)
+
+    try:
+        rec, wall, stages = asyncio.run(_drive(args, images))
+    finally:
+        if db_name:
+            from app.database import client as mongo_client
+            mongo_client.drop_database(db_name)
+
+    endpoints = {
+        key: summarize(vals, rec.errors.get(key, 0), wall)
+        for key, vals in sorted(rec.lat.items())
+    }
+    if args.debug_timings:
+        stages = _stage_summary_from_debug(rec)
+    total_ok = sum(len(v) for k, v in rec.lat.items() if "@" not in k and k != "finalize_enqueue")
+    payload = {
+        "meta": run_meta(vars(args)),
+        "mode": "remote" if args.base_url else ("mongo" if db_name else "mongomock"),
+        "stubbed_models": stubbed,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total_ok / wall, 3) if wall else 0.0,
+        "sessions_per_s": round(args.sessions / wall, 3) if wall else 0.0,
+        "endpoints": endpoints,
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_scope": "client" if args.base_url else "in_process"
+    }
+    path = write_results(payload, "api", args.out)
+
+    rows = [[k, v["count"], v["errors"], v["p50_ms"], v["p95_ms"], v["p99_ms"], v.get("throughput_rps", "-")]
+            for k, v in endpoints.items()]
+    print(format_table(["endpoint", "n", "err", "p50_ms", "p95_ms", "p99_ms", "rps"], rows))
+    if stages:
+        print()
+        print(format_table(["stage", "n", "mean_ms"], [[k, v["count"], v["mean_ms"]] for k, v in stages.items()]))
+    print(f"\nwall={payload['wall_s']}s rps={payload['throughput_rps']} peak_rss={payload['peak_rss_mb']}MB -> {path}")
+
+    if args.compare:
+        base = load_results(args.compare)
+        lat_rows, lat_reg = compare_metrics(endpoints, base.get("endpoints", {}), "p95_ms", args.threshold)
+        thr_rows, thr_reg = compare_metrics(endpoints, base.get("endpoints", {}), "throughput_rps", args.threshold, higher_is_better=True)
+        print("\np95 vs baseline")
+        print(format_table(["endpoint", "base", "current", "delta", "status"], lat_rows))
+        print("\nthroughput vs baseline")
+        print(format_table(["endpoint", "base", "current", "delta", "status"], thr_rows))
+        if lat_reg or thr_reg:
+            print("\nREGRESSION detected")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
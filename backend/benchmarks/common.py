@@ -0,0 +1,256 @@
+"""
+Utilidades compartidas por los benchmarks: imágenes sintéticas, modelos stub,
+Mongo en memoria, percentiles y persistencia/comparación de resultados JSON.
+"""
+import json, os, platform, random, resource, subprocess, sys, time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import cv2
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+
+# ---------------- Imágenes ----------------
+def parse_resolutions(spec: str) -> List[Tuple[int, int]]:
+    out = []
+    for tok in spec.split(","):
+        tok = tok.strip().lower()
+        if not tok:
+            continue
+        w, h = tok.split("x")
+        out.append((int(w), int(h)))
+    return out
+
+def megapixels_to_size(mp: float, aspect: float = 4 / 3) -> Tuple[int, int]:
+    h = int(round((mp * 1_000_000 / aspect) ** 0.5))
+    return int(round(h * aspect)), h
+
+def synthetic_rgb(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """
+    Escena tipo 'vehículo sobre fondo': gradiente, carrocería de color sólido,
+    líneas finas (rayones) y ruido. Determinista por seed.
+    """
+    rng = np.random.default_rng(seed)
+    gy = np.linspace(60, 200, height, dtype=np.float32)[:, None]
+    gx = np.linspace(0, 40, width, dtype=np.float32)[None, :]
+    bg = (gy + gx).clip(0, 255).astype(np.uint8)
+    img = np.dstack([bg, bg, (bg * 0.9).astype(np.uint8)])
+    color = [int(c) for c in rng.integers(20, 235, size=3)]
+    x1, y1 = int(width * 0.12), int(height * 0.35)
+    x2, y2 = int(width * 0.88), int(height * 0.82)
+    cv2.rectangle(img, (x1, y1), (x2, y2), color, -1)
+    cv2.rectangle(img, (int(width * 0.3), int(height * 0.2)), (int(width * 0.7), y1), color, -1)
+    for cx in (int(width * 0.25), int(width * 0.75)):
+        cv2.circle(img, (cx, y2), max(4, height // 10), (25, 25, 25), -1)
+    for _ in range(12):
+        px, py = int(rng.integers(x1, x2)), int(rng.integers(y1, y2))
+        length = int(rng.integers(width // 40 + 5, width // 8 + 10))
+        cv2.line(img, (px, py), (min(x2, px + length), py + int(rng.integers(-3, 4))), (235, 235, 235), 1)
+    noise = rng.normal(0, 6, img.shape).astype(np.int16)
+    return (img.astype(np.int16) + noise).clip(0, 255).astype(np.uint8)
+
+def synthetic_jpeg(width: int, height: int, seed: int = 0, quality: int = 90) -> bytes:
+    rgb = synthetic_rgb(width, height, seed)
+    ok, buf = cv2.imencode(".jpg", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise RuntimeError("jpeg encode failed")
+    return buf.tobytes()
+
+# ---------------- Entorno ----------------
+def use_mongomock():
+    """Debe llamarse antes de importar app.database."""
+    import mongomock
+    import pymongo
+    from mongomock.collection import BulkOperationBuilder
+    pymongo.MongoClient = mongomock.MongoClient
+    # pymongo>=4.11 pasa 'sort' (y otros kwargs nuevos) a add_update/add_replace en bulk_write
+    for name in ("add_update", "add_replace", "add_delete"):
+        orig = getattr(BulkOperationBuilder, name)
+        def compat(self, *a, _orig=orig, **k):
+            k.pop("sort", None)
+            return _orig(self, *a, **k)
+        setattr(BulkOperationBuilder, name, compat)
+
+class _StubBox:
+    # Imita un elemento de ultralytics Results.boxes
+    def __init__(self, xyxy, cls_id: int, conf: float):
+        self.xyxy = np.array([xyxy], dtype=np.float32)
+        self.cls = np.array([cls_id])
+        self.conf = np.array([conf], dtype=np.float32)
+
+class _StubResult:
+    def __init__(self, names: Dict[int, str], boxes: List[_StubBox]):
+        self.names = names
+        self.boxes = boxes
+
+class StubYOLO:
+    """
+    Sustituto determinista de YOLO cuando no hay pesos: genera n cajas
+    dependientes del tamaño de la imagen y opcionalmente simula latencia.
+    """
+    def __init__(self, labels: List[str], n_boxes: int, latency_ms: float = 0.0):
+        self.names = {i: l for i, l in enumerate(labels)}
+        self.n_boxes = n_boxes
+        self.latency_s = latency_ms / 1000.0
+
+    def predict(self, pil_img, conf: float = 0.25, verbose: bool = False):
+        w, h = pil_img.size
+        rng = random.Random(w * 7919 + h)
+        boxes = []
+        for i in range(self.n_boxes):
+            bw = rng.randint(max(2, w // 20), max(3, w // 4))
+            bh = rng.randint(max(2, h // 20), max(3, h // 4))
+            x1 = rng.randint(0, max(0, w - bw))
+            y1 = rng.randint(0, max(0, h - bh))
+            boxes.append(_StubBox([x1, y1, x1 + bw, y1 + bh], i % len(self.names), rng.uniform(conf, 1.0)))
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return [_StubResult(self.names, boxes)]
+
+def install_stub_models(latency_ms: float = 0.0, damage_boxes: int = 6, parts_boxes: int = 5, force: bool = False):
+    """
+    Reemplaza los modelos ausentes (o todos con force) por StubYOLO.
+    Devuelve qué modelos quedaron stubbeados.
+    """
+    from app import yolo_model
+    from app.services.label_provider import get_label_sets
+    labels = get_label_sets()
+    real = yolo_model.load_models()
+    damage = real.damage
+    parts = real.parts
+    stubbed = []
+    if damage is None or force:
+        damage = StubYOLO(labels["damage_labels"], damage_boxes, latency_ms)
+        stubbed.append("damage")
+    if parts is None or force:
+        parts = StubYOLO(labels["part_labels"], parts_boxes, latency_ms)
+        stubbed.append("parts")
+    bundle = yolo_model.ModelBundle(damage, parts)
+    yolo_model.load_models = lambda: bundle
+    return stubbed
+
+# ---------------- Estadística ----------------
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+def summarize(latencies_s: List[float], errors: int = 0, wall_s: float | None = None) -> Dict[str, Any]:
+    ms = [v * 1000 for v in latencies_s]
+    out = {
+        "count": len(ms),
+        "errors": errors,
+        "mean_ms": round(sum(ms) / len(ms), 2) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(max(ms), 2) if ms else 0.0
+    }
+    if wall_s:
+        out["throughput_rps"] = round(len(ms) / wall_s, 3)
+    return out
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    if sys.platform == "darwin":
+        return round(rss / (1024 * 1024), 1)
+    return round(rss / 1024, 1)
+
+def stage_snapshot() -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """(stage, outcome) -> (sum_s, count) leído del histograma en proceso."""
+    from app.telemetry import STAGE_LAT
+    snap: Dict[Tuple[str, str], List[float]] = {}
+    for fam in STAGE_LAT.collect():
+        for smp in fam.samples:
+            key = (smp.labels.get("stage"), smp.labels.get("outcome"))
+            if smp.name.endswith("_sum"):
+                snap.setdefault(key, [0.0, 0.0])[0] = smp.value
+            elif smp.name.endswith("_count"):
+                snap.setdefault(key, [0.0, 0.0])[1] = smp.value
+    return {k: (v[0], v[1]) for k, v in snap.items()}
+
+def stage_delta(before, after) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for key, (s1, c1) in after.items():
+        s0, c0 = before.get(key, (0.0, 0.0))
+        cnt = c1 - c0
+        if cnt <= 0:
+            continue
+        name = key[0] if key[1] == "ok" else f"{key[0]}:{key[1]}"
+        out[name] = {"count": int(cnt), "mean_ms": round((s1 - s0) / cnt * 1000, 3)}
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["mean_ms"]))
+
+# ---------------- Resultados ----------------
+def git_sha() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def run_meta(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_sha": git_sha(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config
+    }
+
+def write_results(payload: Dict[str, Any], prefix: str, out: str | None = None) -> Path:
+    if out:
+        path = Path(out)
+    else:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"{prefix}_{time.strftime('%Y%m%dT%H%M%S')}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
+
+def load_results(path: str) -> Dict[str, Any]:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+def compare_metrics(
+    current: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    metric: str,
+    threshold: float,
+    higher_is_better: bool = False
+) -> Tuple[List[List[Any]], bool]:
+    """
+    Compara current[key][metric] contra baseline. Devuelve filas de tabla y si
+    alguna clave empeoró más que threshold (fracción, p.ej. 0.15 = 15%).
+    """
+    rows = []
+    regressed = False
+    for key, cur in current.items():
+        base = baseline.get(key)
+        if not base or metric not in base or metric not in cur:
+            rows.append([key, "-", cur.get(metric, "-"), "-", "new"])
+            continue
+        b, c = float(base[metric]), float(cur[metric])
+        delta = (c - b) / b if b else 0.0
+        worse = -delta if higher_is_better else delta
+        status = "ok"
+        if worse > threshold:
+            status = "REGRESSION"
+            regressed = True
+        elif worse < -threshold:
+            status = "improved"
+        rows.append([key, round(b, 3), round(c, 3), f"{delta * 100:+.1f}%", status])
+    return rows, regressed
+
+def format_table(header: List[str], rows: List[List[Any]]) -> str:
+    cells = [header] + [[str(c) for c in r] for r in rows]
+    widths = [max(len(r[i]) for r in cells) for i in range(len(header))]
+    line = lambda r: "  ".join(c.ljust(widths[i]) for i, c in enumerate(r))
+    sep = "  ".join("-" * w for w in widths)
+    return "\n".join([line(cells[0]), sep] + [line(r) for r in cells[1:]])
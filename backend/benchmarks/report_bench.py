@@ -0,0 +1,134 @@
+"""
+Benchmark del render de reportes con cientos de detecciones.
+
+Mide el modelo único (report_model): armado, render a markdown y a
+flowables del PDF, por separado y juntos.
+
+Uso (desde backend/):
+    python -m benchmarks.report_bench --detections 100,300,1000
+    python -m benchmarks.report_bench --save-baseline
+
+Sin imágenes: mide solo armado y layout del reporte, no miniaturas.
+"""
+import argparse, random, sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.common import (
+    RESULTS_DIR, summarize, percentile, run_meta, write_results, load_results, compare_metrics, format_table
+)
+from benchmarks.stage_bench import time_call
+
+DEFAULT_BASELINE = RESULTS_DIR / "report_baseline.json"
+
+def synthetic_inspection(n_detections: int, seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    labels = ["scratch", "dent", "crack", "broken_glass"]
+    parts = ["bumper", "hood", "door_fl", "door_fr", "mirror_l", "mirror_r", "headlight_l", "headlight_r"]
+    return {
+        "inspection_id": f"bench-{n_detections}",
+        "session_id": f"s-{n_detections}",
+        "status": "REVIEW",
+        "vehicle": {"plate": "ABC123", "brand": "Mazda", "model": "3", "year": 2019, "color": "rojo", "owner": "N/D"},
+        "vehicle_history": {"infractions": 2, "previous_owners": 1, "tech_ok": True, "notes": ["Sin novedades"]},
+        "identity_payload": {"matched_driver": {"name": "Conductor", "document": "123"}},
+        "identity_validated": True,
+        "images": [
+            {"analysis": {"preproc_metrics": {"lap_var": rng.uniform(50, 500), "edge_density": rng.random()},
+                          "quality_status": "ok", "scratch": {"count": rng.randint(0, 5)}}}
+            for _ in range(12)
+        ],
+        "damage_detections": [
+            {"label": rng.choice(labels), "confidence": rng.random(),
+             "box": [rng.randint(0, 900), rng.randint(0, 700), rng.randint(900, 1600), rng.randint(700, 1200)]}
+            for _ in range(n_detections)
+        ],
+        "parts_presence": {p: {"present": rng.random() > 0.1, "confidence": rng.random()} for p in parts},
+        "missing_parts": ["mirror_l"],
+        "verdict": {"verdict": "REVIEW", "score": 55, "conditions": ["Peritaje adicional (muchos daños)."]},
+        "fraud_flags": [],
+        "review_flags": ["MANY_DAMAGES"],
+        "notes": ["Nota de prueba"],
+        "vehicle_color_db": "rojo",
+        "color_match": True,
+    }
+
+def build_cases() -> Dict[str, Callable[[Dict[str, Any]], Callable[[], Any]]]:
+    from app.services.markdown_builder import build_markdown_report
+    from app.services.pdf_export import build_full_pdf
+    from app.services.report_model import build_report_model, render_markdown
+
+    def model_both(doc):
+        def run():
+            model = build_report_model(doc)
+            render_markdown(model)
+            build_full_pdf({**doc, "images": []})
+        return run
+
+    return {
+        "model_build": lambda doc: lambda: build_report_model(doc),
+        "markdown": lambda doc: lambda: build_markdown_report(doc),
+        "pdf_model": lambda doc: lambda: build_full_pdf({**doc, "images": []}),
+        "markdown_and_pdf_model": model_both,
+    }
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark de render de reportes")
+    ap.add_argument("--detections", default="100,300,1000", help="Detecciones de daño por inspección")
+    ap.add_argument("--cases", default=None, help="Subconjunto de casos separado por coma")
+    ap.add_argument("--min-time", type=float, default=1.0, help="Segundos mínimos por caso")
+    ap.add_argument("--max-repeat", type=int, default=30)
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--baseline", default=None, help=f"Referencia (por defecto {DEFAULT_BASELINE.name} si existe)")
+    ap.add_argument("--save-baseline", action="store_true", help="Guardar este resultado como referencia")
+    ap.add_argument("--threshold", type=float, default=0.10, help="Tolerancia de regresión sobre la mediana")
+    return ap.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    sizes = [int(x) for x in args.detections.split(",") if x.strip()]
+    cases = build_cases()
+    selected = [s.strip() for s in args.cases.split(",")] if args.cases else list(cases)
+    unknown = [s for s in selected if s not in cases]
+    if unknown:
+        print(f"Casos desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(cases)}")
+        return 2
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for n in sizes:
+        doc = synthetic_inspection(n)
+        for name in selected:
+            samples = time_call(cases[name](doc), args.min_time, args.max_repeat)
+            s = summarize(samples)
+            ms: List[float] = [v * 1000 for v in samples]
+            key = f"{name}@{n}"
+            results[key] = {
+                "case": name,
+                "detections": n,
+                "runs": s["count"],
+                "min_ms": round(min(ms), 3),
+                "median_ms": round(percentile(ms, 50), 3),
+                "mean_ms": s["mean_ms"],
+                "p95_ms": s["p95_ms"]
+            }
+            print(f"{name:<24} n={n:>5}  median={results[key]['median_ms']:>10.3f}ms  runs={s['count']}")
+
+    payload = {"meta": run_meta(vars(args)), "cases": results}
+    path = write_results(payload, "report", args.out)
+    print(f"\n-> {path}")
+
+    baseline_path = Path(args.baseline) if args.baseline else DEFAULT_BASELINE
+    regressed = False
+    if baseline_path.exists() and not args.save_baseline:
+        base = load_results(str(baseline_path)).get("cases", {})
+        rows, regressed = compare_metrics(results, base, "median_ms", args.threshold)
+        print(f"\nmedian vs {baseline_path.name}")
+        print(format_table(["case", "base_ms", "current_ms", "delta", "status"], rows))
+    if args.save_baseline:
+        write_results(payload, "report", str(baseline_path))
+        print(f"Baseline guardado en {baseline_path}")
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Micro-benchmarks de etapas CV aisladas a 1, 5 y 12 MP.
+
+Uso (desde backend/):
+    python -m benchmarks.stage_bench --save-baseline
+    python -m benchmarks.stage_bench --stages detect_scratches,dominant_color --mp 5,12
+
+Compara automáticamente contra benchmarks/results/stages_baseline.json si
+existe (o --baseline) usando la mediana; sale con código 1 ante regresiones.
+"""
+import argparse, random, sys, time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import cv2
+
+from benchmarks.common import (
+    RESULTS_DIR, megapixels_to_size, synthetic_rgb, summarize, percentile,
+    run_meta, write_results, load_results, compare_metrics, format_table
+)
+
+DEFAULT_BASELINE = RESULTS_DIR / "stages_baseline.json"
+
+def _encode(rgb) -> bytes:
+    _, buf = cv2.imencode(".jpg", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+    return buf.tobytes()
+
+def _detections(n: int, w: int, h: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        bw, bh = rng.randint(10, max(11, w // 6)), rng.randint(10, max(11, h // 6))
+        x1, y1 = rng.randint(0, w - bw), rng.randint(0, h - bh)
+        out.append({"label": "scratch", "confidence": rng.random(), "box": [x1, y1, x1 + bw, y1 + bh]})
+    return out
+
+def _geo_points(n: int, seed: int = 0) -> List[Tuple[float, float]]:
+    rng = random.Random(seed)
+    return [(4.65 + rng.uniform(-0.01, 0.01), -74.05 + rng.uniform(-0.01, 0.01)) for _ in range(n)]
+
+def _rules_context(seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    return {
+        "damage": {"count": rng.randint(0, 20)},
+        "parts": {"missing_count": rng.randint(0, 3)},
+        "geo": {"browser_distance": rng.uniform(0, 800), "hard_mismatch": rng.random() < 0.1},
+        "color": {"mismatch": rng.random() < 0.2},
+        "quality": {"ok": rng.random() < 0.8},
+        "session": {"images": rng.randint(1, 12)}
+    }
+
+def build_cases() -> Dict[str, Callable[[float], Tuple[str, Callable[[], Any]]]]:
+    """
+    Cada etapa recibe los MP y devuelve (etiqueta_tamaño, callable sin args).
+    Las etapas no basadas en imagen escalan su entrada con los MP.
+    """
+    from app.quality import assess_extended, detect_scratches
+    from app.services.image_preprocess import enhance_for_damage, nms_merge
+    from app.services.segmentation import vehicle_mask
+    from app.services.color_exif import dominant_color
+    from app.services.illumination import illumination_summary
+    from app.services.background_classifier import classify_background
+    from app.services.tamper import analyze_tamper
+    from app.services.rules_engine import evaluate_rules, evaluate_rules_batch
+    from app.utils.exif_geo import geo_stats
+
+    images: Dict[float, Dict[str, Any]] = {}
+
+    def img(mp: float) -> Dict[str, Any]:
+        if mp not in images:
+            w, h = megapixels_to_size(mp)
+            rgb = synthetic_rgb(w, h, seed=int(mp * 10))
+            images[mp] = {
+                "rgb": rgb,
+                "bgr": cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR),
+                "gray": cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY),
+                "jpeg": _encode(rgb),
+                "size": (w, h)
+            }
+        return images[mp]
+
+    label = lambda mp: f"{mp:g}MP"
+
+    def nms_case(mp):
+        w, h = img(mp)["size"]
+        dets = _detections(int(40 * mp), w, h)
+        return f"n={len(dets)}", lambda: nms_merge(dets, [], 0.55)
+
+    def geo_case(mp):
+        pts = _geo_points(int(10 * mp))
+        return f"n={len(pts)}", lambda: geo_stats(pts)
+
+    def rules_case(mp):
+        ctxs = [_rules_context(i) for i in range(int(100 * mp))]
+        return f"ctx={len(ctxs)}", lambda: [evaluate_rules(c) for c in ctxs]
+
+    def rules_batch_case(mp):
+        ctxs = [_rules_context(i) for i in range(int(100 * mp))]
+        return f"ctx={len(ctxs)}", lambda: evaluate_rules_batch(ctxs)
+
+    return {
+        "assess_extended": lambda mp: (label(mp), lambda: assess_extended(img(mp)["jpeg"])),
+        "detect_scratches": lambda mp: (label(mp), lambda: detect_scratches(img(mp)["bgr"])),
+        "enhance_for_damage": lambda mp: (label(mp), lambda: enhance_for_damage(img(mp)["rgb"])),
+        "nms_merge": nms_case,
+        "vehicle_mask": lambda mp: (label(mp), lambda: vehicle_mask(img(mp)["rgb"])),
+        "dominant_color": lambda mp: (label(mp), lambda: dominant_color(img(mp)["jpeg"])),
+        "illumination_summary": lambda mp: (label(mp), lambda: illumination_summary(img(mp)["gray"])),
+        "classify_background": lambda mp: (label(mp), lambda: classify_background(img(mp)["rgb"])),
+        "analyze_tamper": lambda mp: (label(mp), lambda: analyze_tamper(img(mp)["jpeg"])),
+        "geo_stats": geo_case,
+        "evaluate_rules": rules_case,
+        "evaluate_rules_batch": rules_batch_case
+    }
+
+def time_call(fn: Callable[[], Any], min_time: float, max_repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    t_end = time.perf_counter() + min_time
+    while len(samples) < max_repeat and (len(samples) < 3 or time.perf_counter() < t_end):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Micro-benchmarks de etapas CV")
+    ap.add_argument("--mp", default="1,5,12", help="Megapíxeles a evaluar")
+    ap.add_argument("--stages", default=None, help="Subconjunto de etapas separado por coma")
+    ap.add_argument("--min-time", type=float, default=1.0, help="Segundos mínimos por caso")
+    ap.add_argument("--max-repeat", type=int, default=50)
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--baseline", default=None, help=f"Referencia (por defecto {DEFAULT_BASELINE.name} si existe)")
+    ap.add_argument("--save-baseline", action="store_true", help="Guardar este resultado como referencia")
+    ap.add_argument("--threshold", type=float, default=0.10, help="Tolerancia de regresión sobre la mediana")
+    return ap.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    mps = [float(x) for x in args.mp.split(",") if x.strip()]
+    cases = build_cases()
+    selected = [s.strip() for s in args.stages.split(",")] if args.stages else list(cases)
+    unknown = [s for s in selected if s not in cases]
+    if unknown:
+        print(f"Etapas desconocidas: {', '.join(unknown)}. Disponibles: {', '.join(cases)}")
+        return 2
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name in selected:
+        for mp in mps:
+            size_label, fn = cases[name](mp)
+            samples = time_call(fn, args.min_time, args.max_repeat)
+            s = summarize(samples)
+            ms = [v * 1000 for v in samples]
+            results[f"{name}@{mp:g}MP"] = {
+                "stage": name,
+                "mp": mp,
+                "input": size_label,
+                "runs": s["count"],
+                "min_ms": round(min(ms), 3),
+                "median_ms": round(percentile(ms, 50), 3),
+                "mean_ms": s["mean_ms"],
+                "p95_ms": s["p95_ms"]
+            }
+            r = results[f"{name}@{mp:g}MP"]
+            print(f"{name:<22} {mp:>5g}MP {size_label:>10}  median={r['median_ms']:>10.3f}ms  runs={r['runs']}")
+
+    payload = {"meta": run_meta(vars(args)), "cases": results}
+    path = write_results(payload, "stages", args.out)
+    print(f"\n-> {path}")
+
+    baseline_path = Path(args.baseline) if args.baseline else DEFAULT_BASELINE
+    regressed = False
+    if baseline_path.exists() and not args.save_baseline:
+        base = load_results(str(baseline_path)).get("cases", {})
+        rows, regressed = compare_metrics(results, base, "median_ms", args.threshold)
+        print(f"\nmedian vs {baseline_path.name}")
+        print(format_table(["case", "base_ms", "current_ms", "delta", "status"], rows))
+    if args.save_baseline:
+        write_results(payload, "stages", str(baseline_path))
+        print(f"Baseline guardado en {baseline_path}")
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Backtest de reglas: compara el conjunto vigente (o --old) contra --new sobre
+las inspecciones históricas y reporta deltas por regla.
+
+    python scripts/backtest_rules.py --new nuevas_reglas.yaml --workers 4
+    python scripts/backtest_rules.py --new nuevas.yaml --old anteriores.yaml --plate ABC123 --since 2024-01-01 --out report.json
+"""
+import argparse, json, sys
+from datetime import datetime
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.services.rule_backtest import run_backtest, build_match
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Backtest de fraud_rules.yaml sobre inspecciones históricas")
+    ap.add_argument("--new", required=True, help="YAML con el conjunto candidato")
+    ap.add_argument("--old", default=None, help="YAML de referencia (por defecto app/fraud_rules.yaml)")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--batch-size", type=int, default=2000)
+    ap.add_argument("--limit", type=int, default=None)
+    ap.add_argument("--plate", action="append", default=None, help="Repetible")
+    ap.add_argument("--since", type=datetime.fromisoformat, default=None)
+    ap.add_argument("--until", type=datetime.fromisoformat, default=None)
+    ap.add_argument("--status", default=None)
+    ap.add_argument("--out", default=None, help="Guardar el reporte JSON")
+    return ap.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    new_yaml = Path(args.new).read_text(encoding="utf-8")
+    old_yaml = Path(args.old).read_text(encoding="utf-8") if args.old else None
+    report = run_backtest(
+        new_yaml, old_yaml, workers=args.workers, batch_size=args.batch_size, limit=args.limit,
+        match=build_match(args.plate, args.since, args.until, args.status)
+    )
+    print(f"{report['inspections']} inspecciones en {report['elapsed_s']}s ({report['inspections_per_s']}/s)")
+    print(f"{'rule':<28}{'old':>8}{'new':>8}{'delta':>8}{'added':>8}{'removed':>9}")
+    for rid, c in report["rules"].items():
+        print(f"{rid:<28}{c['old']:>8}{c['new']:>8}{c['delta']:>+8}{c['added']:>8}{c['removed']:>9}")
+    print("outcomes:", json.dumps(report["outcomes"]))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""
+Crea los índices y verifica con explain() que las consultas calientes los usan.
+Sale con código 1 si alguna hace COLLSCAN u ordena en memoria (apto para CI).
+
+    python scripts/check_indexes.py
+"""
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.db_indexes import ensure_indexes, verify_index_usage
+
+def main() -> int:
+    ensure_indexes()
+    results = verify_index_usage(raise_on_failure=False)
+    for r in results:
+        status = "ok" if r["ok"] else ("FAIL" if r["ok"] is False else "skip")
+        print(f"{status:<5} {r['query']:<32} {','.join(r['stages']) or r['reason']}")
+    return 1 if any(r["ok"] is False for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""
+Reconstruye el índice global de pHash/dHash (colección image_hashes) desde
+las inspecciones y las sesiones abiertas. Idempotente: se puede correr sobre
+un índice vivo.
+
+    python scripts/rebuild_image_index.py
+    python scripts/rebuild_image_index.py --since 2024-01-01 --batch-size 1000
+"""
+import argparse, sys
+from datetime import datetime
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from app.db_indexes import ensure_indexes
+from app.services.image_index import rebuild
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Reconstrucción del índice global de hashes de imágenes")
+    ap.add_argument("--batch-size", type=int, default=500)
+    ap.add_argument("--since", type=datetime.fromisoformat, default=None)
+    args = ap.parse_args(argv)
+    ensure_indexes()
+    stats = rebuild(batch_size=args.batch_size, since=args.since)
+    print(f"{stats['images']} imágenes de {stats['inspections']} inspecciones y {stats['sessions']} sesiones "
+          f"en {stats['elapsed_s']}s ({stats['computed']} hashes calculados desde bytes, {stats['skipped']} omitidas, "
+          f"{stats['without_hashes']} inspecciones sin hashes)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
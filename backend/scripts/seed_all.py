@@ -1,22 +1,49 @@
-import sys
+"""
+Seed de vehículos y conductores.
+
+    python scripts/seed_all.py                       # 120 + 120 si las colecciones están vacías
+    python scripts/seed_all.py --vehicles 2000000 --drivers 500000 --workers 4 --seed 42
+
+Genera por bloques (--chunk-size) con insert_many no ordenado; con --workers
+reparte entre procesos (seed + i por worker) y reporta registros/seg.
+"""
+import argparse, sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 from app.database import vehicles_col, drivers_col
-from app.services.vehicle_service import seed_vehicles
-from app.services.driver_service import seed_drivers
+from app.services.seeding import seed_stream
 
 DEFAULT_VEHICLES = 120
 DEFAULT_DRIVERS = 120
+SEED_OFFSETS = {"vehicles": 0, "drivers": 10_000}
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Seed de datos simulados")
+    ap.add_argument("--vehicles", type=int, default=None, help="Vehículos a insertar (siempre, aunque haya datos)")
+    ap.add_argument("--drivers", type=int, default=None, help="Conductores a insertar (siempre, aunque haya datos)")
+    ap.add_argument("--workers", type=int, default=1, help="Procesos generadores")
+    ap.add_argument("--chunk-size", type=int, default=5000, help="Registros por insert_many")
+    ap.add_argument("--seed", type=int, default=None, help="Seed base reproducible")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    args = _parse_args(argv)
+    plan = []
+    if args.vehicles is None and args.drivers is None:
+        if vehicles_col.estimated_document_count() == 0:
+            plan.append(("vehicles", DEFAULT_VEHICLES))
+        if drivers_col.estimated_document_count() == 0:
+            plan.append(("drivers", DEFAULT_DRIVERS))
+    else:
+        plan = [(k, n) for k, n in (("vehicles", args.vehicles), ("drivers", args.drivers)) if n]
 
-def main():
-    v_count = vehicles_col.estimated_document_count()
-    d_count = drivers_col.estimated_document_count()
-    if v_count == 0:
-        seed_vehicles(DEFAULT_VEHICLES)
-    if d_count == 0:
-        seed_drivers(DEFAULT_DRIVERS)
+    for kind, count in plan:
+        seed = None if args.seed is None else args.seed + SEED_OFFSETS[kind]
+        r = seed_stream(kind, count, args.chunk_size, args.workers, seed)
+        print(f"{kind}: {r['inserted']}/{r['requested']} en {r['elapsed_s']}s "
+              f"({r['records_per_s']} reg/s, workers={r['workers']}, duplicados={r['duplicates']})")
     print(f"Seed complete. vehicles={vehicles_col.estimated_document_count()} drivers={drivers_col.estimated_document_count()}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
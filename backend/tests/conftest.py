@@ -0,0 +1,33 @@
+"""
+Tests del backend. Por defecto corren sobre mongomock; con TEST_MONGO_URI
+apuntando a un mongod real se habilitan los marcados @pytest.mark.mongodb
+(explain() real, base MONGO_DB o vehicular_tfm_test).
+
+    python -m pytest tests
+    TEST_MONGO_URI=mongodb://localhost:27017 python -m pytest tests
+"""
+import os, sys
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+REAL_MONGO_URI = os.environ.get("TEST_MONGO_URI")
+if REAL_MONGO_URI:
+    # Antes de importar app.database: el cliente se crea al importar
+    os.environ["MONGO_URI"] = REAL_MONGO_URI
+    os.environ.setdefault("MONGO_DB", "vehicular_tfm_test")
+else:
+    from benchmarks.common import use_mongomock
+    use_mongomock()
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "mongodb: requiere un mongod real (TEST_MONGO_URI)")
+
+def pytest_collection_modifyitems(config, items):
+    if REAL_MONGO_URI:
+        return
+    skip = pytest.mark.skip(reason="requiere TEST_MONGO_URI (mongod real)")
+    for item in items:
+        if "mongodb" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,41 @@
+import uuid
+from datetime import datetime, timedelta
+from app.repositories import session_repo
+from app.services.damage_timeline import inspection_counts, update_timeline
+
+def _det(part, label="dent"):
+    return {"label": label, "part": part, "confidence": 0.8, "box": [0, 0, 10, 10]}
+
+def _photo(photo_key, damage):
+    return {"analysis_id": uuid.uuid4().hex, "photo_key": photo_key, "damage": damage, "parts_presence": {}}
+
+def _agg(*photos):
+    sid = uuid.uuid4().hex
+    session_repo.ensure_session(sid)
+    for photo in photos:
+        session_repo.merge_image_aggregates(sid, photo)
+    return session_repo.get_session_summary(sid)["agg"]
+
+def test_same_damage_in_several_photos_counts_once():
+    # El mismo golpe de la puerta visto desde tres ángulos; dos rayones en una sola foto
+    agg = _agg(
+        _photo("front_left", [_det("door.front_left"), _det("bumper", "scratch"), _det("bumper", "scratch")]),
+        _photo("left", [_det("door.front_left")]),
+        _photo("rear_left", [_det("door.front_left"), _det("bumper", "scratch")]),
+    )
+    assert agg["damage_total"] == 6
+    assert inspection_counts(agg) == {("door.front_left", "dent"): 1, ("bumper", "scratch"): 2}
+
+def test_timeline_does_not_report_retakes_as_new_damage():
+    plate = f"T{uuid.uuid4().hex[:6]}".upper()
+    t0 = datetime(2026, 1, 1)
+    first = _agg(_photo("left", [_det("door")]))
+    second = _agg(_photo("left", [_det("door")]), _photo("front_left", [_det("door")]), _photo("rear", []))
+    update_timeline(plate, "insp-1", inspection_counts(first), t0)
+    changes = update_timeline(plate, "insp-2", inspection_counts(second), t0 + timedelta(days=30))
+    assert changes["previous_inspection_id"] == "insp-1"
+    assert changes["new"] == [] and changes["missing"] == []
+
+def test_legacy_agg_without_damage_max():
+    assert inspection_counts({"damage": [_det("door"), _det("door")]}) == {("door", "dent"): 2}
+    assert inspection_counts({}) == {}
@@ -0,0 +1,64 @@
+import pytest
+from app import db_indexes
+from app.config import settings
+from app.database import client
+from app.db_indexes import IndexCheckError, ensure_indexes, hot_queries, verify_index_usage
+
+class _FakeCursor:
+    def __init__(self, plan):
+        self._plan = plan
+
+    def sort(self, *a, **k):
+        return self
+
+    def explain(self):
+        return {"queryPlanner": {"winningPlan": self._plan}}
+
+class _FakeCollection:
+    """Colección cuyo explain() devuelve un plan fijo."""
+    def __init__(self, plan):
+        self._plan = plan
+
+    def find(self, *a, **k):
+        return _FakeCursor(self._plan)
+
+IXSCAN = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "plate_unique"}}
+COLLSCAN = {"stage": "COLLSCAN"}
+SORT_IN_MEMORY = {"stage": "SORT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}
+
+def _queries(**plans):
+    return lambda: [{"name": name, "col": _FakeCollection(plan), "filter": {}, "sort": [("created_at", -1)]}
+                    for name, plan in plans.items()]
+
+def test_collscan_and_memory_sort_fail(monkeypatch):
+    monkeypatch.setattr(db_indexes, "hot_queries", _queries(ok=IXSCAN, scan=COLLSCAN, sort=SORT_IN_MEMORY))
+    with pytest.raises(IndexCheckError) as exc:
+        verify_index_usage()
+    reasons = {f["query"]: f["reason"] for f in exc.value.failures}
+    assert reasons == {"scan": "COLLSCAN", "sort": "SORT_IN_MEMORY"}
+
+def test_index_plans_pass(monkeypatch):
+    monkeypatch.setattr(db_indexes, "hot_queries", _queries(a=IXSCAN, b={"stage": "IDHACK"}))
+    results = verify_index_usage()
+    assert [r["ok"] for r in results] == [True, True]
+
+def test_backend_without_explain_is_not_a_failure():
+    # mongomock no implementa explain(): se reporta 'unsupported', no COLLSCAN
+    ensure_indexes()
+    results = verify_index_usage(raise_on_failure=False)
+    assert [r["query"] for r in results] == [q["name"] for q in hot_queries()]
+    assert not [r for r in results if r["ok"] is False]
+
+@pytest.fixture
+def real_db():
+    ensure_indexes()
+    yield
+    if settings.MONGO_DB.endswith("_test"):
+        client.drop_database(settings.MONGO_DB)
+
+@pytest.mark.mongodb
+def test_hot_queries_use_indexes(real_db):
+    results = verify_index_usage(raise_on_failure=False)
+    failures = [r for r in results if not r["ok"]]
+    assert not failures, failures
+    assert all("COLLSCAN" not in r["stages"] for r in results)
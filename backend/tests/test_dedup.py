@@ -0,0 +1,132 @@
+import asyncio, uuid
+from app.config import settings
+from app.repositories import session_repo
+from app.services.dedup import SessionHashIndex, nearest
+
+def _analysis(analysis_id, damage, quality_status="ok", duplicate_of=None):
+    return {
+        "analysis_id": analysis_id,
+        "photo_key": "front",
+        "quality_status": quality_status,
+        "phash": "00ff00ff00ff00ff",
+        "dhash": "0f0f0f0f0f0f0f0f",
+        "damage": damage,
+        "parts_presence": {"door": {"present": bool(damage), "confidence": 0.9 if damage else 0.3}},
+        "color_detected": {"name": "gris"},
+        "duplicate_of": duplicate_of,
+    }
+
+def _session():
+    sid = uuid.uuid4().hex
+    session_repo.ensure_session(sid)
+    return sid
+
+def _agg(sid):
+    return session_repo.get_session_summary(sid)["agg"]
+
+def test_sharp_retake_is_aggregated():
+    # Re-toma nítida de una foto very_blur: casi duplicada pero el pipeline corrió de nuevo
+    sid = _session()
+    session_repo.merge_image_aggregates(sid, _analysis("blur", [], "very_blur"))
+    dent = [{"label": "dent", "confidence": 0.8, "box": [0, 0, 10, 10]}]
+    dup = {"analysis_id": "blur", "photo_key": "front", "distance": 2, "reused": False}
+    session_repo.merge_image_aggregates(sid, _analysis("sharp", dent, duplicate_of=dup))
+    agg = _agg(sid)
+    assert agg["image_count"] == 2
+    assert agg["duplicate_images"] == 1
+    assert agg["damage_total"] == 1 and agg["damage_by_label"] == {"dent": 1}
+    assert agg["parts"]["door"]["present"] is True
+    assert agg["colors"] == {"gris": 2}
+    assert [h["analysis_id"] for h in agg["hashes"]] == ["blur", "sharp"]
+
+def test_reused_duplicate_only_counts():
+    sid = _session()
+    dent = [{"label": "dent", "confidence": 0.8, "box": [0, 0, 10, 10]}]
+    session_repo.merge_image_aggregates(sid, _analysis("a", dent))
+    dup = {"analysis_id": "a", "photo_key": "front", "distance": 1, "reused": True}
+    session_repo.merge_image_aggregates(sid, _analysis("b", dent, duplicate_of=dup))
+    agg = _agg(sid)
+    assert agg["image_count"] == 2 and agg["duplicate_images"] == 1
+    assert agg["damage_total"] == 1 and agg["colors"] == {"gris": 1}
+    assert len(agg["hashes"]) == 1
+
+# ---------------- SessionHashIndex ----------------
+PHASH, DHASH = "00ff00ff00ff00ff", "0f0f0f0f0f0f0f0f"
+
+def _flip(h, bits):
+    """Hash a 'bits' bits de distancia (Hamming)."""
+    return f"{int(h, 16) ^ ((1 << bits) - 1):016x}"
+
+def _store(sid, analysis_id, phash=PHASH, quality_status="ok"):
+    analysis = {**_analysis(analysis_id, [], quality_status), "phash": phash}
+    session_repo.store_image_analysis(sid, "ABC123", analysis, b"raw")
+    return analysis
+
+def test_nearest_uses_both_thresholds():
+    entries = [{"analysis_id": "far", "phash": _flip(PHASH, 5), "dhash": DHASH},
+               {"analysis_id": "near", "phash": _flip(PHASH, 2), "dhash": DHASH},
+               {"analysis_id": "dhash_off", "phash": PHASH, "dhash": _flip(DHASH, settings.DEDUP_DHASH_MAX_DIST + 1)}]
+    assert nearest(entries, PHASH, DHASH)["analysis_id"] == "near"
+    assert nearest(entries, PHASH, DHASH)["distance"] == 2
+    assert nearest(entries, _flip(PHASH, 20), DHASH) is None
+
+def test_cold_index_loads_from_mongo_and_reuses():
+    # Otro worker analizó la imagen: el índice se arma desde agg.hashes y el análisis se lee de images
+    sid = _session()
+    _store(sid, "a")
+    idx = SessionHashIndex()
+
+    async def run():
+        match = await idx.find(sid, _flip(PHASH, 1), DHASH)
+        assert match["analysis_id"] == "a" and match["distance"] == 1
+        prev = await idx.reusable(sid, match, "front", "ok")
+        assert prev["color_detected"] == {"name": "gris"}
+        # Otra foto u otra calidad: se corre el pipeline
+        assert await idx.reusable(sid, match, "rear", "ok") is None
+        assert await idx.reusable(sid, match, "front", "blur") is None
+
+    asyncio.run(run())
+
+def test_miss_rereads_hashes_from_other_workers():
+    sid = _session()
+    idx = SessionHashIndex()
+
+    async def run():
+        assert await idx.find(sid, PHASH, DHASH) is None  # sesión cargada (vacía)
+        _store(sid, "other-worker")
+        match = await idx.find(sid, PHASH, DHASH)
+        assert match["analysis_id"] == "other-worker"
+        # add() de la misma imagen no la duplica y deja el pipeline en memoria
+        idx.add(sid, _analysis("other-worker", []))
+        assert [e["analysis_id"] for e in idx._sessions[sid]] == ["other-worker"]
+        assert (await idx.find(sid, PHASH, DHASH))["pipeline"]["damage"] == []
+
+    asyncio.run(run())
+
+def test_index_is_lru_bounded(monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_INDEX_MAX_SESSIONS", 2)
+    idx = SessionHashIndex()
+    sids = [_session() for _ in range(3)]
+
+    async def run():
+        for sid in sids:
+            await idx.find(sid, PHASH, DHASH)
+        await idx.find(sids[1], PHASH, DHASH)
+
+    asyncio.run(run())
+    assert list(idx._sessions) == [sids[2], sids[1]]
+
+def test_policy_off_and_flag(monkeypatch):
+    sid = _session()
+    _store(sid, "a")
+    idx = SessionHashIndex()
+
+    async def run():
+        monkeypatch.setattr(settings, "DEDUP_POLICY", "off")
+        assert await idx.find(sid, PHASH, DHASH) is None
+        monkeypatch.setattr(settings, "DEDUP_POLICY", "flag")
+        match = await idx.find(sid, PHASH, DHASH)
+        assert match["analysis_id"] == "a"
+        assert await idx.reusable(sid, match, "front", "ok") is None
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import threading, time
+import pytest
+from app.services import pdf_cache
+from app.services.pdf_cache import DiskPdfCache, get_or_render, parse_range
+
+@pytest.mark.parametrize("header,expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-200", (800, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=0-1,5-9", None),   # multi-rango: se sirve completo
+    ("items=0-10", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=50-10", "bytes=-0", "bytes=a-b", "bytes=-"])
+def test_parse_range_unsatisfiable(header):
+    # El endpoint responde 416 con Content-Range: bytes */size
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    cache = DiskPdfCache(str(tmp_path), max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(pdf_cache, "_cache", cache)
+    monkeypatch.setattr(pdf_cache, "_locks", pdf_cache._KeyLocks())
+    return cache
+
+def test_concurrent_downloads_render_once(disk_cache):
+    calls = []
+
+    def render(doc, out):
+        calls.append(doc["inspection_id"])
+        time.sleep(0.05)
+        out.write(b"%PDF-1.4 test")
+
+    doc = {"inspection_id": "insp-1", "plate": "ABC123"}
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_or_render(doc, render))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["insp-1"]
+    assert {r.size for r in results} == {13}
+    assert b"".join(results[0].iter_range(5, 7)) == b"1.4"
+    assert len(pdf_cache._locks) == 0
+
+def test_failed_render_releases_lock(disk_cache):
+    def broken(doc, out):
+        raise RuntimeError("render")
+
+    doc = {"inspection_id": "insp-2"}
+    with pytest.raises(RuntimeError):
+        get_or_render(doc, broken)
+    assert len(pdf_cache._locks) == 0
+    pdf = get_or_render(doc, lambda d, out: out.write(b"ok"))
+    assert pdf.size == 2
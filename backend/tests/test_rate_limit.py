@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from fastapi import Depends, FastAPI, Form, Request
+from fastapi.testclient import TestClient
+from app import rate_limit
+from app.config import settings
+from app.rate_limit import MemoryBucketStore, RateLimiter, parse_rate
+
+def _run(coro):
+    return asyncio.run(coro)
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT", "6/minute")
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP", "12/minute")
+    monkeypatch.setattr(settings, "RATE_LIMIT_COSTS", "analyze=3,default=1")
+    monkeypatch.setattr(settings, "RATE_LIMIT_TENANTS", "tenantA=60/minute")
+    monkeypatch.setattr(settings, "RATE_LIMIT_KEYS", "api_key,session,plate,ip")
+    return RateLimiter(store=MemoryBucketStore())
+
+@pytest.fixture
+def client(limiter):
+    app = FastAPI()
+
+    async def dep(request: Request):
+        await limiter.hit(request, "analyze")
+
+    @app.post("/analyze", dependencies=[Depends(dep)])
+    async def analyze(session_id: str = Form(...), plate: str = Form("ABC123")):
+        return {"ok": True}
+
+    return TestClient(app)
+
+def _post(client, session_id, headers=None):
+    return client.post("/analyze", data={"session_id": session_id}, headers=headers or {})
+
+def test_parse_rate():
+    assert parse_rate("90/minute") == (90.0, 1.5)
+    assert parse_rate(" 10 / seconds ") == (10.0, 10.0)
+    with pytest.raises(ValueError):
+        parse_rate("90 per minute")
+
+def test_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    store = MemoryBucketStore()
+    assert [_run(store.take("k", 3, 6, 0.1))[0] for _ in range(3)] == [True, True, False]
+    allowed, tokens, retry = _run(store.take("k", 3, 6, 0.1))
+    assert not allowed and retry == pytest.approx(30.0)
+    now[0] += 30
+    assert _run(store.take("k", 3, 6, 0.1))[0]
+
+def test_take_many_is_all_or_nothing():
+    store = MemoryBucketStore()
+    assert _run(store.take("small", 6, 6, 0.1))[0]
+    allowed, tokens, retry, denied = _run(store.take_many([("big", 3, 100, 1.0), ("small", 3, 6, 0.1)]))
+    assert not allowed and denied == 1
+    # El balde que sí alcanzaba no se debitó
+    assert _run(store.take_many([("big", 100, 100, 1.0)]))[0]
+
+def test_session_bucket(client):
+    assert [_post(client, "s1").status_code for _ in range(3)] == [200, 200, 429]
+    r = _post(client, "s1")
+    assert r.headers["x-ratelimit-limit"] == "6" and r.headers["x-ratelimit-cost"] == "3"
+    assert int(r.headers["retry-after"]) >= 1
+
+def test_rotated_session_ids_hit_ip_ceiling(client):
+    # 12 tokens por IP / costo 3: rotar session_id no da más de 4 requests
+    codes = [_post(client, f"rot-{i}").status_code for i in range(6)]
+    assert codes == [200, 200, 200, 200, 429, 429]
+    r = _post(client, "rot-new")
+    assert r.status_code == 429 and r.headers["x-ratelimit-limit"] == "12"
+
+def test_many_sessions_behind_one_ip(client, limiter, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_IP", "600/minute")
+    limiter.reload()
+    # 20 clientes detrás del mismo NAT, 2 análisis cada uno: ninguno se queda sin cuota
+    codes = [_post(client, f"nat-{i}").status_code for i in range(20) for _ in range(2)]
+    assert set(codes) == {200}
+    # Los rechazos del balde de sesión no consumen el de IP (600 - 40 * 3 = 480 restantes)
+    assert [_post(client, "nat-0").status_code for _ in range(5)] == [429] * 5
+    allowed, tokens, _, _ = _run(limiter.store.take_many([("ip_guard:testclient", 0, 600, 10.0)]))
+    assert allowed and tokens[0] == pytest.approx(480, abs=1)
+
+def test_unknown_api_key_is_ignored(client):
+    assert [_post(client, "s2", {"X-API-Key": f"k{i}"}).status_code for i in range(3)] == [200, 200, 429]
+
+def test_tenant_key_has_own_quota(client):
+    assert {_post(client, "s3", {"X-API-Key": "tenantA"}).status_code for _ in range(10)} == {200}
@@ -0,0 +1,52 @@
+import random
+import numpy as np
+import pytest
+from app.services.rules_engine import batch_flags, compile_rules, evaluate_rules, evaluate_rules_batch, load_rules
+
+RULES = compile_rules({
+    "fraud": [
+        {"id": "OR_MISSING", "when": "geo.distance > 100 or image.reused_plates >= 1"},
+        {"id": "AND_MISSING", "when": "quality.score < 0.3 and image.reused_plates >= 1"},
+        {"id": "NOT", "when": "not damage.total > 0"},
+        {"id": "CHAIN", "when": "0 < geo.distance <= 500"},
+        {"id": "NESTED", "when": "(geo.distance > 100 and quality.score < 0.5) or damage.total >= 3"},
+    ],
+    "review": [
+        {"id": "RATIO", "when": "damage.total / image.count > 0.5"},
+        {"id": "CONST", "when": "1 > 0 or geo.distance > 0"},
+    ],
+})
+
+def _ctx(rng):
+    ctx = {}
+    for group, key, gen in (
+        ("geo", "distance", lambda: rng.choice([0, 50, 150, 800])),
+        ("image", "reused_plates", lambda: rng.choice([0, 1, 2])),
+        ("image", "count", lambda: rng.choice([0, 1, 4])),
+        ("quality", "score", lambda: rng.choice([0.1, 0.4, 0.9])),
+        ("damage", "total", lambda: rng.choice([0, 1, 5])),
+    ):
+        if rng.random() < 0.6:
+            ctx.setdefault(group, {})[key] = gen()
+    return ctx
+
+def test_or_short_circuits_over_missing_field():
+    masks = evaluate_rules_batch([{"geo": {"distance": 150}}, {"geo": {"distance": 10}}], RULES)
+    # Primer operando verdadero: no hace falta image.* (como en evaluate_rules)
+    assert masks["OR_MISSING"].tolist() == [True, False]
+    assert masks["CONST"].tolist() == [True, True]
+
+def test_batch_matches_scalar_with_missing_keys():
+    rng = random.Random(7)
+    ctxs = [_ctx(rng) for _ in range(300)]
+    for rules in (RULES, load_rules()):
+        masks = evaluate_rules_batch(ctxs, rules)
+        assert all(m.dtype == np.bool_ and m.shape == (len(ctxs),) for m in masks.values())
+        assert batch_flags(masks, rules) == [evaluate_rules(c, rules) for c in ctxs]
+
+@pytest.mark.parametrize("ctx", [{}, {"damage": {"total": 2}}, {"damage": {"total": 2}, "image": {"count": 0}}])
+def test_errors_do_not_fire(ctx):
+    # Campo ausente o división por cero: la regla no dispara en ningún modo
+    masks = evaluate_rules_batch([ctx], RULES)
+    assert masks["RATIO"].tolist() == [False]
+    assert "RATIO" not in evaluate_rules(ctx, RULES)[1]
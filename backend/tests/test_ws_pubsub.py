@@ -0,0 +1,69 @@
+import asyncio
+from pymongo.errors import AutoReconnect
+from app import ws_pubsub
+from app.ws_pubsub import MongoChangeStreamBackend
+
+class _FakeStream:
+    """Change stream que entrega sus eventos y luego se corta (o queda vacío)."""
+    def __init__(self, changes, fail_after):
+        self._changes, self._fail_after = list(changes), fail_after
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if self._changes:
+            change = self._changes.pop(0)
+            self.resume_token = {"_data": change["_id"]}
+            return change
+        if self._fail_after:
+            raise AutoReconnect("primary stepped down")
+        return None
+
+class _FakeCollection:
+    name = "ws_events_test"
+
+    def __init__(self, rounds):
+        self._rounds = list(rounds)
+        self.resume_calls = []
+
+    def watch(self, pipeline, max_await_time_ms=None, resume_after=None):
+        self.resume_calls.append(resume_after)
+        if not self._rounds:
+            return _FakeStream([], fail_after=False)
+        item = self._rounds.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return _FakeStream(item, fail_after=True)
+
+def _change(n, session_id="s1"):
+    return {"_id": f"tok{n}", "fullDocument": {"session_id": session_id, "payload": {"n": n}}}
+
+def test_change_stream_resumes_after_errors(monkeypatch):
+    monkeypatch.setattr(ws_pubsub, "CHANGE_STREAM_RETRY_S", (0.01, 0.02))
+    col = _FakeCollection([[_change(1)], AutoReconnect("no primary"), [_change(2), _change(3, "otra")]])
+    backend = MongoChangeStreamBackend("ws_events_test")
+    backend._col = col
+    received = []
+
+    async def handler(session_id, payload):
+        received.append(payload["n"])
+
+    async def scenario():
+        await backend.subscribe("s1")
+        await backend.start(handler)
+        for _ in range(200):
+            if len(col.resume_calls) >= 4:
+                break
+            await asyncio.sleep(0.01)
+        await backend.stop()
+
+    asyncio.run(scenario())
+    assert received == [1, 2]
+    # Cada reapertura retoma desde el último token visto
+    assert col.resume_calls[:4] == [None, {"_data": "tok1"}, {"_data": "tok1"}, {"_data": "tok3"}]
+    assert backend._thread is None
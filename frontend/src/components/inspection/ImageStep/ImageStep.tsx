@@ -1,11 +1,12 @@
-import React, { useRef, useState, useCallback } from 'react'
+import React, { useRef, useState, useCallback, useEffect } from 'react'
 import Button from '@/components/common/Button/Button'
 import CoachChat from '@/components/common/CoachChat/CoachChat'
 import { PhotoKey } from '@/types/inspection'
 import { useInspectionStore } from '@/hooks/useInspectionStore'
+import { useInspectionWS } from '@/hooks/useInspectionWS'
 import { motion } from 'framer-motion'
 import { useDropzone } from 'react-dropzone'
-import { analyzeImage } from '@/services/inspectionService'
+import { analyzeImage, cancelAnalysis, newAnalysisId } from '@/services/inspectionService'
 import { optimizeImage } from '@/utils/imageOptimize'
 
 
@@ -24,9 +25,24 @@ export default function ImageStep({
   const preview = state.previews[photoKey]
   const plate = state.userInfo?.plate || ''
   const analysis = state.analyses[photoKey]
+  const { cancelAnalysis: cancelViaWS } = useInspectionWS(state.sessionId)
+  const analysisRef = useRef<string | null>(null)
+  const partial = state.partials?.[photoKey]
+  const partialQuality = partial?.steps.quality?.quality_status as string | undefined
+
+  // Veredicto de calidad antes que el resto: very_blur cancela el análisis en el servidor
+  useEffect(() => {
+    const id = analysisRef.current
+    if (!id || partial?.analysisId !== id || partialQuality !== 'very_blur' || override) return
+    analysisRef.current = null
+    setQualityStatus('very_blur')
+    if (!cancelViaWS(id, 'very_blur')) cancelAnalysis(state.sessionId, id, 'very_blur').catch(() => {})
+  }, [partial?.analysisId, partialQuality, override])
 
   const runBackendAnalyze = async (file: File, coords: { lat?: number; lon?: number }) => {
     if (!plate) { setError('Placa no definida.'); return }
+    const analysisId = newAnalysisId()
+    analysisRef.current = analysisId
     try {
       const resp = await analyzeImage({
         file,
@@ -35,7 +51,8 @@ export default function ImageStep({
         lat: coords.lat,
         lon: coords.lon,
         debug: DEBUG_IMAGES,
-        photoKey
+        photoKey,
+        analysisId
       })
       storeAnalysis(photoKey, resp)
       if (resp.aborted) {
@@ -50,7 +67,11 @@ export default function ImageStep({
       }
       onNext()
     } catch (e: any) {
+      // 409: cancelado (very_blur); el aviso de calidad ya está visible
+      if (e?.status === 409) return
       setError(e.message || 'Error backend')
+    } finally {
+      if (analysisRef.current === analysisId) analysisRef.current = null
     }
   }
 
@@ -169,7 +190,14 @@ export default function ImageStep({
             Scratch candidatos: {analysis.scratch.count}
           </div>
         )}
-        {isProcessing && <div className="text-sm text-primary">Analizando...</div>}
+        {isProcessing && (
+          <div className="text-sm text-primary">
+            Analizando...{partial && !partial.cancelled ? ` ${Math.round(partial.progress * 100)}%` : ''}
+            {partial?.steps.damage && (
+              <span className="ml-2 text-xs text-gray-600">Daños: {(partial.steps.damage.damage || []).length}</span>
+            )}
+          </div>
+        )}
         {error && <div className="text-red-600 text-sm">{error}</div>}
         {geoError && <div className="text-yellow-600 text-xs">{geoError}</div>}
         {geoData && <div className="text-green-700 text-xs">Geo: {geoData.lat.toFixed(5)}, {geoData.lon.toFixed(5)}</div>}
@@ -1,5 +1,5 @@
 import { inspectionReducer, defaultState } from '@/hooks/useInspectionStore'
-import type { AnalyzeImageResponse } from '@/types/inspection'
+import type { AnalyzeImageResponse, AnalyzeProgressEvent } from '@/types/inspection'
 
 const baseAnalysis: AnalyzeImageResponse = {
   session_id: 's1',
@@ -36,6 +36,19 @@ describe('inspectionReducer', () => {
     expect(st.currentStep).toBe('results')
   })
 
+  it('STORE_PARTIAL acumula etapas y STORE_ANALYSIS las limpia', () => {
+    const ev = (step: AnalyzeProgressEvent['step'], progress: number, data: any): AnalyzeProgressEvent => ({
+      event: 'analyze:progress', session_id: 's1', analysis_id: 'a1', photo_key: 'front',
+      step, progress, elapsed_ms: 1, data
+    })
+    let st = inspectionReducer(defaultState, { type: 'STORE_PARTIAL', event: ev('quality', 0.17, { quality_status: 'ok' }) })
+    st = inspectionReducer(st, { type: 'STORE_PARTIAL', event: ev('damage', 0.33, { damage: [] }) })
+    expect(st.partials?.front?.progress).toBe(0.33)
+    expect(st.partials?.front?.steps.quality?.quality_status).toBe('ok')
+    st = inspectionReducer(st, { type: 'STORE_ANALYSIS', key: 'front', analysis: baseAnalysis })
+    expect(st.partials?.front).toBeUndefined()
+  })
+
   it('RESET genera nuevo sessionId', () => {
     const st = inspectionReducer(defaultState, { type: 'RESET' })
     expect(st.sessionId).not.toBe(defaultState.sessionId)
@@ -1,5 +1,5 @@
 import React, { createContext, useContext, useMemo, useReducer } from 'react'
-import { InspectionState, PhotoKey, AnalyzeImageResponse, FinalizeResponse, QualityThresholds } from '@/types/inspection'
+import { InspectionState, PhotoKey, AnalyzeImageResponse, AnalyzeProgressEvent, FinalizeResponse, QualityThresholds } from '@/types/inspection'
 
 export type Action =
   | { type: 'SET_PHOTO'; key: PhotoKey; file: File | null; geo?: { lat: number; lon: number } }
@@ -7,6 +7,8 @@ export type Action =
   | { type: 'SET_USER'; info: { name: string; idNumber: string; plate: string } }
   | { type: 'ADD_NOTE'; note: string }
   | { type: 'STORE_ANALYSIS'; key: PhotoKey; analysis: AnalyzeImageResponse }
+  | { type: 'STORE_PARTIAL'; event: AnalyzeProgressEvent }
+  | { type: 'CANCEL_PARTIAL'; key: PhotoKey; analysisId: string }
   | { type: 'ABORT'; reason: string }
   | { type: 'STORE_FINAL'; result: FinalizeResponse }
   | { type: 'SET_THRESHOLDS'; data: QualityThresholds }
@@ -23,6 +25,7 @@ export const defaultState: InspectionState = {
   photos: {},
   previews: {},
   analyses: {},
+  partials: {},
   notes: [],
   aborted: false,
   error: null,
@@ -57,8 +60,24 @@ export function inspectionReducer(state: InspectionState, action: Action): Inspe
       return { ...state, userInfo: action.info }
     case 'ADD_NOTE':
       return { ...state, notes: [...state.notes, action.note] }
-    case 'STORE_ANALYSIS':
-      return { ...state, analyses: { ...state.analyses, [action.key]: action.analysis } }
+    case 'STORE_ANALYSIS': {
+      const partials = { ...(state.partials || {}) }
+      delete partials[action.key]
+      return { ...state, analyses: { ...state.analyses, [action.key]: action.analysis }, partials }
+    }
+    case 'STORE_PARTIAL': {
+      const ev = action.event
+      const prev = state.partials?.[ev.photo_key]
+      // Un análisis nuevo de la misma foto reemplaza al anterior
+      const base = prev && prev.analysisId === ev.analysis_id ? prev : { analysisId: ev.analysis_id, progress: 0, steps: {} }
+      const next = { ...base, progress: ev.progress, steps: { ...base.steps, [ev.step]: ev.data } }
+      return { ...state, partials: { ...(state.partials || {}), [ev.photo_key]: next } }
+    }
+    case 'CANCEL_PARTIAL': {
+      const prev = state.partials?.[action.key]
+      if (!prev || prev.analysisId !== action.analysisId) return state
+      return { ...state, partials: { ...(state.partials || {}), [action.key]: { ...prev, cancelled: true } } }
+    }
     case 'ABORT':
       return { ...state, aborted: true, abortReason: action.reason, currentStep: 'RESULTS' }
     case 'STORE_FINAL':
@@ -87,6 +106,8 @@ type Ctx = {
   setUserInfo: (info: { name: string; idNumber: string; plate: string }) => void
   addNote: (t: string) => void
   storeAnalysis: (k: PhotoKey, a: AnalyzeImageResponse) => void
+  storePartial: (e: AnalyzeProgressEvent) => void
+  cancelPartial: (k: PhotoKey, analysisId: string) => void
   setAbort: (reason: string) => void
   storeFinalize: (r: FinalizeResponse) => void
   setQuality: (q: QualityThresholds) => void
@@ -106,6 +127,8 @@ export function InspectionProvider({ children }: { children: React.ReactNode })
     setUserInfo: (info) => dispatch({ type: 'SET_USER', info }),
     addNote: (t) => dispatch({ type: 'ADD_NOTE', note: t }),
     storeAnalysis: (k, a) => dispatch({ type: 'STORE_ANALYSIS', key: k, analysis: a }),
+    storePartial: (e) => dispatch({ type: 'STORE_PARTIAL', event: e }),
+    cancelPartial: (k, id) => dispatch({ type: 'CANCEL_PARTIAL', key: k, analysisId: id }),
     setAbort: (r) => dispatch({ type: 'ABORT', reason: r }),
     storeFinalize: (r) => dispatch({ type: 'STORE_FINAL', result: r }),
     setQuality: (q) => dispatch({ type: 'SET_THRESHOLDS', data: q }),
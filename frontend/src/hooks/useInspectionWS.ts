@@ -1,9 +1,12 @@
-import { useEffect, useRef } from 'react'
+import { useCallback, useEffect, useRef } from 'react'
 import { useInspectionStore } from './useInspectionStore'
 
 export function useInspectionWS(sessionId: string | null) {
-  const { setAbort } = useInspectionStore()
+  const { setAbort, storePartial, cancelPartial } = useInspectionStore()
   const ref = useRef<WebSocket | null>(null)
+  // Los callbacks del store cambian en cada render: se leen por ref para no reconectar
+  const handlers = useRef({ setAbort, storePartial, cancelPartial })
+  handlers.current = { setAbort, storePartial, cancelPartial }
 
   useEffect(() => {
     if (!sessionId) return
@@ -15,12 +18,28 @@ export function useInspectionWS(sessionId: string | null) {
     ws.onmessage = ev => {
       try {
         const data = JSON.parse(ev.data)
+        const { setAbort, storePartial, cancelPartial } = handlers.current
         if (data.event === 'session:aborted') {
           setAbort(data.reason || 'ABORT')
+        } else if (data.event === 'analyze:progress') {
+          // Resultados parciales por etapa (quality, damage, parts, color, ocr, tamper)
+          storePartial(data)
+        } else if (data.event === 'analyze:cancelled') {
+          cancelPartial(data.photo_key, data.analysis_id)
         }
       } catch { /* ignore */ }
     }
     ws.onclose = () => { ref.current = null }
     return () => { ws.close() }
-  }, [sessionId, setAbort])
-}
\ No newline at end of file
+  }, [sessionId])
+
+  // Pide al backend detener el análisis en curso (todos los de la sesión sin analysisId)
+  const cancelAnalysis = useCallback((analysisId?: string, reason = 'client') => {
+    const ws = ref.current
+    if (!ws || ws.readyState !== WebSocket.OPEN) return false
+    ws.send(JSON.stringify({ action: 'cancel', analysis_id: analysisId, reason }))
+    return true
+  }, [])
+
+  return { cancelAnalysis }
+}
@@ -16,12 +16,20 @@ async function fetchWithControl(
     try {
       const res = await fetch(url, { ...opts, signal: ctrl.signal })
       clearTimeout(timer)
-      if (!res.ok) throw new Error(`HTTP ${res.status}`)
+      if (!res.ok) {
+        throw Object.assign(new Error(`HTTP ${res.status}`), {
+          status: res.status,
+          retryAfter: Number(res.headers.get('Retry-After')) || 0
+        })
+      }
       return res
-    } catch (e) {
+    } catch (e: any) {
       clearTimeout(timer)
-      if (attempt === retries) throw e
-      await new Promise(r => setTimeout(r, 600 * (attempt + 1)))
+      // 429 con espera corta: se reintenta tras Retry-After
+      const throttled = e?.status === 429 && e.retryAfter > 0 && e.retryAfter <= 5
+      // Otros 4xx (p.ej. 409 análisis cancelado) no se reintentan
+      if (attempt === retries || (e?.status >= 400 && e?.status < 500 && !throttled)) throw e
+      await new Promise(r => setTimeout(r, throttled ? e.retryAfter * 1000 : 600 * (attempt + 1)))
     }
   }
   throw new Error('unreachable')
@@ -108,12 +116,34 @@ export async function verifyIdentity(payload: IdentityVerifyRequest): Promise<Id
   return res.json()
 }
 
+export interface DamageTimelineItem {
+  part: string
+  label: string
+  count: number
+  previous?: number
+  first_seen?: string
+}
+
 export interface VehicleHistoryResponse {
   plate: string
   infractions: number
   previous_owners: number
   tech_ok: boolean
   notes: string[]
+  damage_timeline?: {
+    last_inspection_id: string
+    last_at: string
+    current: DamageTimelineItem[]
+    new_since_last: DamageTimelineItem[]
+    missing_since_last: DamageTimelineItem[]
+    entries: {
+      inspection_id: string
+      at: string
+      damage: DamageTimelineItem[]
+      new: DamageTimelineItem[]
+      missing: DamageTimelineItem[]
+    }[]
+  } | null
 }
 export async function getVehicleHistory(plate: string): Promise<VehicleHistoryResponse> {
   const r = await fetchWithControl(buildUrl(`/vehicle/history?plate=${encodeURIComponent(plate)}`), {}, 8000, 0)
@@ -131,6 +161,7 @@ export async function analyzeImage(params: {
   confParts?: number
   debug?: boolean
   photoKey?: string
+  analysisId?: string
 }): Promise<AnalyzeImageResponse> {
   const form = new FormData()
   form.append('file', params.file)
@@ -143,10 +174,23 @@ export async function analyzeImage(params: {
   if (params.confDamage != null) form.append('conf_damage', String(params.confDamage))
   if (params.confParts != null) form.append('conf_parts', String(params.confParts))
   if (params.debug) form.append('debug', '1')
+  if (params.analysisId) form.append('analysis_id', params.analysisId)
   const res = await fetchWithControl(buildUrl('/inspection/analyze'), { method: 'POST', body: form }, 30000, 1)
   return res.json()
 }
 
+export const newAnalysisId = () =>
+  (crypto?.randomUUID ? crypto.randomUUID() : 'an_' + Math.random().toString(36).slice(2))
+
+// Alternativa HTTP al mensaje de cancelación por WebSocket
+export async function cancelAnalysis(sessionId: string, analysisId?: string, reason = 'client') {
+  const form = new FormData()
+  form.append('session_id', sessionId)
+  if (analysisId) form.append('analysis_id', analysisId)
+  form.append('reason', reason)
+  await fetchWithControl(buildUrl('/inspection/cancel'), { method: 'POST', body: form }, 6000, 0)
+}
+
 export async function finalizeInspection(
   sessionId: string,
   plate: string,
@@ -158,11 +202,49 @@ export async function finalizeInspection(
   form.append('plate', plate)
   if (confDamage != null) form.append('conf_damage', String(confDamage))
   if (confParts != null) form.append('conf_parts', String(confParts))
-  const res = await fetchWithControl(buildUrl('/inspection/finalize'), { method: 'POST', body: form }, 35000, 1)
-  return res.json()
+  const res = await fetchWithControl(buildUrl('/inspection/finalize'), { method: 'POST', body: form }, 15000, 1)
+  const job: InspectionJob = await res.json()
+  return waitForJob(job.poll_url)
+}
+
+export interface InspectionJob {
+  job_id: string
+  kind: string
+  session_id: string
+  status: 'queued' | 'running' | 'done' | 'failed'
+  step?: string | null
+  progress: number
+  error?: string | null
+  poll_url: string
+  result?: FinalizeResponse
+}
+
+export async function getJob(jobId: string): Promise<InspectionJob> {
+  const r = await fetchWithControl(buildUrl(`/inspection/jobs/${jobId}`), {}, 8000, 1)
+  return r.json()
+}
+
+// Finalize y el pre-render del reporte son asíncronos (202 + job): se consulta hasta done/failed.
+async function waitForJob<T = FinalizeResponse>(pollUrl: string, timeoutMs = 60000, intervalMs = 700, label = 'finalize'): Promise<T> {
+  const deadline = Date.now() + timeoutMs
+  while (Date.now() < deadline) {
+    const r = await fetchWithControl(buildUrl(pollUrl), {}, 8000, 1)
+    const job: InspectionJob = await r.json()
+    if (job.status === 'done' && job.result) return job.result as T
+    if (job.status === 'failed') throw new Error(job.error || `${label} falló`)
+    await new Promise(res => setTimeout(res, intervalMs))
+  }
+  throw new Error(`Timeout esperando ${label}`)
 }
 
 export async function getReportPdf(inspectionId: string): Promise<Blob> {
-  const res = await fetchWithControl(buildUrl(`/inspection/report/${inspectionId}/pdf`))
+  const url = buildUrl(`/inspection/report/${inspectionId}`)
+  let res = await fetchWithControl(url, {}, 30000, 1)
+  if (res.status === 202) {
+    // PDF aún en pre-render: se espera el job y se descarga del caché
+    const job: InspectionJob = await res.json()
+    await waitForJob(job.poll_url, 60000, 700, 'reporte')
+    res = await fetchWithControl(url, {}, 30000, 1)
+  }
   return res.blob()
 }
\ No newline at end of file
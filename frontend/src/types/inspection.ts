@@ -2,6 +2,7 @@ export interface DamageBox {
   label: string
   confidence: number
   box: [number, number, number, number]
+  part?: string
 }
 
 export interface PartPresence {
@@ -21,6 +22,7 @@ export interface ScratchInfo {
 
 export interface AnalyzeImageResponse {
   session_id: string
+  analysis_id?: string
   damage: DamageBox[]
   parts_presence: Record<string, PartPresence>
   missing_parts: string[]
@@ -45,6 +47,49 @@ export interface AnalyzeImageResponse {
     overlay_b64?: string
     processed_b64?: string
   }
+  profile?: PipelineProfile | null
+  phash?: string | null
+  dhash?: string | null
+  duplicate_of?: {
+    analysis_id: string
+    photo_key: string
+    distance: number
+    reused: boolean
+  } | null
+  image_reuse?: {
+    sessions: number
+    other_plates: number
+    min_distance: number
+  } | null
+  admission?: {
+    decision: 'admit' | 'downgrade'
+    skipped: string[]
+    megapixels: number
+    cost_ms: number
+    predicted_wait_ms: number
+  } | null
+}
+
+export type PipelineProfile = 'full' | 'balanced' | 'fast'
+
+export type AnalyzeStep = 'quality' | 'damage' | 'parts' | 'color' | 'ocr' | 'tamper'
+
+export interface AnalyzeProgressEvent {
+  event: 'analyze:progress'
+  session_id: string
+  analysis_id: string
+  photo_key: PhotoKey
+  step: AnalyzeStep
+  progress: number
+  elapsed_ms: number
+  data: Record<string, any>
+}
+
+export interface AnalyzePartial {
+  analysisId: string
+  progress: number
+  steps: Partial<Record<AnalyzeStep, Record<string, any>>>
+  cancelled?: boolean
 }
 
 export interface FinalizeResponse {
@@ -70,6 +115,16 @@ export interface FinalizeResponse {
   identity_validated?: boolean
   identity_payload?: any
   vehicle_history?: any
+  analysis_fidelity?: PipelineProfile | null
+  pipeline_profiles?: Partial<Record<PipelineProfile, number>>
+  degraded_images?: number
+  duplicate_images?: number
+  damage_changes?: {
+    previous_inspection_id: string | null
+    previous_at: string | null
+    new: { part: string; label: string; count: number; previous: number }[]
+    missing: { part: string; label: string; count: number; previous: number }[]
+  } | null
 }
 
 export type PhotoKey =
@@ -94,6 +149,7 @@ export interface InspectionState {
   photos: Partial<Record<PhotoKey, File>>
   previews: Partial<Record<PhotoKey, string>>
   analyses: Partial<Record<PhotoKey, AnalyzeImageResponse>>
+  partials?: Partial<Record<PhotoKey, AnalyzePartial>>
   aborted: boolean
   abortReason?: string | null
   finalizeResult?: FinalizeResponse | null